@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+from cryptography.fernet import Fernet
+
+from background_server import BackgroundServer
+from fake_llm import ScriptedChatModel
+from fixtures import generate_database, generate_questions
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# The API package and the test doubles are imported from src/ and tests/, which must be on PYTHONPATH (see the README)
+PROJ_ROOT = Path(__file__).resolve().parents[1]
+
+
+def percentile(values: list[float], rank: float) -> float | None:
+    """Returns the `rank` percentile (0 to 100) of a list of values, interpolated between the closest ranks."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * rank / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(latencies: list[float]) -> dict[str, float | None]:
+    """Returns the mean and the p50, p95 and p99 of latencies, in milliseconds."""
+    def milliseconds(seconds: float | None) -> float | None:
+        return round(seconds * 1000, 2) if seconds is not None else None
+
+    return {
+        "mean_ms": milliseconds(sum(latencies) / len(latencies) if latencies else None),
+        "p50_ms": milliseconds(percentile(latencies, 50)),
+        "p95_ms": milliseconds(percentile(latencies, 95)),
+        "p99_ms": milliseconds(percentile(latencies, 99)),
+        "max_ms": milliseconds(max(latencies, default=None)),
+    }
+
+def peak_rss_mb() -> float | None:
+    """Returns the peak resident memory of the process (server and load generator) so far, in megabytes."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit() -> str | None:
+    """Returns the commit the benchmark runs on, so that reports can be compared."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJ_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def install_fakes(model: ScriptedChatModel, work_dir: Path):
+    """
+    Replaces the OpenAI chat models and embeddings of the server with the scripted model and a deterministic embedding stub, and moves its
+    on-disk indexes to the work directory.
+
+    Returns:
+        FastAPI: The server application.
+    """
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    import API.FSL_prompt as FSL_prompt
+    import API.llm as llm
+    import API.schema_cache as schema_cache
+    import API.server as server
+
+    embeddings = DeterministicFakeEmbedding(size=256)
+    # The small tier keeps going through get_small_llm, which honours MODEL_ROUTING
+    llm.validate_tier = lambda tier: None
+    llm.get_llm = lambda tier="large": model
+    server.setup_openai_api = lambda: model
+    server.get_embeddings = FSL_prompt.get_embeddings = lambda: embeddings
+    FSL_prompt.EXAMPLE_INDEX_DIR = work_dir / "example_index"
+    schema_cache.SCHEMA_CACHE_DIR = work_dir / "schemas"
+
+    return server.app
+
+
+async def set_up_session(client: httpx.AsyncClient, database: Path) -> tuple[float, str, list[dict]]:
+    """
+    Runs a setup job to completion.
+
+    Returns:
+        tuple[float, str, list[dict]]: The time from `/setup` to the created session, the session token and the timing of every step.
+
+    Raises:
+        RuntimeError: If the setup failed.
+    """
+    started = time.perf_counter()
+    job = (await client.post("/setup", json={"dbms": "SQLite", "file_path": str(database)})).json()
+    while job["status"] == "running":
+        await asyncio.sleep(0.005)
+        job = (await client.get(f"/setup/{job['job_id']}")).json()
+    elapsed = time.perf_counter() - started
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"Setup failed: {job['detail']}")
+
+    return elapsed, job["session_id"], job["steps"]
+
+async def measure_setup(client: httpx.AsyncClient, database: Path, runs: int) -> dict[str, Any]:
+    """Measures `/setup` latency: the first run is cold (schema snapshot, example index), the following ones reuse the shared caches."""
+    latencies, steps = [], []
+    for _ in range(runs):
+        elapsed, session_id, job_steps = await set_up_session(client, database)
+        latencies.append(elapsed)
+        steps.append({step["name"]: step["duration_ms"] for step in job_steps})
+        await client.post("/close-connection", json={"session_id": session_id})
+
+    return {
+        "runs": runs,
+        "cold_ms": round(latencies[0] * 1000, 2),
+        "warm": summarize(latencies[1:]),
+        "steps_ms": {"cold": steps[0], "warm": steps[-1]},
+    }
+
+async def measure_queries(
+    client: httpx.AsyncClient,
+    database: Path,
+    questions: list[str],
+    concurrency: int,
+    mode: str | None
+) -> dict[str, Any]:
+    """
+    Sends questions from `concurrency` clients, each with its own session, as fast as the server answers them.
+
+    Returns:
+        dict[str, Any]: The latency percentiles of the answered questions, the throughput and the failures by HTTP status.
+    """
+    session_ids = [(await set_up_session(client, database))[1] for _ in range(concurrency)]
+    pending = list(reversed(questions))
+    latencies, failures = [], {}
+
+    async def run_client(session_id: str) -> None:
+        while pending:
+            question = pending.pop()
+            started = time.perf_counter()
+            response = await client.post("/query", json={"session_id": session_id, "input": question, "mode": mode})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures[str(response.status_code)] = failures.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_client(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - started
+    for session_id in session_ids:
+        await client.post("/close-connection", json={"session_id": session_id})
+
+    return {
+        "concurrency": concurrency,
+        "questions": len(questions),
+        "answered": len(latencies),
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "throughput_qps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        **summarize(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def run_benchmark(arguments: argparse.Namespace, work_dir: Path) -> dict[str, Any]:
+    """Generates the database, starts the server with the scripted model and runs the setup and query measurements."""
+    from config import server_config
+
+    database = work_dir / "benchmark.db"
+    started = time.perf_counter()
+    layout = generate_database(database, arguments.tables, arguments.columns, arguments.rows, arguments.seed)
+    generation_seconds = time.perf_counter() - started
+
+    # Every question is asked once, so that the answer and SQL result caches never serve them
+    levels = arguments.concurrency
+    queries = generate_questions(layout, arguments.warmup + arguments.queries * len(levels))
+    questions = list(queries)
+    model = ScriptedChatModel(queries=queries, latency=arguments.llm_latency)
+    app = install_fakes(model, work_dir)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "tables": arguments.tables,
+            "columns": arguments.columns,
+            "rows": arguments.rows,
+            "queries": arguments.queries,
+            "concurrency": levels,
+            "llm_latency_s": arguments.llm_latency,
+            "mode": arguments.mode or server_config.QUERY_MODE,
+            "seed": arguments.seed,
+        },
+        "settings": {
+            name: getattr(server_config, name)
+            for name in (
+                "MAX_CONCURRENT_QUERIES",
+                "MAX_QUEUED_QUERIES",
+                "ANSWER_CACHE_ENABLED",
+                "QUERY_COALESCING",
+                "SQL_CACHE_ENABLED",
+                "MODEL_ROUTING",
+                "VALUE_INDEX_ENABLED",
+                "SCHEMA_TOP_N",
+            )
+        },
+        "database": {"size_mb": round(database.stat().st_size / (1024 * 1024), 2), "generation_s": round(generation_seconds, 3)},
+    }
+
+    with BackgroundServer(app) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=arguments.timeout) as client:
+            report["setup"] = await measure_setup(client, database, arguments.setup_runs)
+            report["peak_rss_mb_after_setup"] = peak_rss_mb()
+            if arguments.warmup:
+                await measure_queries(client, database, questions[:arguments.warmup], 1, arguments.mode)
+            report["query"] = []
+            offset = arguments.warmup
+            for concurrency in levels:
+                level_questions = questions[offset:offset + arguments.queries]
+                offset += arguments.queries
+                report["query"].append(await measure_queries(client, database, level_questions, concurrency, arguments.mode))
+            report["status"] = (await client.get("/status")).json()
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    return report
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the DOHT backend offline, with a scripted chat model and a generated SQLite database."
+    )
+    parser.add_argument("--tables", type=int, default=20, help="Tables of the generated database (schema width).")
+    parser.add_argument("--columns", type=int, default=12, help="Generated columns per table.")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows per table.")
+    parser.add_argument("--setup-runs", type=int, default=5, help="Setups to time (the first one is cold).")
+    parser.add_argument("--queries", type=int, default=50, help="Questions per concurrency level.")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 4, 16],
+                        help="Comma-separated numbers of concurrent clients, e.g. 1,4,16.")
+    parser.add_argument("--warmup", type=int, default=3, help="Questions asked before measuring.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds every model call takes, to simulate a real model.")
+    parser.add_argument("--mode", choices=["agent", "fast"], default=None, help="Query pipeline. Defaults to the server configuration.")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for a response.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated data.")
+    parser.add_argument("--work-dir", type=Path, default=None, help="Directory for the database and indexes. Defaults to a temporary one.")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"), help="JSON report file.")
+
+    return parser.parse_args()
+
+def main() -> None:
+    arguments = parse_arguments()
+    # The session store of the benchmarked server only has to live as long as the run
+    os.environ.setdefault("SESSION_STORE_KEY", Fernet.generate_key().decode("ascii"))
+    with tempfile.TemporaryDirectory(prefix="doht-benchmark-") as temporary_dir:
+        work_dir = arguments.work_dir or Path(temporary_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        report = asyncio.run(run_benchmark(arguments, work_dir))
+
+    arguments.output.write_text(json.dumps(report, indent=2, default=str))
+    print(f"Benchmark report written to {arguments.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import hashlib
+import json
+import threading
+
 from langchain_chroma import Chroma
 from langchain_core.example_selectors import SemanticSimilarityExampleSelector
 from langchain_core.prompts import (
@@ -7,11 +11,74 @@ from langchain_core.prompts import (
     PromptTemplate,
     SystemMessagePromptTemplate,
 )
-from langchain_openai import OpenAIEmbeddings
+from loguru import logger
 
-from config.server_config import DATA_DIR
+from config.server_config import DATA_DIR, EXAMPLE_INDEX_DIR
 from API.data_loader import load_message_from_file, load_json_from_file
+from API.llm import get_embeddings
+
+
+example_selector = None
+example_selector_lock = threading.Lock()
+
+def hash_example(example: dict[str, str]) -> str:
+    """Computes a content hash of an example, used as its id in the vector store."""
+    return hashlib.sha256(json.dumps(example, sort_keys=True).encode("utf-8")).hexdigest()
+
+def build_example_index() -> Chroma:
+    """
+    Synchronizes the persistent example index with `examples.json`.
+
+    The index lives on disk under `EXAMPLE_INDEX_DIR` and every example is stored under the hash of its content. Only examples that are new
+    or have changed since the last run are sent to the embeddings API; examples that were removed from the file are deleted from the index.
+
+    Returns:
+        Chroma: The up-to-date vector store of examples.
+    """
+    embeddings = get_embeddings()
+    vectorstore = Chroma(
+        # One collection per embedding model, since vectors of different models are not comparable
+        collection_name=f"examples-{getattr(embeddings, 'model', 'default')}",
+        embedding_function=embeddings,
+        persist_directory=str(EXAMPLE_INDEX_DIR),
+    )
 
+    examples = {hash_example(example): example for example in load_json_from_file(f"{DATA_DIR}/examples.json")}
+    indexed_ids = set(vectorstore.get(include=[])["ids"])
+
+    new_ids = [example_id for example_id in examples if example_id not in indexed_ids]
+    stale_ids = [example_id for example_id in indexed_ids if example_id not in examples]
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+    if new_ids:
+        vectorstore.add_texts(
+            # Same text representation as SemanticSimilarityExampleSelector.from_examples
+            texts=[examples[example_id]["input"] for example_id in new_ids],
+            metadatas=[examples[example_id] for example_id in new_ids],
+            ids=new_ids,
+        )
+    logger.info(f"Example index ready: {len(new_ids)} embedded, {len(stale_ids)} removed, {len(examples) - len(new_ids)} reused.")
+
+    return vectorstore
+
+def get_example_selector() -> SemanticSimilarityExampleSelector:
+    """
+    Returns the process-wide example selector, building the example index on first use.
+
+    Returns:
+        SemanticSimilarityExampleSelector: Selector returning the 3 examples closest to a question.
+    """
+    global example_selector
+
+    with example_selector_lock:
+        if example_selector is None:
+            example_selector = SemanticSimilarityExampleSelector(
+                vectorstore=build_example_index(),
+                k=3,
+                input_keys=["input"],
+            )
+
+    return example_selector
 
 def create_fs_prompt() -> FewShotPromptTemplate:
     """
@@ -22,24 +89,17 @@ def create_fs_prompt() -> FewShotPromptTemplate:
     handle highly complex questions and fully understand the nature of our database.
      
     Semantic similarity search is a search algorithm used to match user question with examples based on meaning rather than exact words. In order to
-    utilize this algorithm, vector database is also used in this application (ChromaDB in our case).
+    utilize this algorithm, vector database is also used in this application (ChromaDB in our case). The example index is persisted on disk and
+    shared by every session of the process, so a setup does not re-embed the examples.
 
     Returns:
         FewShotPromptTemplate: A dynamic prompt template using selected examples.
     """
-    examples = load_json_from_file(f"{DATA_DIR}/examples.json")
-    example_selector = SemanticSimilarityExampleSelector.from_examples(
-        examples,
-        OpenAIEmbeddings(),
-        Chroma,
-        k=3,
-        input_keys=["input"],
-    )
     system_prefix = load_message_from_file(f"{DATA_DIR}/prefix.txt")
     example_prompt = load_message_from_file(f"{DATA_DIR}/example_prompt.txt")
 
     few_shot_prompt = FewShotPromptTemplate(
-        example_selector=example_selector,
+        example_selector=get_example_selector(),
         example_prompt=PromptTemplate.from_template(example_prompt),
         input_variables=["input", "dialect", "top_k"],
         prefix=system_prefix,
@@ -51,7 +111,8 @@ def create_fs_prompt() -> FewShotPromptTemplate:
 
 def create_final_prompt(few_shot_prompt: FewShotPromptTemplate) -> ChatPromptTemplate:
     """
-    Converts a few-shot prompt template into a chat-ready format.
+    Converts a few-shot prompt template into a chat-ready format, with an optional `history` of previous questions and answers for
+    follow-up questions.
 
     Args:
         few_shot_prompt (FewShotPromptTemplate): The base prompt to enhance.
@@ -62,6 +123,7 @@ def create_final_prompt(few_shot_prompt: FewShotPromptTemplate) -> ChatPromptTem
     full_prompt = ChatPromptTemplate.from_messages(
         [
             SystemMessagePromptTemplate(prompt=few_shot_prompt),
+            MessagesPlaceholder("history", optional=True),
             ("human", "{input}"),
             MessagesPlaceholder("agent_scratchpad"),
         ]
@@ -0,0 +1,137 @@
+import asyncio
+import contextvars
+import functools
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from loguru import logger
+
+from API.custom_exceptions import ServerBusyError
+
+
+class AdmissionController:
+    """
+    Runs blocking agent work on a dedicated worker pool, behind a bounded wait queue.
+
+    At most `max_concurrent` runs execute at the same time. Up to `max_queued` further requests wait for a free worker, for at most
+    `queue_timeout` seconds. Anything beyond that is rejected right away with a `ServerBusyError`, so the event loop stays free to serve
+    other requests (including `/setup`) no matter how many slow agent runs are in progress.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="agent-worker")
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=500)
+        self._run_times = deque(maxlen=500)
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Waits for a free worker and runs `func` on it without blocking the event loop.
+
+        Context variables of the caller are propagated to the worker thread.
+
+        Args:
+            func (Callable[..., Any]): The blocking function to run.
+            *args (Any): Positional arguments for `func`.
+            **kwargs (Any): Keyword arguments for `func`.
+
+        Returns:
+            Any: Whatever `func` returns.
+
+        Raises:
+            ServerBusyError: If the wait queue is full or no worker became free within the queue timeout.
+        """
+        queued_at = time.monotonic()
+        if not self._semaphore.locked():
+            # A worker is free: the acquisition completes without suspending
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queued:
+                self._reject("wait queue is full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject(f"no worker became free within {self.queue_timeout}s")
+            finally:
+                self.waiting -= 1
+        self._wait_times.append(time.monotonic() - queued_at)
+
+        self.admitted += 1
+        self.running += 1
+        started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        try:
+            future = self._executor.submit(functools.partial(context.run, func, *args, **kwargs))
+        except RuntimeError:
+            self._release(started_at)
+            raise
+        # A cancelled caller stops waiting, but the worker thread cannot be interrupted: the slot is only released once the thread is done,
+        # so that the limit holds and the queue metrics stay accurate
+        future.add_done_callback(lambda _: self._release_threadsafe(loop, started_at))
+
+        return await asyncio.wrap_future(future)
+
+    def retry_after(self) -> int:
+        """Estimates in how many seconds a rejected client should retry, based on recent run times."""
+        average_run = sum(self._run_times) / len(self._run_times) if self._run_times else 1.0
+        pending_rounds = (self.waiting + self.running) / self.max_concurrent
+
+        return max(1, math.ceil(average_run * pending_rounds))
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Reports the current load of the worker pool.
+
+        Returns:
+            dict[str, Any]: Queue depth, running count, admission counters and wait/run time figures (in seconds).
+        """
+        wait_times = sorted(self._wait_times)
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_time_avg": round(sum(wait_times) / len(wait_times), 4) if wait_times else 0.0,
+            "wait_time_p95": round(wait_times[int(0.95 * (len(wait_times) - 1))], 4) if wait_times else 0.0,
+            "wait_time_max": round(wait_times[-1], 4) if wait_times else 0.0,
+            "run_time_avg": round(sum(self._run_times) / len(self._run_times), 4) if self._run_times else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        """Stops accepting work and waits for the running agent calls to finish."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _release(self, started_at: float) -> None:
+        self._run_times.append(time.monotonic() - started_at)
+        self.running -= 1
+        self._semaphore.release()
+
+    def _release_threadsafe(self, loop: asyncio.AbstractEventLoop, started_at: float) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release, started_at)
+        except RuntimeError:
+            pass  # The event loop is closed: the server is shutting down
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        retry_after = self.retry_after()
+        logger.warning(f"Query rejected: {reason} ({self.running} running, {self.waiting} waiting).")
+        raise ServerBusyError(
+            "The server is busy processing other questions. Please try again in a moment.",
+            retry_after=retry_after
+        )
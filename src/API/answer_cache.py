@@ -0,0 +1,250 @@
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from loguru import logger
+
+from API.sql_utils import is_write_statement
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question so that trivial variations (case, punctuation, spacing) map to the same cache key.
+
+    Args:
+        question (str): The question asked by the user.
+
+    Returns:
+        str: The normalized question.
+    """
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+
+    return " ".join(question.split())
+
+def cosine_similarity(a: list[float], b: list[float]) -> float:
+    """Computes the cosine similarity of two embedding vectors."""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+
+    return dot / norm if norm else 0.0
+
+
+class CachedAnswer:
+    """An answer stored in the cache together with the SQL and the result it was derived from."""
+
+    def __init__(self, question: str, sql: str, result: str, answer: str, embedding: list[float] | None, generation: int) -> None:
+        self.question = question
+        self.sql = sql
+        self.result = result
+        self.answer = answer
+        self.embedding = embedding
+        self.generation = generation
+        self.created_at = time.monotonic()
+
+
+class AnswerCache:
+    """
+    Semantic cache of agent answers, partitioned by database connection.
+
+    A question first looks for an exact match of its normalized form, then for the most similar cached question (cosine similarity of
+    embeddings) above `similarity_threshold`. Entries expire after `ttl` seconds and each connection keeps at most `max_entries` answers
+    (least recently used first out).
+
+    Any write executed by the agent on a connection invalidates every answer of that connection. A per-connection generation counter
+    makes sure an answer computed while a write happened elsewhere is never stored. With a session store, the generations are shared by
+    the API workers: a write seen by one of them invalidates the answers cached by all of them.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], list[float]],
+        ttl: float,
+        similarity_threshold: float,
+        max_entries: int,
+        store: Any = None
+    ) -> None:
+        self._embed = embed
+        self._store = store
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self._entries: dict[str, OrderedDict[str, CachedAnswer]] = {}
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, connection_key: str, question: str) -> tuple[CachedAnswer | None, list[float] | None]:
+        """
+        Looks for a cached answer to the question on the given connection.
+
+        Args:
+            connection_key (str): Identifier of the database connection.
+            question (str): The question asked by the user.
+
+        Returns:
+            tuple[CachedAnswer | None, list[float] | None]: The cached answer (None on a miss) and the embedding of the question, which
+                can be handed back to `store` to avoid embedding the question twice.
+        """
+        normalized = normalize_question(question)
+        generation = self.generation(connection_key)
+        with self._lock:
+            entries = self._entries.get(connection_key)
+            if entries is None:
+                self.misses += 1
+                return None, None
+            self._drop_stale(entries, generation)
+            exact = entries.get(normalized)
+            if exact is not None:
+                entries.move_to_end(normalized)
+                self.hits += 1
+                return exact, exact.embedding
+            candidates = list(entries.items())
+
+        embedding = self._safe_embed(question) if candidates else None
+        best_key, best_entry, best_score = None, None, 0.0
+        if embedding is not None:
+            for key, entry in candidates:
+                if entry.embedding is None:
+                    continue
+                score = cosine_similarity(embedding, entry.embedding)
+                if score > best_score:
+                    best_key, best_entry, best_score = key, entry, score
+
+        with self._lock:
+            if best_entry is not None and best_score >= self.similarity_threshold and best_key in entries:
+                entries.move_to_end(best_key)
+                self.hits += 1
+                logger.info(f"Answer cache hit (similarity {best_score:.3f}) for: {question}")
+                return best_entry, embedding
+            self.misses += 1
+
+        return None, embedding
+
+    def store(
+        self,
+        connection_key: str,
+        question: str,
+        sql: str,
+        result: str,
+        answer: str,
+        generation: int,
+        embedding: list[float] | None = None
+    ) -> None:
+        """
+        Stores an answer, unless the connection has been written to since `generation` was read.
+
+        Args:
+            connection_key (str): Identifier of the database connection.
+            question (str): The question asked by the user.
+            sql (str): The SQL statement that produced the result.
+            result (str): The raw result returned by the database.
+            answer (str): The final answer of the agent.
+            generation (int): The value of `generation(connection_key)` read before the agent run started.
+            embedding (list[float] | None): The embedding of the question, if already computed.
+        """
+        if embedding is None:
+            embedding = self._safe_embed(question)
+        entry = CachedAnswer(question, sql, result, answer, embedding, generation)
+        current = self.generation(connection_key)
+        with self._lock:
+            if current != generation:
+                return
+            entries = self._entries.setdefault(connection_key, OrderedDict())
+            entries[normalize_question(question)] = entry
+            entries.move_to_end(normalize_question(question))
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def generation(self, connection_key: str) -> int:
+        """Returns the write generation of a connection (incremented on every invalidation). Blocking with a session store."""
+        if self._store is not None:
+            return self._store.generation(f"answers:{connection_key}")
+        with self._lock:
+            return self._generations.get(connection_key, 0)
+
+    def invalidate(self, connection_key: str) -> None:
+        """
+        Drops every cached answer of a connection, on every worker.
+
+        Args:
+            connection_key (str): Identifier of the database connection.
+        """
+        if self._store is not None:
+            self._store.bump_generations([f"answers:{connection_key}"])
+        with self._lock:
+            self._generations[connection_key] = self._generations.get(connection_key, 0) + 1
+            dropped = len(self._entries.pop(connection_key, {}))
+        if dropped:
+            logger.info(f"Answer cache invalidated after a write ({dropped} entries dropped).")
+
+    def stats(self) -> dict[str, Any]:
+        """Reports hit/miss counters and the number of cached answers."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": sum(len(entries) for entries in self._entries.values()),
+            }
+
+    def _drop_stale(self, entries: OrderedDict[str, CachedAnswer], generation: int) -> None:
+        # Expired, or cached before a write (possibly seen by another worker)
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if now - entry.created_at > self.ttl or entry.generation != generation]:
+            del entries[key]
+
+    def _safe_embed(self, question: str) -> list[float] | None:
+        try:
+            return self._embed(question)
+        except Exception as embed_error:
+            # The cache degrades to exact matches only
+            logger.warning(f"Failed to embed question for the answer cache. Details:\n{embed_error}")
+            return None
+
+
+class SQLRecorder(BaseCallbackHandler):
+    """
+    Callback handler that records the SQL executed by the agent during a run.
+
+    It keeps the last successful read query with its result (what the answer is derived from) and invalidates the answer cache of the
+    connection as soon as the agent executes a write.
+    """
+
+    def __init__(self, cache: AnswerCache, connection_key: str) -> None:
+        self._cache = cache
+        self._connection_key = connection_key
+        self._pending: dict[UUID, str] = {}
+        self.sql: str | None = None
+        self.result: str | None = None
+        self.wrote = False
+
+    def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        if (serialized.get("name") or kwargs.get("name")) != "sql_db_query":
+            return
+        inputs = kwargs.get("inputs") or {}
+        query = str(inputs.get("query", input_str))
+        self._pending[run_id] = query
+        if is_write_statement(query):
+            self.wrote = True
+            self._cache.invalidate(self._connection_key)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        query = self._pending.pop(run_id, None)
+        if query is None:
+            return
+        output = str(getattr(output, "content", output))
+        if is_write_statement(query):
+            # Invalidate again: answers may have been stored while the statement was running
+            self._cache.invalidate(self._connection_key)
+        elif not output.startswith("Error"):
+            self.sql, self.result = query, output
+
+    @property
+    def cacheable(self) -> bool:
+        """True if the run read data successfully and wrote nothing."""
+        return self.sql is not None and not self.wrote
@@ -0,0 +1,123 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from loguru import logger
+
+from API.run_context import RunContext
+from API.session_store import hash_token
+
+
+class CancellationHandler(BaseCallbackHandler):
+    """
+    Callback handler that stops an agent run at its next step (chain, model call or tool call) once the question was cancelled.
+
+    Errors of callback handlers are only propagated by LangChain when `raise_error` is set, which is what interrupts the run.
+    """
+
+    raise_error: bool = True
+
+    def __init__(self, context: RunContext) -> None:
+        self.context = context
+
+    def on_chain_start(self, serialized: dict[str, Any], inputs: dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self.context.raise_if_cancelled()
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self.context.raise_if_cancelled()
+
+    def on_llm_start(self, serialized: dict[str, Any], prompts: list[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.context.raise_if_cancelled()
+
+    def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.context.raise_if_cancelled()
+
+
+class RunRegistry:
+    """
+    Questions being answered, by session and query id, so that a client can cancel one of its questions and closing a session can cancel
+    all of them. Cancelling a question cancels the tasks answering it (several for a batch). Only used from the event loop.
+
+    With a session store, the questions answered by this worker are recorded in it, so that they can be cancelled through any worker:
+    `apply_cancel_requests` cancels the questions another worker was asked to stop. Records are written by a background thread, in order.
+    """
+
+    def __init__(self, store: Any = None) -> None:
+        self.store = store
+        self._runs: dict[tuple[str, str], set[asyncio.Task]] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-store") if store is not None else None
+        self.cancelled = 0
+
+    def register(self, session_id: str, query_id: str, task: asyncio.Task) -> None:
+        """Registers a task answering a question; it is forgotten once done."""
+        key = (session_id, query_id)
+        if key not in self._runs:
+            self._write("register_run", session_id, query_id, os.getpid())
+        self._runs.setdefault(key, set()).add(task)
+        task.add_done_callback(lambda done: self._forget(key, done))
+
+    def cancel(self, session_id: str, query_id: str) -> bool:
+        """
+        Cancels a question answered by this worker.
+
+        Args:
+            session_id (str): The session the question belongs to.
+            query_id (str): The identifier of the question.
+
+        Returns:
+            bool: Whether the question was still being answered.
+        """
+        tasks = [task for task in self._runs.get((session_id, query_id), ()) if not task.done()]
+        if not tasks:
+            return False
+        for task in tasks:
+            task.cancel()
+        self.cancelled += 1
+        logger.info(f"Query {query_id[:8]} cancelled.")
+
+        return True
+
+    def cancel_session(self, session_id: str) -> int:
+        """Cancels every question of a session answered by this worker and returns how many were cancelled."""
+        query_ids = [query_id for run_session_id, query_id in self._runs if run_session_id == session_id]
+
+        return sum(self.cancel(session_id, query_id) for query_id in query_ids)
+
+    async def apply_cancel_requests(self) -> int:
+        """
+        Cancels the questions of this worker that were asked to stop through another worker.
+
+        Returns:
+            int: The number of cancelled questions.
+        """
+        if self.store is None or not self._runs:
+            return 0
+        requested = await asyncio.to_thread(self.store.take_cancel_requests, os.getpid())
+        keys = [(session_id, query_id) for session_id, query_id in self._runs if (hash_token(session_id), query_id) in requested]
+
+        return sum(self.cancel(session_id, query_id) for session_id, query_id in keys)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of questions being answered by this worker and the number it cancelled so far."""
+        return {"running": len(self._runs), "cancelled": self.cancelled}
+
+    def _forget(self, key: tuple[str, str], task: asyncio.Task) -> None:
+        tasks = self._runs.get(key)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._runs[key]
+                self._write("forget_run", *key, os.getpid())
+
+    def _write(self, method: str, *args: Any) -> None:
+        if self._writer is not None:
+            self._writer.submit(self._record, method, *args)
+
+    def _record(self, method: str, *args: Any) -> None:
+        try:
+            getattr(self.store, method)(*args)
+        except Exception as store_error:
+            logger.warning(f"Failed to record a running question in the session store. Details:\n{store_error}")
@@ -0,0 +1,85 @@
+from typing import Any
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from config.server_config import CONVERSATION_RESULT_CHARS
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of tokens of a text (about 4 characters per token for English and SQL), without loading a tokenizer."""
+    return len(text) // 4 + 1
+
+def compact_result(result: str | None, limit: int = CONVERSATION_RESULT_CHARS) -> str | None:
+    """
+    Shortens the raw result of a query to what a follow-up question needs to refer to it.
+
+    Args:
+        result (str | None): The result, as returned by the `sql_db_query` tool.
+        limit (int): The maximum number of characters kept.
+
+    Returns:
+        str | None: The result, truncated with a marker if it is longer than `limit`.
+    """
+    if result is None or len(result) <= limit:
+        return result
+
+    return result[:limit].rstrip() + " ... (truncated)"
+
+
+class ConversationTurn:
+    """
+    A question answered in a session, kept so that follow-up questions can build on it.
+
+    Attributes:
+        question (str): The question asked by the user.
+        answer (str): The answer returned.
+        sql (str | None): The last read query the answer was derived from, if any.
+        result (str | None): Its result, compacted.
+    """
+
+    def __init__(self, question: str, answer: str, sql: str | None = None, result: str | None = None) -> None:
+        self.question = question
+        self.answer = answer
+        self.sql = sql
+        self.result = compact_result(result)
+
+    def messages(self) -> list[BaseMessage]:
+        """Returns the turn as the exchange the agent sees in its prompt: the question, then the answer with its SQL and result."""
+        reply = self.answer
+        if self.sql is not None:
+            reply += f"\n\nSQL: {self.sql}\nResult: {self.result}"
+
+        return [HumanMessage(self.question), AIMessage(reply)]
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"question": self.question, "answer": self.answer, "sql": self.sql, "result": self.result}
+
+    @classmethod
+    def from_dict(cls, state: dict[str, Any]) -> "ConversationTurn":
+        return cls(state["question"], state["answer"], state.get("sql"), state.get("result"))
+
+
+def trim_history(turns: list[ConversationTurn], max_tokens: int) -> list[ConversationTurn]:
+    """
+    Keeps the most recent turns of a conversation whose messages fit in a token budget.
+
+    Args:
+        turns (list[ConversationTurn]): The previous turns, oldest first.
+        max_tokens (int): The (estimated) token budget of the history.
+
+    Returns:
+        list[ConversationTurn]: The kept turns, oldest first. Empty if not even the last turn fits.
+    """
+    kept, used = [], 0
+    for turn in reversed(turns):
+        tokens = sum(estimate_tokens(message.content) for message in turn.messages())
+        if used + tokens > max_tokens:
+            break
+        kept.insert(0, turn)
+        used += tokens
+
+    return kept
+
+def build_history(turns: list[ConversationTurn]) -> list[BaseMessage]:
+    """Returns the chat history given to the agent for a list of turns, oldest first."""
+    return [message for turn in turns for message in turn.messages()]
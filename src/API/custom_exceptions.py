@@ -11,6 +11,10 @@ class AgentError(Exception):
     """Base exception for agent errors."""
     pass
 
+class ConfigurationError(Exception):
+    """Base exception for server configuration errors."""
+    pass
+
 
 # Custom classes
 class DatabaseURIError(DatabaseConnectionError):
@@ -33,10 +37,48 @@ class NonExistentConnectionError(DatabaseConnectionError):
     """Raised when no database connection exists but a close request is sent."""
     pass
 
+class SessionNotFoundError(DatabaseConnectionError):
+    """Raised when the session token is unknown or the session has expired."""
+    pass
+
+class SetupJobNotFoundError(DatabaseConnectionError):
+    """Raised when a setup job is unknown or its outcome has expired."""
+    pass
+
 class InvalidAPIKey(LLMError):
     """Raised when the provided API key is invalid."""
     pass
 
 class APIKeyNotFound(LLMError):
     """Raised when the API key is not provided."""
-    pass
\ No newline at end of file
+    pass
+
+class FastPathError(AgentError):
+    """Raised when the single-shot pipeline cannot answer a question and the full agent must take over."""
+    pass
+
+class ServerBusyError(AgentError):
+    """Raised when every agent worker is busy and the wait queue is full."""
+    def __init__(self, message: str, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class ResultNotFoundError(AgentError):
+    """Raised when a stored query result is unknown, has expired or belongs to another session."""
+    pass
+
+class ResultExportError(AgentError):
+    """Raised when a stored query result cannot be exported in the requested format."""
+    pass
+
+class QueryBudgetError(AgentError):
+    """Raised when the estimated plan of a generated query exceeds the configured cost or row budget."""
+    pass
+
+class QueryCancelledError(AgentError):
+    """Raised inside an agent run once the question was cancelled (client disconnect, explicit cancel or closed session)."""
+    pass
+
+class SessionStoreKeyError(ConfigurationError):
+    """Raised at startup when no key to encrypt the session store is configured."""
+    pass
@@ -1,35 +1,31 @@
+import hashlib
+
 from langchain_community.utilities import SQLDatabase
 from loguru import logger
+from sqlalchemy.engine import make_url
 from sqlalchemy.exc import OperationalError
 
 from API.custom_exceptions import (
+    DatabaseConnectionError,
     DatabaseURIError,
     AuthenticationError,
     HostPermissionError,
     UnknownDatabaseError
 )
+from API.engine_pool import engines
 from API.models import DatabaseConnectionRequest
+from API.schema_cache import SnapshotSQLDatabase
 
 
-def connect_to_db(credentials: DatabaseConnectionRequest) -> SQLDatabase:
+def build_db_uri(credentials: DatabaseConnectionRequest) -> str:
     """
-    Establishes a connection to a database using the provided credentials and configuration.
+    Builds the SQLAlchemy database URI matching the provided credentials.
 
     Args:
         credentials (DatabaseConnectionRequest): Credentials and configuration for database connection.
-        
-    Returns:
-        SQLDatabase: An instance of LangChain's `SQLDatabase` connected to the specified database.
-
-    Raises:
-        DatabaseURIError: If the database URI is invalid or improperly formatted.
-        AuthenticationError: If authentication fails due to incorrect user or password.
-        HostPermissionError: If access is denied due to insufficient host or port permissions.
-        UnknownDatabaseError: If the specified database does not exist.
 
-    Notes:
-        - Supported DBMS values include "MySQL", "PostgreSQL" and "SQLite".
-        - Connection errors are logged with detailed information for troubleshooting.
+    Returns:
+        str: The database URI, including the driver to use for the selected DBMS.
     """
     inputs = dict(credentials)
     dbms = inputs["dbms"]
@@ -40,7 +36,6 @@ def connect_to_db(credentials: DatabaseConnectionRequest) -> SQLDatabase:
     db_host = inputs["host"]
     db_port = inputs["port"]
     db_name = inputs["database"]
-    db_schema = inputs["db_schema"]
 
     match dbms:
         case "MySQL":
@@ -57,12 +52,72 @@ def connect_to_db(credentials: DatabaseConnectionRequest) -> SQLDatabase:
             else:
                 formatted_path = f"sqlite_dbs/{file_name}"
             db_uri = f"sqlite+pysqlite:///{formatted_path}?mode=rwc&share=private"
+        case _:
+            db_uri = ""
+
+    return db_uri
+
+def get_connection_key(credentials: DatabaseConnectionRequest) -> str:
+    """
+    Computes a stable identifier of the database targeted by the credentials.
+
+    Sessions connected to the same database (and schema) share the same key, whoever opened them. The password is left out so that the key
+    can safely be logged or persisted.
+
+    Args:
+        credentials (DatabaseConnectionRequest): Credentials and configuration for database connection.
+
+    Returns:
+        str: A hexadecimal digest identifying the database.
+    """
+    db_uri = build_db_uri(credentials)
+    try:
+        db_uri = make_url(db_uri).render_as_string(hide_password=True)
+    except Exception:
+        pass
+
+    return hashlib.sha256(f"{db_uri}|{credentials.db_schema or ''}".encode("utf-8")).hexdigest()
+
+def connect_to_db(credentials: DatabaseConnectionRequest) -> SQLDatabase:
+    """
+    Establishes a connection to a database using the provided credentials and configuration.
+
+    Args:
+        credentials (DatabaseConnectionRequest): Credentials and configuration for database connection.
+        
+    Returns:
+        SQLDatabase: An instance of LangChain's `SQLDatabase` connected to the specified database, backed by the schema snapshot cache.
+
+    Raises:
+        DatabaseURIError: If the database URI is invalid or improperly formatted.
+        AuthenticationError: If authentication fails due to incorrect user or password.
+        HostPermissionError: If access is denied due to insufficient host or port permissions.
+        UnknownDatabaseError: If the specified database does not exist.
+        DatabaseConnectionError: If the database cannot be opened for any other reason.
+
+    Notes:
+        - Supported DBMS values include "MySQL", "PostgreSQL" and "SQLite".
+        - The engine of the returned database comes from the shared engine registry and must be released with `engines.release`.
+        - Connection errors are logged with detailed information for troubleshooting.
+    """
+    inputs = dict(credentials)
+    dbms = inputs["dbms"]
+    db_host = inputs["host"]
+    db_port = inputs["port"]
+    db_schema = inputs["db_schema"]
+    db_uri = build_db_uri(credentials)
     db = None
 
     try:
-        db = SQLDatabase.from_uri(db_uri)
-        if dbms == "PostgreSQL":
-            db._execute(f"SET search_path TO {db_schema}")
+        # The engine (and its warm connection pool) is shared with every other session on this database. Tables are reflected lazily
+        # and described from the schema snapshot (the schema sets the search path on every PostgreSQL execution)
+        schema = db_schema if dbms == "PostgreSQL" else None
+        engine = engines.acquire(db_uri, dbms, schema)
+        try:
+            db = SnapshotSQLDatabase(engine, get_connection_key(credentials), schema=schema)
+        except Exception:
+            engines.release(engine)
+            raise
         logger.success("Database connection successfully established.")
     except ValueError as value_error:
         logger.error(f"Invalid database URI format: {db_uri}. Details:\n{value_error}")
@@ -87,6 +142,10 @@ def connect_to_db(credentials: DatabaseConnectionRequest) -> SQLDatabase:
             raise UnknownDatabaseError(
                 "Database not found. Please ensure that the database name is correct or check privileges of current user."
             ) from None
+        logger.error(f"Failed to establish connection. Details:\n{opr_error_msg}")
+        raise DatabaseConnectionError(
+            "Unable to open the database. Please check that the database is running and that its host, port or file path are correct."
+        ) from None
     except Exception as e:
         logger.error(f"Failed to establish connection. Details:\n{e}")
         raise Exception(
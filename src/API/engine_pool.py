@@ -0,0 +1,333 @@
+import threading
+import time
+from functools import partial
+from typing import Any
+
+from loguru import logger
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from config.server_config import ENGINE_POOL_SETTINGS, ENGINE_IDLE_TTL, STATEMENT_TIMEOUT
+from API.run_context import current_run
+
+
+class PoolMetrics:
+    """Counters of a connection pool: checkouts, checkins, new connections, invalidations and time spent waiting for a connection."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self._lock = threading.Lock()
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.waits += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "checkout_timeouts": self.timeouts,
+                "checkout_wait_avg": round(self.wait_time_total / self.waits, 4) if self.waits else 0.0,
+                "checkout_wait_max": round(self.wait_time_max, 4),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """`QueuePool` that measures how long each checkout waits for a free connection."""
+
+    metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        started_at = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.monotonic() - started_at, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.monotonic() - started_at)
+
+        return connection
+
+    def recreate(self) -> QueuePool:
+        # Engine.dispose() swaps in a fresh pool: keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+
+        return pool
+
+
+def set_statement_timeout(engine: Engine, dbms: str, timeout: float) -> None:
+    """
+    Makes the database abort any statement of the engine that runs for longer than `timeout` seconds.
+
+    - MySQL: `max_execution_time` session variable (SELECT statements only).
+    - PostgreSQL: `statement_timeout` session parameter.
+    - SQLite: progress handler interrupting the statement once its deadline, set when the statement starts, has passed.
+
+    Args:
+        engine (Engine): The engine to configure.
+        dbms (str): The DBMS of the engine.
+        timeout (float): The timeout in seconds (0 disables it).
+    """
+    if timeout <= 0:
+        return
+    milliseconds = int(timeout * 1000)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        match dbms:
+            case "MySQL":
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"SET SESSION max_execution_time = {milliseconds}")
+            case "PostgreSQL":
+                # Outside of a transaction, otherwise the pool's rollback on checkin would undo the setting
+                autocommit = dbapi_connection.autocommit
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"SET statement_timeout = {milliseconds}")
+                dbapi_connection.autocommit = autocommit
+            case "SQLite":
+                info = connection_record.info
+                dbapi_connection.set_progress_handler(
+                    lambda: 1 if time.monotonic() > info.get("deadline", float("inf")) else 0,
+                    1000
+                )
+
+    if dbms == "SQLite":
+        @event.listens_for(engine, "before_cursor_execute")
+        def on_execute(connection, cursor, statement, parameters, context, executemany):
+            connection.info["deadline"] = time.monotonic() + timeout
+
+
+def cancel_statement(engine: Engine, dbms: str, dbapi_connection: Any, info: dict) -> None:
+    """
+    Interrupts the statement running on a connection, from another thread.
+
+    - PostgreSQL: the driver's cancel request (the protocol-level equivalent of `pg_cancel_backend`, without a second connection).
+    - MySQL: `KILL QUERY` on the connection id, sent through another connection of the engine.
+    - SQLite: `sqlite3` interrupt.
+
+    Args:
+        engine (Engine): The engine of the connection.
+        dbms (str): The DBMS of the engine.
+        dbapi_connection (Any): The DBAPI connection running the statement.
+        info (dict): The pool record info of the connection.
+    """
+    match dbms:
+        case "PostgreSQL":
+            dbapi_connection.cancel()
+        case "MySQL":
+            with engine.connect() as connection:
+                connection.exec_driver_sql(f"KILL QUERY {int(info['connection_id'])}")
+        case "SQLite":
+            dbapi_connection.interrupt()
+
+def enable_cancellation(engine: Engine, dbms: str) -> None:
+    """
+    Registers every statement executed for a question with its run context, so that cancelling the question interrupts the statement
+    (see `cancel_statement`). The statement is unregistered when its connection returns to the pool, after its rows were fetched.
+
+    Args:
+        engine (Engine): The engine to configure.
+        dbms (str): The DBMS of the engine.
+    """
+    if dbms == "MySQL":
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute("SELECT CONNECTION_ID()")
+                connection_record.info["connection_id"] = cursor.fetchone()[0]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def on_execute(connection, cursor, statement, parameters, context, executemany):
+        run = current_run.get()
+        if run is not None:
+            dbapi_connection = connection.connection.dbapi_connection
+            run.attach_statement(id(dbapi_connection), partial(cancel_statement, engine, dbms, dbapi_connection, connection.info))
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        run = current_run.get()
+        if run is not None:
+            run.detach_statement(id(dbapi_connection))
+
+
+class EngineEntry:
+    """A shared engine with the number of sessions using it."""
+
+    def __init__(self, engine: Engine, dbms: str, metrics: PoolMetrics) -> None:
+        self.engine = engine
+        self.dbms = dbms
+        self.metrics = metrics
+        self.references = 0
+        self.released_at = time.monotonic()
+
+
+def normalize_uri(db_uri: str) -> str:
+    """
+    Normalizes a database URI so that equivalent spellings map to the same engine.
+
+    Args:
+        db_uri (str): The database URI.
+
+    Returns:
+        str: The normalized URI (driver, credentials, host, port, database and sorted query parameters).
+    """
+    url = make_url(db_uri)
+    url = url.set(query=dict(sorted(url.query.items())))
+
+    return url.render_as_string(hide_password=False)
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of SQLAlchemy engines, keyed by normalized database URI and schema.
+
+    Every session connected to the same database and schema shares one engine and therefore one warm connection pool. Pool sizing, overflow,
+    recycling and pre-ping are configured per DBMS (`ENGINE_POOL_SETTINGS`). An engine that no session uses anymore stays warm for
+    `ENGINE_IDLE_TTL` seconds, so reconnecting shortly after closing reuses its connections; after that it is disposed.
+    """
+
+    def __init__(self, idle_ttl: float) -> None:
+        self.idle_ttl = idle_ttl
+        self._entries: dict[str, EngineEntry] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, db_uri: str, dbms: str, schema: str | None = None) -> Engine:
+        """
+        Returns the shared engine of a database, creating it on first use.
+
+        Sessions on different schemas of a database get different engines: PostgreSQL queries set the search path of the pooled connection
+        they run on, which must not leak to the queries of another schema.
+
+        Args:
+            db_uri (str): The database URI.
+            dbms (str): The DBMS name, used to pick the pool settings.
+            schema (str | None): The schema the sessions work in.
+
+        Returns:
+            Engine: The shared engine. It must be handed back with `release` once no longer used.
+        """
+        key = f"{normalize_uri(db_uri)}|{schema or ''}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._create_entry(db_uri, dbms)
+                self._entries[key] = entry
+            entry.references += 1
+
+        return entry.engine
+
+    def release(self, engine: Engine) -> None:
+        """
+        Hands back an engine obtained from `acquire`.
+
+        Args:
+            engine (Engine): The engine to release.
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.engine is engine:
+                    entry.references = max(0, entry.references - 1)
+                    entry.released_at = time.monotonic()
+                    break
+            else:
+                # Not a registry engine: nothing shares it
+                engine.dispose()
+                return
+        if self.idle_ttl <= 0:
+            self.dispose_idle()
+
+    def dispose_idle(self) -> None:
+        """Disposes every engine no session has used for longer than the idle TTL."""
+        now = time.monotonic()
+        with self._lock:
+            idle_keys = [
+                key for key, entry in self._entries.items()
+                if not entry.references and now - entry.released_at >= self.idle_ttl
+            ]
+            idle_entries = [self._entries.pop(key) for key in idle_keys]
+        for entry in idle_entries:
+            entry.engine.dispose()
+            logger.info(f"Idle {entry.dbms} engine disposed.")
+
+    def dispose_all(self) -> None:
+        """Disposes every engine (used on server shutdown)."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.engine.dispose()
+
+    def stats(self) -> list[dict[str, Any]]:
+        """
+        Reports the state of every pool.
+
+        Returns:
+            list[dict[str, Any]]: Per engine: DBMS, sessions using it, pool size, checked out and overflow connections, and checkout metrics.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+
+        stats = []
+        for entry in entries:
+            pool = entry.engine.pool
+            stats.append({
+                "dbms": entry.dbms,
+                "sessions": entry.references,
+                "pool_size": pool.size() if isinstance(pool, QueuePool) else None,
+                "checked_out": pool.checkedout() if isinstance(pool, QueuePool) else None,
+                "overflow": pool.overflow() if isinstance(pool, QueuePool) else None,
+                **entry.metrics.as_dict(),
+            })
+
+        return stats
+
+    def _create_entry(self, db_uri: str, dbms: str) -> EngineEntry:
+        settings = ENGINE_POOL_SETTINGS.get(dbms, {})
+        engine = create_engine(db_uri, poolclass=TimedQueuePool, **settings)
+        metrics = PoolMetrics()
+        engine.pool.metrics = metrics
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            metrics.connects += 1
+
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            metrics.checkouts += 1
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            metrics.checkins += 1
+
+        @event.listens_for(engine, "invalidate")
+        def on_invalidate(dbapi_connection, connection_record, exception):
+            metrics.invalidations += 1
+
+        set_statement_timeout(engine, dbms, STATEMENT_TIMEOUT)
+        enable_cancellation(engine, dbms)
+
+        logger.info(f"New {dbms} engine created ({settings}).")
+
+        return EngineEntry(engine, dbms, metrics)
+
+
+engines = EngineRegistry(idle_ttl=ENGINE_IDLE_TTL)
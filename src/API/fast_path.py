@@ -0,0 +1,196 @@
+import ast
+import re
+
+import sqlglot
+from langchain_core.callbacks import Callbacks
+from langchain_core.language_models import BaseChatModel
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+from langchain_core.tools import BaseTool
+from loguru import logger
+
+from config.server_config import DATA_DIR, FAST_PATH_ANSWER_FORMAT, FAST_PATH_MAX_TABLES
+from API.custom_exceptions import FastPathError, QueryCancelledError
+from API.data_loader import load_message_from_file
+from API.FSL_prompt import get_example_selector
+from API.result_store import split_summary
+from API.run_context import current_run
+from API.schema_cache import SnapshotSQLDatabase
+from API.schema_index import stem, tokenize
+from API.sql_utils import is_write_statement
+from API.sql_validator import get_sqlglot_dialect, validate_sql
+from API.streaming import AgentEventStream, count_result_rows
+
+
+ANSWER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Answer the user's question in one or two sentences using only the SQL result below. "
+               "If the result is empty, say that no matching data was found.\n\nSQL query: {query}\nSQL result: {result}"),
+    ("human", "{input}"),
+])
+
+def select_relevant_tables(question: str, db: SnapshotSQLDatabase, limit: int) -> list[str]:
+    """
+    Picks the tables whose name shares words with the question (singular/plural insensitive).
+
+    Args:
+        question (str): The question asked by the user.
+        db (SnapshotSQLDatabase): The connected database.
+        limit (int): The maximum number of tables to return.
+
+    Returns:
+        list[str]: The matching tables, or the first `limit` tables if none matches.
+    """
+    question_tokens = stem(tokenize(question))
+    tables = list(db.get_usable_table_names())
+    matches = [table for table in tables if stem(tokenize(table)) & question_tokens]
+
+    return (matches or tables)[:limit]
+
+def extract_sql(text: str) -> str:
+    """Extracts the SQL statement from a model response, removing Markdown code fences if any."""
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+
+    return (fenced.group(1) if fenced else text).strip().rstrip(";").strip()
+
+def format_result_locally(sql: str, result: str, dialect: str | None) -> str:
+    """
+    Formats a query result as a short Markdown answer without calling the LLM.
+
+    Args:
+        sql (str): The executed query (used to name the columns).
+        result (str): The output of the `sql_db_query` tool.
+        dialect (str | None): The sqlglot dialect of the query.
+
+    Returns:
+        str: A sentence for empty or single-value results, otherwise a Markdown table (followed by a note when the result holds more
+            rows than the sample).
+    """
+    result, partial = split_summary(result)
+    try:
+        rows = ast.literal_eval(result) if result.strip() else []
+    except (ValueError, SyntaxError):
+        return result
+    if not rows:
+        return "No matching data was found."
+    try:
+        columns = sqlglot.parse_one(sql, read=dialect).named_selects
+    except Exception:
+        columns = []
+    if len(columns) != len(rows[0]):
+        columns = [f"column {index + 1}" for index in range(len(rows[0]))]
+    if len(rows) == 1 and len(columns) == 1:
+        return f"{columns[0]}: {rows[0][0]}"
+
+    header = "| " + " | ".join(columns) + " |\n|" + " --- |" * len(columns)
+    lines = ["| " + " | ".join(str(value) for value in row) + " |" for row in rows]
+    if partial:
+        lines.append(f"\nShowing the first {len(rows)} rows of a larger result.")
+
+    return "\n".join([header, *lines])
+
+
+class FastPathPipeline:
+    """
+    Single-shot text-to-SQL pipeline, an alternative to the iterative agent for routine questions.
+
+    One LLM call generates the SQL from the question, the description of the most relevant tables and the closest few-shot examples. The
+    query is validated locally, executed through the agent's own `sql_db_query` tool and the result is formatted locally (or with one short
+    LLM call, see `FAST_PATH_ANSWER_FORMAT`). Any failure raises a `FastPathError` so that the caller can fall back to the full agent.
+    """
+
+    def __init__(self, llm: BaseChatModel, db: SnapshotSQLDatabase, query_tool: BaseTool, dbms: str | None, top_k: int = 10) -> None:
+        self.llm = llm
+        self.db = db
+        self.query_tool = query_tool
+        self.dialect = get_sqlglot_dialect(dbms or db.dialect)
+        self.top_k = top_k
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", load_message_from_file(f"{DATA_DIR}/fast_path_prompt.txt")),
+            ("human", "{input}"),
+        ])
+        self.example_prompt = PromptTemplate.from_template(load_message_from_file(f"{DATA_DIR}/example_prompt.txt"))
+
+    def generate_sql(self, question: str, llm: BaseChatModel | None = None, callbacks: Callbacks = None) -> str:
+        """
+        Generates the SQL query answering a question with a single LLM call.
+
+        Args:
+            question (str): The question asked by the user.
+            llm (BaseChatModel | None): The model to use instead of the pipeline's own (e.g. the small tier chosen by the model router).
+            callbacks (Callbacks): Callback handlers notified of the LLM call (tracing, cancellation...). Event streams are left out: the
+                tokens of the query are not part of the answer.
+
+        Returns:
+            str: The generated query.
+
+        Raises:
+            FastPathError: If the generated query is invalid or modifies the database.
+        """
+        tables = self.select_tables(question)
+        examples = get_example_selector().select_examples({"input": question})
+        messages = self.prompt.format_messages(
+            input=question,
+            dialect=self.db.dialect,
+            top_k=self.top_k,
+            table_info=self.db.get_table_info(tables),
+            examples="\n".join(self.example_prompt.format(**example) for example in examples),
+        )
+        if isinstance(callbacks, list):
+            callbacks = [handler for handler in callbacks if not isinstance(handler, AgentEventStream)]
+        sql = extract_sql((llm or self.llm).invoke(messages, config={"callbacks": callbacks}).content)
+
+        errors = validate_sql(sql, self.dialect, self.db)
+        if errors:
+            raise FastPathError(f"Generated SQL is invalid: {' '.join(errors)}")
+        if is_write_statement(sql, self.dialect):
+            raise FastPathError("Statements that modify the database are left to the agent.")
+
+        return sql
+
+    def select_tables(self, question: str) -> list[str]:
+        """Returns the tables described to the model for this question (the tables kept by schema pruning, if it ran)."""
+        context = current_run.get()
+        if context is not None and context.relevant_tables:
+            return self.db.get_usable_table_names()[:FAST_PATH_MAX_TABLES]
+
+        return select_relevant_tables(question, self.db, FAST_PATH_MAX_TABLES)
+
+    def invoke(self, question: str, callbacks: Callbacks = None, llm: BaseChatModel | None = None) -> dict[str, str]:
+        """
+        Answers a question in one shot.
+
+        Args:
+            question (str): The question asked by the user.
+            callbacks (Callbacks): Callback handlers notified of the SQL generation, of the query execution and, when the answer is formatted
+                by the LLM, of its tokens.
+            llm (BaseChatModel | None): The model to use instead of the pipeline's own.
+
+        Returns:
+            dict[str, str]: The answer under `output`, plus the executed `sql` and its raw `result`.
+
+        Raises:
+            FastPathError: If the SQL cannot be generated, its execution fails or the answer cannot be formatted.
+        """
+        try:
+            sql = self.generate_sql(question, llm, callbacks)
+        except (FastPathError, QueryCancelledError):
+            raise
+        except Exception as generation_error:
+            raise FastPathError(f"SQL generation failed: {generation_error}") from generation_error
+
+        result = str(self.query_tool.invoke({"query": sql}, config={"callbacks": callbacks}))
+        if result.startswith("Error"):
+            raise FastPathError(f"SQL execution failed: {result}")
+        logger.info(f"Fast path answered with {count_result_rows(result)} row(s): {sql}")
+
+        if FAST_PATH_ANSWER_FORMAT == "llm":
+            messages = ANSWER_PROMPT.format_messages(input=question, query=sql, result=result)
+            try:
+                output = (llm or self.llm).invoke(messages, config={"callbacks": callbacks}).content
+            except QueryCancelledError:
+                raise
+            except Exception as format_error:
+                raise FastPathError(f"Answer formatting failed: {format_error}") from format_error
+        else:
+            output = format_result_locally(sql, result, self.dialect)
+
+        return {"output": output, "sql": sql, "result": result}
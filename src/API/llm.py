@@ -1,46 +1,212 @@
 import os
+import threading
+import time
+from functools import lru_cache
 
-from langchain_openai import ChatOpenAI
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from loguru import logger
-from openai import OpenAIError
+from openai import OpenAI, OpenAIError
 
-from config.server_config import OPENAI_API_KEY
+from config.server_config import (
+    OPENAI_API_KEY,
+    LLM_TIERS,
+    LOCAL_LLM_BASE_URL,
+    LOCAL_LLM_API_KEY,
+    EMBEDDING_PROVIDER,
+    EMBEDDING_MODEL,
+    LLM_TIMEOUT,
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    API_KEY_CHECK_TTL,
+    MODEL_ROUTING,
+    SMALL_LLM_RETRY_AFTER
+)
 from API.custom_exceptions import (
+    LLMError,
     InvalidAPIKey,
     APIKeyNotFound
 )
 
 
+# Time of the last successful access check of each tier, and of the last failed check of the small tier
+tier_checked_at: dict[str, float] = {}
+small_tier_failed_at: float | None = None
+tier_check_lock = threading.Lock()
+
+def get_provider_settings(provider: str) -> dict[str, str | None]:
+    """
+    Returns the connection settings of an LLM provider.
+
+    Args:
+        provider (str): "openai" or "local" (any OpenAI-compatible server, e.g. llama.cpp or vLLM).
+
+    Returns:
+        dict[str, str | None]: The `api_key` and `base_url` to use (a None base URL means the OpenAI API).
+
+    Raises:
+        LLMError: If the provider is unknown.
+    """
+    match provider:
+        case "openai":
+            return {"api_key": OPENAI_API_KEY, "base_url": None}
+        case "local":
+            return {"api_key": LOCAL_LLM_API_KEY, "base_url": LOCAL_LLM_BASE_URL}
+        case _:
+            raise LLMError(f"Unknown LLM provider '{provider}'. Available providers: openai, local.")
+
+@lru_cache(maxsize=1)
+def get_http_clients() -> tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Returns the process-wide HTTP clients used for every OpenAI call, so that connections (and their TLS handshakes) are kept alive
+    and reused across requests and sessions.
+
+    Returns:
+        tuple[httpx.Client, httpx.AsyncClient]: The synchronous and asynchronous clients.
+    """
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+@lru_cache(maxsize=None)
+def get_openai_client(provider: str = "openai") -> OpenAI:
+    """Returns the process-wide SDK client of a provider, used for API calls that LangChain does not cover (e.g. the access check)."""
+    return OpenAI(
+        **get_provider_settings(provider),
+        http_client=get_http_clients()[0],
+        max_retries=LLM_MAX_RETRIES,
+        timeout=LLM_TIMEOUT
+    )
+
+@lru_cache(maxsize=None)
+def get_llm(tier: str = "large") -> ChatOpenAI:
+    """
+    Returns the process-wide chat model of a tier, shared by every session.
+
+    Args:
+        tier (str): "large" (the flagship model) or "small" (the model for simple questions), see `LLM_TIERS`.
+
+    Returns:
+        ChatOpenAI: The shared chat model.
+    """
+    http_client, http_async_client = get_http_clients()
+
+    return ChatOpenAI(
+        model=LLM_TIERS[tier]["model"],
+        **get_provider_settings(LLM_TIERS[tier]["provider"]),
+        temperature=0,  # Control response randomness
+        streaming=True,  # Emit answer tokens to callback handlers as they are generated
+        stream_usage=True,  # Report token usage of streamed calls
+        max_retries=LLM_MAX_RETRIES,
+        timeout=LLM_TIMEOUT,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
+
+def validate_tier(tier: str) -> None:
+    """
+    Checks that the provider of a tier is reachable and accepts our credentials, without billing any token: the OpenAI API retrieves the
+    model description, local servers list their models. A successful check is trusted for `API_KEY_CHECK_TTL` seconds.
+
+    Args:
+        tier (str): The tier to check.
+
+    Raises:
+        OpenAIError: If the check fails.
+    """
+    with tier_check_lock:
+        checked_at = tier_checked_at.get(tier)
+        if checked_at is not None and time.monotonic() - checked_at < API_KEY_CHECK_TTL:
+            return
+        provider, model = LLM_TIERS[tier]["provider"], LLM_TIERS[tier]["model"]
+        if provider == "openai":
+            get_openai_client(provider).models.retrieve(model)
+        else:
+            get_openai_client(provider).models.list()
+        tier_checked_at[tier] = time.monotonic()
+
 def setup_openai_api() -> ChatOpenAI:
     """
-    Initializes and configures the OpenAI GPT-4o chat model for use.
+    Validates the access to the large model tier (GPT-4o on the OpenAI API by default) and returns its shared chat model.
 
     Returns:
-        ChatOpenAI: An instance of the configured OpenAI GPT-4o model.
+        ChatOpenAI: The process-wide instance of the large model.
 
     Raises:
         APIKeyNotFound: If the OpenAI API key is not provided or missing from the environment.
         InvalidAPIKey: If the connection to the OpenAI API fails due to an invalid API key, network issues, or other API-related errors.
     """
-    if not OPENAI_API_KEY:
-        logger.error(f"OpenAI API connection failed. API Key was not provided.")
+    if "openai" in (LLM_TIERS["large"]["provider"], EMBEDDING_PROVIDER) and not OPENAI_API_KEY:
+        logger.error("OpenAI API connection failed. API Key was not provided.")
         raise APIKeyNotFound(
             "Failed to connect to OpenAI API. Please ensure that you have provided your API Key before running the setup."
         ) from None
-    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+    if OPENAI_API_KEY:
+        os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
     try:
-        llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0  # Control response randomness
-        )
-        # Test the API connection with a simple request
-        response = llm.invoke("Say Hello")
+        validate_tier("large")
         logger.success("OpenAI API successfully accessed.")
     except OpenAIError as api_error:
         logger.error(f"OpenAI API connection failed. Details: \n{api_error}")
         raise InvalidAPIKey(
             "Failed to connect to OpenAI API. Check the validity of your API key and network settings."
         ) from api_error
-    
-    return llm
+
+    return get_llm("large")
+
+def get_small_llm() -> ChatOpenAI | None:
+    """
+    Returns the shared chat model of the small tier, used by the model router for simple questions.
+
+    Returns:
+        ChatOpenAI | None: The small model, or None if routing is disabled or the small tier is unavailable (it is then checked again
+            after `SMALL_LLM_RETRY_AFTER` seconds).
+    """
+    global small_tier_failed_at
+
+    if not MODEL_ROUTING:
+        return None
+    if small_tier_failed_at is not None and time.monotonic() - small_tier_failed_at < SMALL_LLM_RETRY_AFTER:
+        return None
+    try:
+        validate_tier("small")
+    except (OpenAIError, LLMError) as tier_error:
+        small_tier_failed_at = time.monotonic()
+        logger.warning(f"Small model tier unavailable, every question goes to the large model. Details:\n{tier_error}")
+        return None
+    small_tier_failed_at = None
+
+    return get_llm("small")
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> OpenAIEmbeddings:
+    """
+    Returns the process-wide embeddings client of `EMBEDDING_PROVIDER`.
+
+    The client is created on first use and then shared by every session. It goes through the same keep-alive HTTP clients as the chat
+    model.
+
+    Returns:
+        OpenAIEmbeddings: The shared embeddings client.
+    """
+    http_client, http_async_client = get_http_clients()
+
+    return OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        **get_provider_settings(EMBEDDING_PROVIDER),
+        # Local servers take the text itself, not the tiktoken tokens of OpenAI models
+        check_embedding_ctx_length=EMBEDDING_PROVIDER == "openai",
+        max_retries=LLM_MAX_RETRIES,
+        request_timeout=LLM_TIMEOUT,
+        http_client=http_client,
+        http_async_client=http_async_client
+    )
@@ -1,27 +1,106 @@
+import json
+import sys
+import threading
+import traceback
 from pathlib import Path
 
 from loguru import logger
 
-from config.server_config import LOGS_DIR
+from config.server_config import LOG_COMPRESSION, LOG_JSON, LOG_LEVEL, LOG_RETENTION, LOG_ROTATION, LOGS_DIR
 
 
+CONSOLE_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+TEXT_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} {level} {message}"
+
+# Current minimum level of every sink, changed at runtime by `set_log_level`
+current_level = {"name": LOG_LEVEL.upper(), "no": logger.level(LOG_LEVEL.upper()).no}
+configured = False
+configure_lock = threading.Lock()
+
+def level_filter(record: dict) -> bool:
+    """Lets a record through if it is at least at the current level."""
+    return record["level"].no >= current_level["no"]
+
+def format_json(record: dict) -> str:
+    """
+    Formats a record as one line of JSON: time, level, message, source, the session and trace ids bound to it (see
+    `logger.contextualize`) and the exception traceback, if any.
+
+    Loguru formats the string returned by a format function as a template, so the JSON is stashed in the record and referenced from it.
+    """
+    entry = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "source": f"{record['name']}:{record['function']}:{record['line']}",
+        **{key: value for key, value in record["extra"].items() if not key.startswith("_")},
+    }
+    if record["exception"] is not None:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["_json"] = json.dumps(entry, default=str)
+
+    return "{extra[_json]}\n"
+
 def configure_logging(file: str) -> None:
     """
-    Sets up application logging using Loguru.
+    Sets up application logging using Loguru, once per process.
 
-    This function creates the logs directory (if not already present) under API directory and configures Loguru to write logs to a file 
-    named after the script. The logs are formatted with timestamps, log levels, and messages, with a default log level of "INFO."
+    Loguru's default console handler is replaced, and a file named after the script is added under the logs directory. Both sinks are
+    enqueued: records are handed to a background thread, so logging never blocks the event loop on I/O. The file is rotated at
+    `LOG_ROTATION`, rotated files are compressed and kept for `LOG_RETENTION`, and holds JSON records unless `LOG_JSON` is disabled.
+    Later calls do nothing, so that the sinks are never duplicated.
 
     Args:
         file (str): The name of the script file where logging is configured (typically __file__).
     """
-    logs_dir = Path(LOGS_DIR)
-    logs_dir.mkdir(parents=True, exist_ok=True)
-    # Extract the base name (without extension) from the provided file
-    file_name = Path(file).stem
-    # Add configuration with the specified format and log level
-    logger.add(logs_dir / f"{file_name}.log", 
-               format="{time:YYYY-MM-DD HH:mm:ss} {level} {message}", 
-               level="INFO")
-    
-    logger.success(f"Logging configured for {file_name}.")
+    global configured
+
+    with configure_lock:
+        if configured:
+            return
+        logs_dir = Path(LOGS_DIR)
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        # Extract the base name (without extension) from the provided file
+        file_name = Path(file).stem
+
+        logger.remove()
+        logger.add(sys.stderr, format=CONSOLE_FORMAT, level=0, filter=level_filter, enqueue=True)
+        logger.add(
+            logs_dir / f"{file_name}.log",
+            format=format_json if LOG_JSON else TEXT_FORMAT,
+            level=0,
+            filter=level_filter,
+            enqueue=True,
+            rotation=LOG_ROTATION,
+            retention=LOG_RETENTION,
+            compression=LOG_COMPRESSION,
+        )
+        configured = True
+
+    logger.success(f"Logging configured for {file_name} at level {current_level['name']}.")
+
+def set_log_level(level: str) -> str:
+    """
+    Changes the minimum level of every sink, without restarting the server.
+
+    Args:
+        level (str): A Loguru level name ("DEBUG", "INFO", "WARNING"...), case-insensitive.
+
+    Returns:
+        str: The new level.
+
+    Raises:
+        ValueError: If the level does not exist.
+    """
+    name = level.upper()
+    current_level.update(name=name, no=logger.level(name).no)
+    logger.info(f"Log level set to {name}.")
+
+    return name
+
+def get_log_level() -> str:
+    """Returns the current minimum level of every sink."""
+    return current_level["name"]
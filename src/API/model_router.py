@@ -0,0 +1,117 @@
+import re
+import threading
+
+from loguru import logger
+
+from config.server_config import ROUTER_COMPLEXITY_THRESHOLD
+
+
+# Wording that usually calls for joins, grouping, window functions or nested queries
+COMPLEXITY_PATTERNS = {
+    "grouping": re.compile(r"\b(per|each|every|by (?:month|year|week|day|category|country|region|customer|product))\b"),
+    "comparison": re.compile(r"\b(compare[ds]?|comparison|versus|vs\.?|than|difference|ratio|share|percent(?:age)?)\b"),
+    "ranking": re.compile(r"\b(rank(?:ing|ed)?|top \d+|bottom \d+|highest|lowest|most|least)\b"),
+    "time series": re.compile(r"\b(trend|over time|growth|cumulative|running total|year over year|month over month|rolling|moving)\b"),
+    "statistics": re.compile(r"\b(median|percentile|distribution|correlat\w*|standard deviation|variance)\b"),
+    "negation": re.compile(r"\b(never|without|except|not any|none of)\b"),
+}
+MAX_SIMPLE_WORDS = 25
+MAX_SIMPLE_TABLES = 2
+
+
+class RouteDecision:
+    """
+    Model tier chosen for a question.
+
+    Attributes:
+        tier (str): "small" or "large".
+        score (int): The complexity score of the question.
+        reasons (list[str]): The complexity signals found in the question.
+    """
+
+    def __init__(self, tier: str, score: int, reasons: list[str]) -> None:
+        self.tier = tier
+        self.score = score
+        self.reasons = reasons
+
+
+class TierStats:
+    """Counters of one model tier: attempts, answers, escalations to the large tier and latency."""
+
+    def __init__(self) -> None:
+        self.attempts = 0
+        self.answered = 0
+        self.escalated = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+
+class ModelRouter:
+    """
+    Scores how complex a question is and routes simple lookups to the small model tier, complex questions to the large one.
+
+    The score counts the complexity signals of the question: wording that calls for grouping, comparisons, rankings, time series,
+    statistics or negation, a long question and a question spanning many tables. Questions scoring at least the threshold are complex.
+    """
+
+    def __init__(self, threshold: int) -> None:
+        self.threshold = threshold
+        self._stats = {"small": TierStats(), "large": TierStats()}
+        self._lock = threading.Lock()
+
+    def classify(self, question: str, relevant_tables: list[str] | None = None) -> RouteDecision:
+        """
+        Chooses the model tier for a question and logs the decision.
+
+        Args:
+            question (str): The question asked by the user.
+            relevant_tables (list[str] | None): The tables selected by schema pruning, if any.
+
+        Returns:
+            RouteDecision: The chosen tier and the reasons behind it.
+        """
+        text = question.lower()
+        reasons = [signal for signal, pattern in COMPLEXITY_PATTERNS.items() if pattern.search(text)]
+        if len(text.split()) > MAX_SIMPLE_WORDS:
+            reasons.append("long question")
+        if relevant_tables is not None and len(relevant_tables) > MAX_SIMPLE_TABLES:
+            reasons.append(f"{len(relevant_tables)} tables")
+        tier = "large" if len(reasons) >= self.threshold else "small"
+        logger.info(f"Routed to the {tier} model (complexity {len(reasons)}: {', '.join(reasons) or 'simple lookup'}).")
+
+        return RouteDecision(tier, len(reasons), reasons)
+
+    def record(self, tier: str, seconds: float, answered: bool) -> None:
+        """
+        Records one attempt of a tier.
+
+        Args:
+            tier (str): The tier that ran.
+            seconds (float): How long the attempt took.
+            answered (bool): Whether the tier answered (False when the question was escalated or failed).
+        """
+        with self._lock:
+            stats = self._stats[tier]
+            stats.attempts += 1
+            stats.answered += answered
+            stats.escalated += not answered and tier == "small"
+            stats.latency_total += seconds
+            stats.latency_max = max(stats.latency_max, seconds)
+        logger.info(f"The {tier} model {'answered' if answered else 'did not answer'} in {seconds:.2f}s.")
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Returns the attempts, answers, escalations and average and maximum latency of each tier."""
+        with self._lock:
+            return {
+                tier: {
+                    "attempts": stats.attempts,
+                    "answered": stats.answered,
+                    "escalated": stats.escalated,
+                    "latency_avg": round(stats.latency_total / stats.attempts, 4) if stats.attempts else 0.0,
+                    "latency_max": round(stats.latency_max, 4),
+                }
+                for tier, stats in self._stats.items()
+            }
+
+
+router = ModelRouter(threshold=ROUTER_COMPLEXITY_THRESHOLD)
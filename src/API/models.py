@@ -1,3 +1,5 @@
+from typing import Any, Literal
+
 from pydantic import BaseModel
 
 
@@ -29,14 +31,86 @@ class DatabaseConnectionRequest(BaseModel):
     database: str | None = None
     db_schema: str | None = None
 
+class SetupStepStatus(BaseModel):
+    """
+    Data model representing the progress of one step of a setup job.
+
+    Attributes:
+        name (str): Identifier of the step ("database", "llm", "examples", "schema_index" or "agent").
+        label (str): Description of the step for display.
+        status (str): "pending", "running", "done", "failed" or "cancelled".
+        duration_ms (float | None): Time the step took, once finished.
+        error (str | None): The error message if the step failed.
+    """
+    name: str
+    label: str
+    status: Literal["pending", "running", "done", "failed", "cancelled"]
+    duration_ms: float | None = None
+    error: str | None = None
+
+class SetupJobResponse(BaseModel):
+    """
+    Data model representing the state of a setup job.
+
+    Attributes:
+        job_id (str): The identifier to poll with `/setup/{job_id}`.
+        status (str): "running", "succeeded" or "failed".
+        steps (list[SetupStepStatus]): The progress and timing of every step.
+        session_id (str | None): The session token to send along with every following request of this connection, once the setup
+                                 succeeded.
+        detail (str | None): The error message, if the setup failed.
+    """
+    job_id: str
+    status: Literal["running", "succeeded", "failed"]
+    steps: list[SetupStepStatus]
+    session_id: str | None = None
+    detail: str | None = None
+
+class SessionRequest(BaseModel):
+    """
+    Data model representing a request that only targets an existing session.
+
+    Attributes:
+        session_id (str): The session token returned by the setup.
+    """
+    session_id: str
+
 class QueryRequest(BaseModel):
     """
     Data model representing a request to process a query or question.
 
     Attributes:
+        session_id (str): The session token returned by the setup.
         input (str): The query or question provided by the user for processing.
+        mode (str | None): The pipeline to use: "agent" (iterative SQL agent) or "fast" (single-shot SQL generation, falling back to the
+                           agent on failure). Defaults to the server configuration.
+        query_id (str | None): Client-chosen identifier of the question, used to cancel it with `/query/{query_id}/cancel`. Generated
+                               by the server if omitted.
+        follow_up (bool): Whether the question builds on the previous questions of the session (e.g. "and for 2023?"). Their SQL and
+                          results are then given to the agent, so that it can adapt the previous query instead of exploring the database
+                          again.
     """
+    session_id: str
     input: str
+    mode: Literal["agent", "fast"] | None = None
+    query_id: str | None = None
+    follow_up: bool = False
+
+class BatchQueryRequest(BaseModel):
+    """
+    Data model representing a request to answer a list of questions.
+
+    Attributes:
+        session_id (str): The session token returned by the setup.
+        inputs (list[str]): The questions. Duplicates (same normalized text) are answered once.
+        mode (str | None): The pipeline to use, as in `QueryRequest`.
+        concurrency (int | None): How many questions are answered at the same time. Defaults to the server configuration, and is capped
+                                  by the size of the worker pool.
+    """
+    session_id: str
+    inputs: list[str]
+    mode: Literal["agent", "fast"] | None = None
+    concurrency: int | None = None
 
 class QueryResponse(BaseModel):
     """
@@ -44,5 +118,52 @@ class QueryResponse(BaseModel):
 
     Attributes:
         output (str): The result or answer generated in response to the user's query.
+        cached (bool): Whether the answer was served from the answer cache instead of a new agent run.
+        result_id (str | None): The stored result of the last query run to answer, to be browsed with `/results/{result_id}`.
+        query_id (str | None): The identifier of the question.
+        trace_id (str | None): The identifier of the trace of the run that answered, as found in the server logs.
     """
     output: str
+    cached: bool = False
+    result_id: str | None = None
+    query_id: str | None = None
+    trace_id: str | None = None
+
+class ResultPage(BaseModel):
+    """
+    Data model representing one page of a stored query result.
+
+    Attributes:
+        result_id (str): The identifier of the result.
+        columns (list[str]): The column names.
+        rows (list[list[Any]]): The rows of the page.
+        row_count (int): The total number of rows of the result.
+        truncated (bool): Whether the result was cut at the maximum number of stored rows.
+        next_cursor (int | None): The cursor to pass as `after` to get the next page, or None on the last page.
+    """
+    result_id: str
+    columns: list[str]
+    rows: list[list[Any]]
+    row_count: int
+    truncated: bool = False
+    next_cursor: int | None = None
+
+class ExportLink(BaseModel):
+    """
+    Data model representing a single-use download link of a stored query result.
+
+    Attributes:
+        url (str): The path of the download, relative to the API root. It can be opened once, without the session token.
+        expires_in (int): The number of seconds the link stays valid.
+    """
+    url: str
+    expires_in: int
+
+class LogLevelRequest(BaseModel):
+    """
+    Data model representing a change of the server log level.
+
+    Attributes:
+        level (str): The new minimum level of the logs ("DEBUG", "INFO", "WARNING", "ERROR"...).
+    """
+    level: str
@@ -0,0 +1,121 @@
+import json
+import math
+
+import sqlglot
+from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlglot import exp
+
+from config.server_config import QUERY_GUARD_LIMIT, QUERY_GUARD_MAX_COST, QUERY_GUARD_MAX_ROWS, QUERY_GUARD_MODE
+from API.custom_exceptions import QueryBudgetError
+from API.schema_cache import SnapshotSQLDatabase
+from API.sql_validator import get_sqlglot_dialect
+
+
+class QueryEstimate:
+    """
+    Planner estimate of a query.
+
+    Attributes:
+        rows (float | None): Estimated rows read (MySQL, product of the rows examined per table) or returned (PostgreSQL).
+        cost (float | None): Estimated total cost, in planner units (PostgreSQL only).
+    """
+
+    def __init__(self, rows: float | None, cost: float | None = None) -> None:
+        self.rows = rows
+        self.cost = cost
+
+
+def explain_query(db: SnapshotSQLDatabase, sql: str) -> QueryEstimate | None:
+    """
+    Runs the EXPLAIN statement of the database dialect and extracts the estimated rows and cost.
+
+    SQLite does not estimate row counts, so its queries are only bounded by the statement timeout.
+
+    Args:
+        db (SnapshotSQLDatabase): The database the query will run on.
+        sql (str): The query.
+
+    Returns:
+        QueryEstimate | None: The estimate, or None if the dialect has no usable estimate or EXPLAIN fails (the error then surfaces when
+            the query itself is executed).
+    """
+    try:
+        match db.dialect:
+            case "postgresql":
+                plan = db._execute(f"EXPLAIN (FORMAT JSON) {sql}")[0]["QUERY PLAN"]
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+                return QueryEstimate(rows=plan["Plan Rows"], cost=plan["Total Cost"])
+            case "mysql":
+                rows = db._execute(f"EXPLAIN {sql}")
+                return QueryEstimate(rows=math.prod(float(row.get("rows") or 1) for row in rows))
+            case _:
+                return None
+    except (SQLAlchemyError, LookupError, ValueError) as explain_error:
+        logger.debug(f"EXPLAIN failed, the query is not estimated. Details:\n{explain_error}")
+        return None
+
+def over_budget(estimate: QueryEstimate) -> str | None:
+    """Returns why an estimate exceeds the configured budget, or None if it fits."""
+    reasons = []
+    if estimate.rows is not None and estimate.rows > QUERY_GUARD_MAX_ROWS:
+        reasons.append(f"about {estimate.rows:,.0f} rows (budget: {QUERY_GUARD_MAX_ROWS:,})")
+    if estimate.cost is not None and estimate.cost > QUERY_GUARD_MAX_COST:
+        reasons.append(f"a planner cost of {estimate.cost:,.0f} (budget: {QUERY_GUARD_MAX_COST:,.0f})")
+
+    return " and ".join(reasons) or None
+
+def stops_early(expression: exp.Expression) -> bool:
+    """Whether the database can stop reading as soon as LIMIT rows are produced (no sorting, grouping, DISTINCT or aggregate)."""
+    return (
+        isinstance(expression, exp.Select)
+        and not any(expression.args.get(clause) for clause in ("group", "order", "distinct", "having"))
+        and expression.find(exp.AggFunc, exp.Window) is None
+    )
+
+def guard_query(db: SnapshotSQLDatabase, sql: str) -> tuple[str, str | None]:
+    """
+    Checks the estimated plan of a query against the configured budget before it runs.
+
+    In "limit" mode, an over-budget query without LIMIT is given one (`QUERY_GUARD_LIMIT`) if this brings it within budget or lets the
+    database stop early; the agent is then told that the result is partial. Other over-budget queries are rejected.
+
+    Args:
+        db (SnapshotSQLDatabase): The database the query will run on.
+        sql (str): The query.
+
+    Returns:
+        tuple[str, str | None]: The query to run, and a note for the agent if it was limited.
+
+    Raises:
+        QueryBudgetError: If the query exceeds the budget and cannot be limited.
+    """
+    if QUERY_GUARD_MODE == "off":
+        return sql, None
+    estimate = explain_query(db, sql)
+    reason = over_budget(estimate) if estimate is not None else None
+    if reason is None:
+        return sql, None
+    logger.warning(f"Query over budget ({reason}): {sql}")
+
+    if QUERY_GUARD_MODE == "limit":
+        dialect = get_sqlglot_dialect(db.dialect)
+        try:
+            expression = sqlglot.parse_one(sql, read=dialect)
+        except sqlglot.errors.ParseError:
+            expression = None
+        if isinstance(expression, exp.Query) and expression.args.get("limit") is None:
+            limited = expression.limit(QUERY_GUARD_LIMIT).sql(dialect=dialect)
+            limited_estimate = explain_query(db, limited)
+            if stops_early(expression) or (limited_estimate is not None and over_budget(limited_estimate) is None):
+                logger.info(f"Query limited to {QUERY_GUARD_LIMIT} rows.")
+                return limited, (
+                    f"Note: the query was estimated to process {reason}, so only its first {QUERY_GUARD_LIMIT} rows were returned. "
+                    "If they are not enough to answer, rewrite the query to be more selective (filter on indexed columns, aggregate, "
+                    "check the join conditions)."
+                )
+
+    raise QueryBudgetError(
+        f"The query was rejected because it is estimated to process {reason}. Rewrite it to be more selective: filter on indexed "
+        "columns, aggregate in SQL and check that every join has a join condition."
+    )
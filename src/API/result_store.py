@@ -0,0 +1,672 @@
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from secrets import token_urlsafe
+from typing import Any, Iterator
+
+import sqlglot
+from loguru import logger
+from sqlglot import exp
+
+from config.server_config import (
+    RESULT_EXPORT_BATCH_ROWS,
+    RESULT_EXPORT_TOKEN_TTL,
+    RESULT_FETCH_SIZE,
+    RESULT_MAX_ROWS,
+    RESULT_MAX_STORED,
+    RESULT_SAMPLE_ROWS,
+    RESULT_TTL,
+    RESULTS_DIR,
+)
+from API.custom_exceptions import ResultExportError, ResultNotFoundError
+from API.schema_cache import SnapshotSQLDatabase
+from API.session_store import hash_token
+from API.sql_validator import get_sqlglot_dialect
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow and Parquet exports are disabled without pyarrow
+    pa = None
+    pq = None
+
+
+# Line appended to the sample shown to the model when the result has more rows than the sample
+PARTIAL_SAMPLE_PATTERN = re.compile(r"^\(More than \d+ rows, only the first \d+ are shown", re.MULTILINE)
+
+# Index of the stored results, shared by the API workers: the spool files of the results live beside it
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    result_id TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    spooled INTEGER NOT NULL,
+    row_count INTEGER NOT NULL,
+    truncated INTEGER NOT NULL,
+    kinds TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS result_sessions (
+    result_id TEXT NOT NULL,
+    token_hash TEXT NOT NULL,
+    PRIMARY KEY (result_id, token_hash)
+);
+CREATE INDEX IF NOT EXISTS result_sessions_session ON result_sessions (token_hash);
+CREATE TABLE IF NOT EXISTS export_tokens (
+    token_hash TEXT PRIMARY KEY,
+    result_id TEXT NOT NULL,
+    session_hash TEXT NOT NULL,
+    format TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+RESULT_NOT_FOUND = "Result not found. It may have expired; please run the question again."
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def split_summary(output: str) -> tuple[str, bool]:
+    """
+    Separates the sample rows of a query result summary from the lines that follow them (partial sample, notes).
+
+    Args:
+        output (str): The output of the `sql_db_query` tool.
+
+    Returns:
+        tuple[str, bool]: The stringified sample rows, and whether the result has more rows than the sample.
+    """
+    sample, _, trailer = output.partition("\n")
+
+    return sample, PARTIAL_SAMPLE_PATTERN.search(trailer) is not None
+
+def limit_query(sql: str, dialect: str | None, limit: int) -> str:
+    """
+    Caps the number of rows a query returns, so that the database stops once the sample is read. A lower LIMIT of the query is kept.
+
+    Args:
+        sql (str): The query.
+        dialect (str | None): The sqlglot dialect of the database.
+        limit (int): The maximum number of rows.
+
+    Returns:
+        str: The limited query, or the query itself if it cannot be parsed or limited safely (its rows are then cut while fetching).
+    """
+    try:
+        expression = sqlglot.parse_one(sql, read=dialect)
+    except sqlglot.errors.ParseError:
+        return sql
+    if not isinstance(expression, exp.Query):
+        return sql
+    current = expression.args.get("limit")
+    if current is not None:
+        # Offsets written inside the LIMIT clause (MySQL "LIMIT 10, 5") and FETCH clauses are left alone
+        value = current.expression if isinstance(current, exp.Limit) and not current.args.get("offset") else None
+        if not isinstance(value, exp.Literal) or not value.is_int or int(value.this) <= limit:
+            return sql
+
+    return expression.limit(limit).sql(dialect=dialect)
+
+def to_storable(value: Any) -> Any:
+    """Converts a database value to a type SQLite can store (Decimal, dates, UUIDs... become text)."""
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return int(value) if isinstance(value, bool) else value
+
+    return str(value)
+
+def kind_of(value: Any) -> str | None:
+    """Returns the storage class of a stored value, as used to pick the export type of its column."""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "real"
+    if isinstance(value, bytes):
+        return "blob"
+
+    return "text"
+
+def to_json_value(value: Any) -> Any:
+    """Converts a stored value to a JSON- and CSV-friendly one (binary values become hexadecimal strings)."""
+    return value.hex() if isinstance(value, bytes) else value
+
+def check_export_format(export_format: str) -> None:
+    """
+    Checks that results can be exported in a format.
+
+    Raises:
+        ResultExportError: If the format is unknown or needs pyarrow, which is not installed.
+    """
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise ResultExportError(f"Unknown export format '{export_format}'. Available formats: {', '.join(EXPORT_MEDIA_TYPES)}.")
+    if export_format != "csv" and pa is None:
+        raise ResultExportError(f"Exporting to {export_format} requires the pyarrow package.")
+
+def unique_names(columns: list[str]) -> list[str]:
+    """Renames duplicate column names (e.g. `id` from two joined tables) so that columnar formats accept them."""
+    seen = {}
+    names = []
+    for column in columns:
+        seen[column] = seen.get(column, 0) + 1
+        names.append(column if seen[column] == 1 else f"{column}_{seen[column]}")
+
+    return names
+
+
+class ResultSet:
+    """
+    Result of one query, spooled to a local SQLite file so that it can be paged and exported without keeping a database connection open.
+
+    Only the sample shown to the model is read when the query runs. Results that fit in the sample are stored right away; larger ones are
+    spooled by `ResultStore.materialize`, which runs the query again the first time the result is paged or exported, so that the
+    exploratory queries of the agent never cost more than their sample.
+
+    Rows are stored in fetch order in a table whose implicit `rowid` runs from 1 to `row_count`, which serves as the keyset cursor.
+
+    Attributes:
+        result_id (str): Unguessable identifier of the result.
+        sql (str): The executed query.
+        columns (list[str]): The column names.
+        sample (list[tuple]): The first rows of the result, as shown to the model (only known to the worker that ran the query).
+        spooled (bool): Whether the rows are stored.
+        row_count (int): The number of stored rows.
+        truncated (bool): Whether rows beyond `RESULT_MAX_ROWS` were dropped.
+    """
+
+    def __init__(self, result_id: str, sql: str, columns: list[str], directory: Path) -> None:
+        self.result_id = result_id
+        self.sql = sql
+        self.columns = columns
+        self.sample: list[tuple] = []
+        self.spooled = False
+        self.row_count = 0
+        self.truncated = False
+        self.kinds: list[set[str]] = [set() for _ in columns]
+        self.path = directory / f"{result_id}.sqlite"
+
+    def spool(self, rows: Iterator[list[tuple]]) -> None:
+        """
+        Stores the rows of the result, batch by batch. The rows are written to a temporary file first, so that readers never see a partial
+        spool.
+
+        Args:
+            rows (Iterator[list[tuple]]): Batches of rows, as fetched from the database cursor.
+        """
+        placeholders = ", ".join("?" for _ in self.columns)
+        self.row_count = 0
+        self.truncated = False
+        self.kinds = [set() for _ in self.columns]
+        temporary_path = self.path.with_name(f"{self.result_id}.{token_urlsafe(6)}.tmp")
+        try:
+            with closing(sqlite3.connect(temporary_path)) as connection:
+                connection.execute(f"CREATE TABLE rows ({', '.join(f'c{index}' for index in range(len(self.columns)))})")
+                for batch in rows:
+                    remaining = RESULT_MAX_ROWS - self.row_count
+                    stored = [tuple(to_storable(value) for value in row) for row in batch[:remaining]]
+                    for row in stored:
+                        for kinds, value in zip(self.kinds, row):
+                            kind = kind_of(value)
+                            if kind is not None:
+                                kinds.add(kind)
+                    connection.executemany(f"INSERT INTO rows VALUES ({placeholders})", stored)
+                    self.row_count += len(stored)
+                    if len(batch) > remaining:
+                        self.truncated = True
+                        break
+                connection.commit()
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            temporary_path.unlink(missing_ok=True)
+            raise
+        self.spooled = True
+
+    def page(self, after: int = 0, limit: int = 100) -> tuple[list[list[Any]], int | None]:
+        """
+        Reads one page of rows using keyset pagination.
+
+        Args:
+            after (int): The cursor returned with the previous page (0 for the first page).
+            limit (int): The maximum number of rows to return.
+
+        Returns:
+            tuple[list[list[Any]], int | None]: The rows, and the cursor of the next page (None on the last page).
+
+        Raises:
+            ResultNotFoundError: If the result was deleted (evicted or expired, possibly by another worker).
+        """
+        try:
+            with closing(sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True)) as connection:
+                rows = connection.execute(
+                    "SELECT rowid, * FROM rows WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, limit)
+                ).fetchall()
+        except sqlite3.OperationalError:
+            if self.path.exists():
+                raise
+            raise ResultNotFoundError(RESULT_NOT_FOUND)
+        next_cursor = rows[-1][0] if rows and len(rows) == limit and rows[-1][0] < self.row_count else None
+
+        return [list(row[1:]) for row in rows], next_cursor
+
+    def batches(self, size: int) -> Iterator[list[list[Any]]]:
+        """Yields every row of the result, `size` rows at a time."""
+        cursor = 0
+        while cursor is not None:
+            rows, cursor = self.page(cursor, size)
+            if rows:
+                yield rows
+
+    def summary(self, note: str | None = None) -> str:
+        """
+        Describes the result for the model: the sample rows (in the format of `SQLDatabase.run`) followed, when the result is larger, by a
+        line saying so.
+
+        Args:
+            note (str | None): A remark about the execution to append to the summary.
+
+        Returns:
+            str: The summary ("" for an empty result).
+        """
+        if not self.sample:
+            return ""
+        sample = [
+            tuple(value[:100] + "..." if isinstance(value, str) and len(value) > 100 else value for value in row) for row in self.sample
+        ]
+        lines = [str(sample)]
+        if not self.spooled:
+            lines.append(
+                f"(More than {len(sample)} rows, only the first {len(sample)} are shown. "
+                f"The user can browse and download the full result.)"
+            )
+        if note:
+            lines.append(note)
+
+        return "\n".join(lines)
+
+    def export(self, export_format: str) -> Iterator[str | bytes]:
+        """
+        Streams the whole result in the requested format, `RESULT_EXPORT_BATCH_ROWS` rows per chunk.
+
+        Args:
+            export_format (str): "csv", "arrow" (Arrow IPC stream) or "parquet".
+
+        Returns:
+            Iterator[str | bytes]: The chunks of the exported file.
+
+        Raises:
+            ResultExportError: If the format is unknown or needs pyarrow, which is not installed.
+        """
+        check_export_format(export_format)
+
+        return self._export_csv() if export_format == "csv" else self._export_arrow(export_format)
+
+    def _export_csv(self) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.columns)
+        for rows in self.batches(RESULT_EXPORT_BATCH_ROWS):
+            writer.writerows([to_json_value(value) for value in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    def _export_arrow(self, export_format: str) -> Iterator[bytes]:
+        schema = self._arrow_schema()
+        sink = io.BytesIO()
+        writer = pq.ParquetWriter(sink, schema) if export_format == "parquet" else pa.ipc.new_stream(sink, schema)
+        with writer:
+            for rows in self.batches(RESULT_EXPORT_BATCH_ROWS):
+                arrays = [
+                    pa.array([str(value) if value is not None and pa.types.is_string(field.type) else value for value in values],
+                             type=field.type)
+                    for field, values in zip(schema, zip(*rows))
+                ]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+                yield self._drain(sink)
+        yield self._drain(sink)
+
+    def _arrow_schema(self) -> Any:
+        # Integer-only columns become int64, numeric columns float64, binary-only columns binary and anything else (or mixed) text
+        fields = []
+        for name, kinds in zip(unique_names(self.columns), self.kinds):
+            if kinds == {"integer"}:
+                arrow_type = pa.int64()
+            elif kinds and kinds <= {"integer", "real"}:
+                arrow_type = pa.float64()
+            elif kinds == {"blob"}:
+                arrow_type = pa.binary()
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(name, arrow_type))
+
+        return pa.schema(fields)
+
+    @staticmethod
+    def _drain(sink: io.BytesIO) -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+
+        return data
+
+
+class ResultStore:
+    """
+    Registry of the stored query results, shared by the API workers of a host and bounded in number (least recently used results are
+    deleted first) and in age.
+
+    Each result belongs to the session that ran the query and is only served to that session, and to the sessions it was explicitly
+    shared with. Downloads opened by a browser go through single-use export tokens, so that the session token never appears in a URL.
+
+    The results are described in a SQLite index in WAL mode, which holds their owners (under the hash of their token) and the export tokens
+    (hashed as well), and their rows are spooled beside it: a result produced on one worker can be paged, exported or downloaded through
+    any other worker.
+    """
+
+    def __init__(self, directory: Path, max_results: int, ttl: float) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_results = max_results
+        self.ttl = ttl
+        self._local = threading.local()
+        # Results being spooled by this worker, with the number of threads waiting for them
+        self._spooling: dict[str, tuple[threading.Lock, int]] = {}
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.executescript(INDEX_SCHEMA)
+
+    def create(self, session_id: str | None, db: SnapshotSQLDatabase, sql: str) -> ResultSet | None:
+        """
+        Runs a query for its first `RESULT_SAMPLE_ROWS` rows (the database is asked for one more, to tell whether there are others) and
+        registers its result. The result is stored right away if the sample holds all of it, otherwise on first read (see `ResultSet`).
+
+        Args:
+            session_id (str | None): The session running the query.
+            db (SnapshotSQLDatabase): The database to query.
+            sql (str): The query.
+
+        Returns:
+            ResultSet | None: The result, or None if the statement returned no rows.
+        """
+        with db.stream(limit_query(sql, get_sqlglot_dialect(db.dialect), RESULT_SAMPLE_ROWS + 1), RESULT_SAMPLE_ROWS + 1) as cursor:
+            if not cursor.returns_rows:
+                return None
+            columns = list(cursor.keys())
+            rows = cursor.fetchmany(RESULT_SAMPLE_ROWS + 1)
+        if not rows:
+            return None
+
+        result_set = ResultSet(token_urlsafe(16), sql, columns, self.directory)
+        result_set.sample = [tuple(row) for row in rows[:RESULT_SAMPLE_ROWS]]
+        if len(rows) <= RESULT_SAMPLE_ROWS:
+            result_set.spool(iter([rows]))
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (result_set.result_id, sql, json.dumps(columns), result_set.spooled, result_set.row_count, result_set.truncated,
+                 json.dumps([sorted(kinds) for kinds in result_set.kinds]), time.time())
+            )
+            if session_id:
+                connection.execute("INSERT INTO result_sessions VALUES (?, ?)", (result_set.result_id, hash_token(session_id)))
+            evicted = self._delete(
+                connection, "SELECT result_id FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_results,)
+            )
+        self._unlink(evicted)
+        logger.info(f"Result {result_set.result_id[:8]} registered ({'stored' if result_set.spooled else 'spooled on first read'}).")
+
+        return result_set
+
+    def get(self, result_id: str, session_id: str) -> ResultSet:
+        """
+        Returns a stored result and records its use. Blocking.
+
+        Args:
+            result_id (str): The identifier of the result.
+            session_id (str): The session asking for it.
+
+        Returns:
+            ResultSet: The result.
+
+        Raises:
+            ResultNotFoundError: If the result does not exist, has expired or was produced by another session.
+        """
+        with self._connect() as connection:
+            used = connection.execute(
+                "UPDATE results SET last_used = ? "
+                "WHERE result_id = ? AND result_id IN (SELECT result_id FROM result_sessions WHERE token_hash = ?)",
+                (time.time(), result_id, hash_token(session_id))
+            ).rowcount
+            result_set = self._load(connection, result_id) if used else None
+        if result_set is None or (result_set.spooled and not result_set.path.exists()):
+            raise ResultNotFoundError(RESULT_NOT_FOUND)
+
+        return result_set
+
+    def materialize(self, result_set: ResultSet, db: SnapshotSQLDatabase) -> None:
+        """
+        Runs the query of a result again with a server-side cursor and stores every row, `RESULT_FETCH_SIZE` rows at a time, unless the
+        result is already stored. Concurrent calls of this worker wait for the same spool. Blocking.
+
+        Args:
+            result_set (ResultSet): The result, as returned by `get`.
+            db (SnapshotSQLDatabase): The database of the query.
+
+        Raises:
+            ResultNotFoundError: If the result was deleted (evicted, expired or closed session) meanwhile.
+        """
+        if result_set.spooled:
+            return
+        with self._spool_lock(result_set.result_id):
+            with closing(self._connect().execute("SELECT * FROM results WHERE result_id = ?", (result_set.result_id,))) as cursor:
+                row = cursor.fetchone()
+            if row is None:
+                raise ResultNotFoundError(RESULT_NOT_FOUND)
+            stored = self._from_row(row)
+            if stored.spooled:
+                # Stored meanwhile, by this worker or another one
+                result_set.row_count, result_set.truncated, result_set.kinds = stored.row_count, stored.truncated, stored.kinds
+                result_set.spooled = True
+                return
+            with db.stream(result_set.sql, RESULT_FETCH_SIZE) as cursor:
+                result_set.spool(iter(lambda: cursor.fetchmany(RESULT_FETCH_SIZE), []))
+            with self._connect() as connection:
+                recorded = connection.execute(
+                    "UPDATE results SET spooled = 1, row_count = ?, truncated = ?, kinds = ? WHERE result_id = ?",
+                    (result_set.row_count, result_set.truncated, json.dumps([sorted(kinds) for kinds in result_set.kinds]),
+                     result_set.result_id)
+                ).rowcount
+            if not recorded:
+                # Deleted while it was being spooled
+                result_set.path.unlink(missing_ok=True)
+                raise ResultNotFoundError(RESULT_NOT_FOUND)
+        logger.info(f"Result {result_set.result_id[:8]} stored ({result_set.row_count} rows).")
+
+    def share(self, result_id: str, session_id: str | None) -> bool:
+        """
+        Lets another session read a result, e.g. one whose question was answered by the run of an identical question.
+
+        Args:
+            result_id (str): The identifier of the result.
+            session_id (str | None): The session to share it with.
+
+        Returns:
+            bool: Whether the result still exists.
+        """
+        with self._connect() as connection:
+            if not connection.execute("UPDATE results SET last_used = ? WHERE result_id = ?", (time.time(), result_id)).rowcount:
+                return False
+            if session_id is not None:
+                connection.execute("INSERT OR IGNORE INTO result_sessions VALUES (?, ?)", (result_id, hash_token(session_id)))
+            result_set = self._load(connection, result_id)
+
+        return not result_set.spooled or result_set.path.exists()
+
+    def create_export_token(self, result_id: str, session_id: str, export_format: str) -> str:
+        """
+        Issues a single-use token to download a result, valid for `RESULT_EXPORT_TOKEN_TTL` seconds. Blocking.
+
+        Args:
+            result_id (str): The identifier of the result.
+            session_id (str): The session asking for it.
+            export_format (str): The format of the download.
+
+        Returns:
+            str: The token.
+
+        Raises:
+            ResultNotFoundError: If the session cannot read the result.
+            ResultExportError: If the format is not available.
+        """
+        check_export_format(export_format)
+        self.get(result_id, session_id)
+        token = token_urlsafe(24)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO export_tokens VALUES (?, ?, ?, ?, ?)",
+                (hash_token(token), result_id, hash_token(session_id), export_format, time.time() + RESULT_EXPORT_TOKEN_TTL)
+            )
+
+        return token
+
+    def redeem_export_token(self, token: str) -> tuple[ResultSet, str]:
+        """
+        Consumes an export token. Blocking.
+
+        Args:
+            token (str): The token.
+
+        Returns:
+            tuple[ResultSet, str]: The result and the format the token was issued for.
+
+        Raises:
+            ResultNotFoundError: If the token is unknown, expired or already used, or if its result was deleted or never stored.
+        """
+        with self._connect() as connection:
+            entry = connection.execute(
+                "DELETE FROM export_tokens WHERE token_hash = ? RETURNING result_id, format, expires_at", (hash_token(token),)
+            ).fetchall()
+            result_set = self._load(connection, entry[0][0]) if entry else None
+        if not entry or entry[0][2] < time.time():
+            raise ResultNotFoundError("This download link has expired or was already used. Please export the result again.")
+        if result_set is None or not result_set.spooled or not result_set.path.exists():
+            raise ResultNotFoundError(RESULT_NOT_FOUND)
+
+        return result_set, entry[0][1]
+
+    def drop_session(self, session_id: str) -> None:
+        """Revokes the access of a session to its results and its export links, and deletes the results no other session can read."""
+        token_hash = hash_token(session_id)
+        with self._connect() as connection:
+            owned = connection.execute("DELETE FROM result_sessions WHERE token_hash = ? RETURNING result_id", (token_hash,)).fetchall()
+            connection.execute("DELETE FROM export_tokens WHERE session_hash = ?", (token_hash,))
+            placeholders = ", ".join("?" for _ in owned)
+            dropped = self._delete(
+                connection,
+                f"SELECT result_id FROM results WHERE result_id IN ({placeholders}) "
+                f"AND result_id NOT IN (SELECT result_id FROM result_sessions)",
+                [row[0] for row in owned]
+            ) if owned else []
+        self._unlink(dropped)
+
+    def evict_expired(self) -> int:
+        """
+        Deletes the results that were not used for longer than the TTL, the expired export tokens and the partial spools of stopped
+        workers.
+
+        Returns:
+            int: The number of deleted results.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("DELETE FROM export_tokens WHERE expires_at < ?", (now,))
+            expired = self._delete(connection, "SELECT result_id FROM results WHERE last_used <= ?", (now - self.ttl,))
+        self._unlink(expired)
+        for path in self.directory.glob("*.tmp"):
+            # A spool being written is modified continuously
+            try:
+                if now - path.stat().st_mtime > self.ttl:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+        return len(expired)
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of stored results and the number of rows they hold, on every worker."""
+        count, rows = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM results").fetchall()[0]
+
+        return {"results": count, "rows": rows}
+
+    def _load(self, connection: sqlite3.Connection, result_id: str) -> ResultSet | None:
+        rows = connection.execute("SELECT * FROM results WHERE result_id = ?", (result_id,)).fetchall()
+
+        return self._from_row(rows[0]) if rows else None
+
+    def _from_row(self, row: tuple) -> ResultSet:
+        result_id, sql, columns, spooled, row_count, truncated, kinds, _ = row
+        result_set = ResultSet(result_id, sql, json.loads(columns), self.directory)
+        result_set.spooled = bool(spooled)
+        result_set.row_count = row_count
+        result_set.truncated = bool(truncated)
+        result_set.kinds = [set(column_kinds) for column_kinds in json.loads(kinds)]
+
+        return result_set
+
+    @staticmethod
+    def _delete(connection: sqlite3.Connection, query: str, parameters: Any) -> list[str]:
+        # Runs inside a write transaction: the selected results cannot change before they are deleted
+        result_ids = [(row[0],) for row in connection.execute(query, parameters).fetchall()]
+        for table in ("results", "result_sessions", "export_tokens"):
+            connection.executemany(f"DELETE FROM {table} WHERE result_id = ?", result_ids)
+
+        return [result_id for result_id, in result_ids]
+
+    def _unlink(self, result_ids: list[str]) -> None:
+        for result_id in result_ids:
+            (self.directory / f"{result_id}.sqlite").unlink(missing_ok=True)
+
+    @contextmanager
+    def _spool_lock(self, result_id: str) -> Iterator[None]:
+        with self._lock:
+            lock, waiting = self._spooling.get(result_id, (threading.Lock(), 0))
+            self._spooling[result_id] = (lock, waiting + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._lock:
+                lock, waiting = self._spooling[result_id]
+                if waiting == 1:
+                    del self._spooling[result_id]
+                else:
+                    self._spooling[result_id] = (lock, waiting - 1)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread: SQLite connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.directory / "results.db", timeout=5)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+
+        return connection
+
+    def __len__(self) -> int:
+        return self.stats()["results"]
+
+
+results = ResultStore(RESULTS_DIR, max_results=RESULT_MAX_STORED, ttl=RESULT_TTL)
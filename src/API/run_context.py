@@ -0,0 +1,100 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator
+
+from loguru import logger
+
+from API.conversation import ConversationTurn
+from API.custom_exceptions import QueryCancelledError
+
+
+class RunContext:
+    """
+    State of the question being answered, visible to the tools and database helpers running on the same worker thread.
+
+    Attributes:
+        question (str): The question asked by the user.
+        session_id (str | None): The session the question belongs to.
+        relevant_tables (list[str] | None): Tables selected for the question by schema pruning, or None to expose every table.
+        result_id (str | None): The stored result of the last query executed for the question.
+        history (list[ConversationTurn]): The previous questions of the session the question follows up on.
+        cancelled (threading.Event): Set once the question was cancelled; the run stops at its next step.
+    """
+
+    def __init__(self, question: str, session_id: str | None = None) -> None:
+        self.question = question
+        self.session_id = session_id
+        self.relevant_tables: list[str] | None = None
+        self.result_id: str | None = None
+        self.history: list[ConversationTurn] = []
+        self.cancelled = threading.Event()
+        self._statements: dict[int, Callable[[], None]] = {}
+        self._lock = threading.Lock()
+
+    def attach_statement(self, connection_id: int, cancel: Callable[[], None]) -> None:
+        """
+        Registers a statement starting on a database connection for this question.
+
+        Args:
+            connection_id (int): Identifies the DBAPI connection running the statement.
+            cancel (Callable[[], None]): Interrupts the statement from another thread.
+
+        Raises:
+            QueryCancelledError: If the question was already cancelled, so that the statement does not start.
+        """
+        with self._lock:
+            self.raise_if_cancelled()
+            self._statements[connection_id] = cancel
+
+    def detach_statement(self, connection_id: int) -> None:
+        """Forgets the statement of a connection, once the connection is returned to the pool."""
+        with self._lock:
+            self._statements.pop(connection_id, None)
+
+    def cancel(self) -> None:
+        """
+        Cancels the question: the run stops at its next step and the statements it is running are interrupted by the database driver.
+
+        Blocking (a driver-level cancel may need a network round trip), so it must not be called from the event loop.
+        """
+        with self._lock:
+            self.cancelled.set()
+            cancels = list(self._statements.values())
+        for cancel in cancels:
+            try:
+                cancel()
+            except Exception as cancel_error:
+                logger.warning(f"Failed to cancel a running statement. Details:\n{cancel_error}")
+        logger.info(f"Question cancelled ({len(cancels)} running statement(s) interrupted).")
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Stops the run if the question was cancelled.
+
+        Raises:
+            QueryCancelledError: If the question was cancelled.
+        """
+        if self.cancelled.is_set():
+            raise QueryCancelledError("The query was cancelled.")
+
+
+current_run: ContextVar[RunContext | None] = ContextVar("current_run", default=None)
+
+@contextmanager
+def run_context(context: RunContext) -> Iterator[RunContext]:
+    """Makes `context` the current run for the duration of the `with` block."""
+    token = current_run.set(context)
+    try:
+        yield context
+    finally:
+        current_run.reset(token)
+
+@contextmanager
+def unscoped() -> Iterator[None]:
+    """Hides the current run for the duration of the `with` block (e.g. to look at the full schema)."""
+    token = current_run.set(None)
+    try:
+        yield
+    finally:
+        current_run.reset(token)
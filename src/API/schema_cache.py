@@ -0,0 +1,388 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from langchain_community.utilities import SQLDatabase
+from loguru import logger
+from sqlalchemy import MetaData, inspect, literal_column, select, table, text
+from sqlalchemy.engine import CursorResult, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.server_config import SCHEMA_CACHE_DIR
+from API.run_context import current_run, unscoped
+
+
+def compute_schema_fingerprint(engine: Engine, schema: str | None = None) -> str | None:
+    """
+    Computes a cheap fingerprint of the database schema, which changes whenever a table or column is created, altered or dropped.
+
+    - SQLite: `PRAGMA schema_version`.
+    - PostgreSQL: hash of the catalog row versions (`xmin`) of the tables in the schema.
+    - MySQL: count and checksum of the column definitions in `information_schema`.
+
+    Args:
+        engine (Engine): The engine of the database.
+        schema (str | None): The schema in use (PostgreSQL only).
+
+    Returns:
+        str | None: The fingerprint, or None if it cannot be computed for this DBMS (the snapshot is then rebuilt on every connect).
+    """
+    match engine.dialect.name:
+        case "sqlite":
+            statement, parameters = "PRAGMA schema_version", {}
+        case "postgresql":
+            statement = (
+                "SELECT md5(string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.oid)) "
+                "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = :schema AND c.relkind IN ('r', 'v', 'm', 'p')"
+            )
+            parameters = {"schema": schema or "public"}
+        case "mysql":
+            statement = (
+                "SELECT COUNT(*), SUM(CRC32(CONCAT_WS(':', table_name, column_name, column_type))) "
+                "FROM information_schema.columns WHERE table_schema = DATABASE()"
+            )
+            parameters = {}
+        case _:
+            return None
+
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(text(statement), parameters).fetchone()
+    except Exception as fingerprint_error:
+        logger.warning(f"Failed to compute the schema fingerprint. Details:\n{fingerprint_error}")
+        return None
+
+    return ":".join(str(value) for value in row) if row else None
+
+
+class SchemaSnapshot:
+    """
+    Serialized schema of one database: table list, table info (DDL and sample rows), columns, table comments and sample values, filled in
+    table by table as they are requested.
+
+    The snapshot is written to `SCHEMA_CACHE_DIR/<connection key>.json` and is only reused while the schema fingerprint stays the same.
+    """
+
+    def __init__(self, path: Path, fingerprint: str | None) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.tables: list[str] = []
+        self.table_info: dict[str, str] = {}
+        self.columns: dict[str, list[dict[str, str]]] = {}
+        self.comments: dict[str, str] = {}
+        self.samples: dict[str, list[str]] = {}
+        self.lock = threading.RLock()
+
+    @classmethod
+    def load(cls, path: Path, fingerprint: str | None) -> "SchemaSnapshot":
+        """
+        Loads the snapshot stored at `path` if it matches the fingerprint, otherwise returns an empty snapshot.
+
+        Args:
+            path (Path): Location of the snapshot file.
+            fingerprint (str | None): The current schema fingerprint of the database.
+
+        Returns:
+            SchemaSnapshot: The loaded or empty snapshot.
+        """
+        snapshot = cls(path, fingerprint)
+        if fingerprint is None or not path.exists():
+            return snapshot
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as load_error:
+            logger.warning(f"Ignoring unreadable schema snapshot {path.name}. Details:\n{load_error}")
+            return snapshot
+        if data.get("fingerprint") == fingerprint:
+            snapshot.tables = data.get("tables", [])
+            snapshot.table_info = data.get("table_info", {})
+            snapshot.columns = data.get("columns", {})
+            snapshot.comments = data.get("comments", {})
+            snapshot.samples = data.get("samples", {})
+            logger.info(f"Schema snapshot reused ({len(snapshot.table_info)} tables described).")
+
+        return snapshot
+
+    def save(self) -> None:
+        """Atomically writes the snapshot to disk."""
+        if self.fingerprint is None:
+            return
+        with self.lock:
+            data = {
+                "fingerprint": self.fingerprint,
+                "tables": self.tables,
+                "table_info": self.table_info,
+                "columns": self.columns,
+                "comments": self.comments,
+                "samples": self.samples,
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(temporary_path, self.path)
+
+
+snapshots: dict[str, SchemaSnapshot] = {}
+snapshots_lock = threading.Lock()
+
+def get_snapshot(connection_key: str, fingerprint: str | None) -> SchemaSnapshot:
+    """
+    Returns the in-process snapshot of a database, loading it from disk or starting a new one when the fingerprint changed.
+
+    Sessions connected to the same database share the same snapshot object, so schema lookups are memoized across sessions.
+
+    Args:
+        connection_key (str): Identifier of the database connection.
+        fingerprint (str | None): The current schema fingerprint of the database.
+
+    Returns:
+        SchemaSnapshot: The snapshot to use.
+    """
+    with snapshots_lock:
+        snapshot = snapshots.get(connection_key)
+        if snapshot is None or fingerprint is None or snapshot.fingerprint != fingerprint:
+            snapshot = SchemaSnapshot.load(Path(SCHEMA_CACHE_DIR) / f"{connection_key}.json", fingerprint)
+            snapshots[connection_key] = snapshot
+
+    return snapshot
+
+def drop_snapshot(connection_key: str) -> None:
+    """Forgets the in-process snapshot of a database and deletes its file."""
+    with snapshots_lock:
+        snapshots.pop(connection_key, None)
+    (Path(SCHEMA_CACHE_DIR) / f"{connection_key}.json").unlink(missing_ok=True)
+
+
+class SnapshotSQLDatabase(SQLDatabase):
+    """
+    `SQLDatabase` that reflects tables lazily and serves table info (used by the `sql_db_schema` tool) from a schema snapshot.
+
+    Only the tables the agent actually asks for are reflected and sampled, once per schema version; every later request for the same table,
+    from any session on the same database, is answered from memory or from the snapshot file. While the schema fingerprint is unchanged,
+    connecting reads the table list from the snapshot instead of the database catalog.
+    """
+
+    def __init__(self, engine: Engine, connection_key: str, schema: Optional[str] = None) -> None:
+        self._connection_key = connection_key
+        # Reflection fills the MetaData table by table: concurrent questions must not read a table that is half reflected
+        self._reflection_lock = threading.RLock()
+        # Only set once the table list is known (`SQLDatabase.__init__` lists the usable tables)
+        self._snapshot: Optional[SchemaSnapshot] = None
+        snapshot = get_snapshot(connection_key, compute_schema_fingerprint(engine, schema))
+        with snapshot.lock:
+            tables = list(snapshot.tables)
+        if tables:
+            # Warm connect: the table list of the snapshot is used as is, the catalog is not queried. Same settings as the cold path
+            # (SQLDatabase defaults, lazy reflection)
+            self._engine = engine
+            self._schema = schema
+            self._inspector = inspect(engine)
+            self._all_tables = set(tables)
+            self._include_tables = set()
+            self._ignore_tables = set()
+            self._usable_tables = set(tables)
+            self._sample_rows_in_table_info = 3
+            self._indexes_in_table_info = False
+            self._custom_table_info = None
+            self._max_string_length = 300
+            self._view_support = False
+            self._metadata = MetaData()
+        else:
+            super().__init__(engine, schema=schema, lazy_table_reflection=True)
+            with snapshot.lock:
+                if not snapshot.tables:
+                    snapshot.tables = sorted(self._all_tables)
+                    snapshot.save()
+        self._snapshot = snapshot
+
+    @property
+    def connection_key(self) -> str:
+        """Identifier of the database connection."""
+        return self._connection_key
+
+    @property
+    def snapshot(self) -> SchemaSnapshot:
+        """
+        The schema snapshot backing this database: the one shared by every session on the same database, adopted as soon as another session
+        replaced it (schema refresh, or new connection after a schema change).
+        """
+        with snapshots_lock:
+            shared = snapshots.get(self._connection_key)
+        if shared is not None and shared is not self._snapshot:
+            with shared.lock:
+                tables = list(shared.tables)
+            # Not adopted until its table list is filled in
+            if tables:
+                with self._reflection_lock:
+                    self._inspector = inspect(self._engine)
+                    self._all_tables = set(tables)
+                    self._metadata = MetaData()
+                    self._snapshot = shared
+                logger.info(f"Schema snapshot replaced by another session adopted ({len(tables)} tables).")
+
+        return self._snapshot
+
+    def get_usable_table_names(self) -> List[str]:
+        """
+        Get names of tables available, restricted to the tables relevant to the question being answered when schema pruning selected some.
+
+        Returns:
+            List[str]: The sorted table names.
+        """
+        if self._snapshot is not None:
+            self.snapshot  # Adopts the snapshot of another session's schema refresh
+        tables = super().get_usable_table_names()
+        context = current_run.get()
+        if context is not None and context.relevant_tables is not None:
+            return sorted(set(tables) & set(context.relevant_tables))
+
+        return tables
+
+    def get_table_info(self, table_names: Optional[List[str]] = None) -> str:
+        """
+        Get information about specified tables (DDL and sample rows), from the snapshot whenever possible.
+
+        Args:
+            table_names (Optional[List[str]]): The tables to describe. Defaults to every usable table.
+
+        Returns:
+            str: The descriptions of the tables, separated by blank lines.
+
+        Raises:
+            ValueError: If one of the tables does not exist.
+        """
+        snapshot = self.snapshot
+        all_table_names = set(self._all_tables - self._ignore_tables) if not self._include_tables else set(self._include_tables)
+        if table_names is None:
+            table_names = sorted(all_table_names)
+        missing_tables = set(table_names).difference(all_table_names)
+        if missing_tables:
+            raise ValueError(f"table_names {missing_tables} not found in database")
+
+        with snapshot.lock:
+            to_describe = [name for name in table_names if name not in snapshot.table_info]
+        if to_describe:
+            described = {name: self._describe_table(name) for name in to_describe}
+            with snapshot.lock:
+                snapshot.table_info.update(described)
+            snapshot.save()
+
+        with snapshot.lock:
+            tables = sorted(snapshot.table_info[name] for name in dict.fromkeys(table_names))
+
+        return "\n\n".join(tables)
+
+    def get_table_columns(self, table_name: str) -> list[dict[str, str]]:
+        """
+        Lists the columns of a table, from the snapshot whenever possible.
+
+        Args:
+            table_name (str): The table to inspect.
+
+        Returns:
+            list[dict[str, str]]: One `{"name": ..., "type": ..., "comment": ...}` entry per column.
+        """
+        snapshot = self.snapshot
+        with snapshot.lock:
+            columns = snapshot.columns.get(table_name)
+        if columns is None:
+            columns = [
+                {"name": column["name"], "type": str(column["type"]), "comment": column.get("comment") or ""}
+                for column in self._inspector.get_columns(table_name, schema=self._schema)
+            ]
+            with snapshot.lock:
+                snapshot.columns[table_name] = columns
+            snapshot.save()
+
+        return columns
+
+    def get_table_comment(self, table_name: str) -> str:
+        """Returns the comment of a table ("" if none or if the DBMS does not support comments)."""
+        snapshot = self.snapshot
+        with snapshot.lock:
+            comment = snapshot.comments.get(table_name)
+        if comment is None:
+            try:
+                comment = self._inspector.get_table_comment(table_name, schema=self._schema).get("text") or ""
+            except NotImplementedError:
+                comment = ""
+            with snapshot.lock:
+                snapshot.comments[table_name] = comment
+
+        return comment
+
+    def get_sample_values(self, table_name: str, limit: int) -> list[str]:
+        """
+        Returns a few distinct text values found in the first rows of a table.
+
+        Args:
+            table_name (str): The table to sample.
+            limit (int): The number of rows to read.
+
+        Returns:
+            list[str]: The sampled values.
+        """
+        snapshot = self.snapshot
+        with snapshot.lock:
+            values = snapshot.samples.get(table_name)
+        if values is None:
+            # Qualified with the schema in use: connections do not carry its search path
+            statement = select(literal_column("*")).select_from(table(table_name, schema=self._schema)).limit(int(limit))
+            try:
+                with self._engine.connect() as connection:
+                    rows = connection.execute(statement).fetchall()
+            except SQLAlchemyError as sample_error:
+                logger.warning(f"Failed to sample the values of table {table_name}. Details:\n{sample_error}")
+                rows = []
+            values = sorted({str(value)[:50] for row in rows for value in row if isinstance(value, str) and value.strip()})
+            with snapshot.lock:
+                snapshot.samples[table_name] = values
+
+        return values
+
+    @contextmanager
+    def stream(self, command: str, fetch_size: int) -> Iterator[CursorResult]:
+        """
+        Executes a query with a server-side cursor, so that its rows can be fetched in batches without loading the whole result in memory.
+
+        Args:
+            command (str): The query to execute.
+            fetch_size (int): The number of rows buffered by the driver at a time.
+
+        Yields:
+            CursorResult: The open result, valid until the `with` block exits.
+        """
+        with self._engine.connect() as connection, connection.begin():
+            if self._schema is not None and self.dialect == "postgresql":
+                # Local to the transaction, so that the search path does not outlive it on the pooled connection
+                search_path = self._engine.dialect.identifier_preparer.quote_schema(self._schema)
+                connection.execute(text("SELECT set_config('search_path', :search_path, true)"), {"search_path": search_path})
+            yield connection.execution_options(stream_results=True, max_row_buffer=fetch_size).execute(text(command))
+
+    def _describe_table(self, table_name: str) -> str:
+        # Reflects the table and samples its rows, exactly as SQLDatabase does (against the full table list)
+        with self._reflection_lock, unscoped():
+            return super().get_table_info([table_name])
+
+    def refresh_schema(self) -> None:
+        """
+        Discards the snapshot and re-reads the table list from the database. The new snapshot replaces the shared one: the other sessions on
+        the same database adopt it on their next schema lookup.
+        """
+        drop_snapshot(self._connection_key)
+        with self._reflection_lock:
+            self._inspector = inspect(self._engine)
+            self._all_tables = set(
+                self._inspector.get_table_names(schema=self._schema)
+                + (self._inspector.get_view_names(schema=self._schema) if self._view_support else [])
+            )
+            self._metadata = MetaData()
+        self._snapshot = get_snapshot(self._connection_key, compute_schema_fingerprint(self._engine, self._schema))
+        with self._snapshot.lock:
+            self._snapshot.tables = sorted(self._all_tables)
+        self._snapshot.save()
+        logger.info(f"Schema snapshot rebuilt ({len(self._all_tables)} tables).")
@@ -0,0 +1,147 @@
+import math
+import re
+import threading
+from collections import Counter
+
+from loguru import logger
+
+from config.server_config import SCHEMA_INDEX_SAMPLE_ROWS, SCHEMA_TOP_N
+from API.run_context import unscoped
+from API.schema_cache import SchemaSnapshot, SnapshotSQLDatabase
+
+
+# Weight of each part of a table document: a match on the table name counts more than a match on a sample value
+FIELD_WEIGHTS = {"table": 3, "column": 2, "comment": 1, "value": 1}
+
+def tokenize(text: str) -> set[str]:
+    """Splits a question or an identifier into lowercase word tokens (snake_case and camelCase aware)."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+
+    return {token for token in re.split(r"[^a-z0-9]+", text.lower()) if len(token) > 2}
+
+def stem(tokens: set[str]) -> set[str]:
+    """Removes the plural mark of each token so that "orders" matches "order"."""
+    return {token.rstrip("s") for token in tokens}
+
+
+class SchemaIndex:
+    """
+    BM25 index of the tables of a database, built from table names, column names, comments and sample values.
+
+    Used to keep only the tables relevant to a question in the prompt and in the schema tools, so wide databases do not blow up the
+    number of tokens sent with every LLM call.
+    """
+
+    def __init__(self, documents: dict[str, Counter], k1: float = 1.2, b: float = 0.75) -> None:
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.lengths = {table: sum(terms.values()) for table, terms in documents.items()}
+        self.average_length = (sum(self.lengths.values()) / len(documents)) if documents else 0.0
+        frequencies = Counter(term for terms in documents.values() for term in terms)
+        self.idf = {
+            term: math.log(1 + (len(documents) - frequency + 0.5) / (frequency + 0.5)) for term, frequency in frequencies.items()
+        }
+
+    @classmethod
+    def build(cls, db: SnapshotSQLDatabase) -> "SchemaIndex":
+        """
+        Builds the index of every table of a database. Columns, comments and sample values are read through the schema snapshot.
+
+        Args:
+            db (SnapshotSQLDatabase): The connected database.
+
+        Returns:
+            SchemaIndex: The index.
+        """
+        documents = {}
+        with unscoped():
+            tables = db.get_usable_table_names()
+        for table in tables:
+            terms = Counter()
+            columns = db.get_table_columns(table)
+            fields = {
+                "table": [table],
+                "column": [column["name"] for column in columns],
+                "comment": [db.get_table_comment(table)] + [column.get("comment", "") for column in columns],
+                "value": db.get_sample_values(table, SCHEMA_INDEX_SAMPLE_ROWS),
+            }
+            for field, texts in fields.items():
+                for text in texts:
+                    for token in stem(tokenize(text)):
+                        terms[token] += FIELD_WEIGHTS[field]
+            documents[table] = terms
+        db.snapshot.save()
+        logger.info(f"Schema index built over {len(documents)} tables.")
+
+        return cls(documents)
+
+    def score(self, question: str) -> dict[str, float]:
+        """Returns the BM25 score of every table for a question."""
+        query = stem(tokenize(question))
+        scores = {}
+        for table, terms in self.documents.items():
+            normalization = self.k1 * (1 - self.b + self.b * self.lengths[table] / (self.average_length or 1))
+            scores[table] = sum(
+                self.idf[token] * terms[token] * (self.k1 + 1) / (terms[token] + normalization)
+                for token in query if token in terms
+            )
+
+        return scores
+
+    def select(self, question: str, limit: int = SCHEMA_TOP_N) -> list[str] | None:
+        """
+        Picks the tables most relevant to a question and logs which tables were included or excluded.
+
+        Args:
+            question (str): The question asked by the user.
+            limit (int): The maximum number of tables to keep.
+
+        Returns:
+            list[str] | None: The selected tables, or None if the schema is small enough to be kept whole or if no table matches the
+                question (the full schema is then exposed).
+        """
+        if limit <= 0 or len(self.documents) <= limit:
+            return None
+        scores = self.score(question)
+        ranked = sorted((table for table in scores if scores[table] > 0), key=lambda table: -scores[table])
+        if not ranked:
+            logger.info("Schema pruning skipped: no table matches the question.")
+            return None
+
+        included = ranked[:limit]
+        excluded = sorted(set(self.documents) - set(included))
+        logger.info(
+            f"Schema pruning kept {len(included)}/{len(self.documents)} tables: "
+            + ", ".join(f"{table} ({scores[table]:.2f})" for table in included)
+        )
+        logger.debug(f"Schema pruning excluded: {', '.join(f'{table} ({scores[table]:.2f})' for table in excluded)}")
+
+        return included
+
+
+indexes: dict[str, tuple[SchemaSnapshot, SchemaIndex]] = {}
+indexes_lock = threading.Lock()
+
+def get_schema_index(db: SnapshotSQLDatabase) -> SchemaIndex:
+    """
+    Returns the schema index of a database, building it on first use or when its schema snapshot was replaced (schema change or refresh).
+    Sessions connected to the same database share the same index.
+
+    Args:
+        db (SnapshotSQLDatabase): The connected database.
+
+    Returns:
+        SchemaIndex: The index.
+    """
+    snapshot = db.snapshot
+    with indexes_lock:
+        cached = indexes.get(db.connection_key)
+    if cached is not None and cached[0] is snapshot:
+        return cached[1]
+
+    index = SchemaIndex.build(db)
+    with indexes_lock:
+        indexes[db.connection_key] = (snapshot, index)
+
+    return index
@@ -1,31 +1,170 @@
+import asyncio
+import json
+import os
+import secrets
+import shutil
+import time
+from contextlib import asynccontextmanager
+from typing import Any
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from fastapi.responses import Response, StreamingResponse
 from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.server_config import (
+    API_WORKERS,
+    CANCEL_POLL_INTERVAL,
+    METRICS_DIR,
+    PROMETHEUS_MULTIPROC_DIR,
+    MAX_SESSIONS,
+    SESSION_IDLE_TTL,
+    MAX_CONCURRENT_QUERIES,
+    MAX_QUEUED_QUERIES,
+    QUERY_QUEUE_TIMEOUT,
+    BATCH_MAX_QUESTIONS,
+    BATCH_CONCURRENCY,
+    CONVERSATION_MAX_TOKENS,
+    CONVERSATION_MAX_TURNS,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_MAX_ENTRIES,
+    QUERY_COALESCING,
+    QUERY_MODE,
+    MODEL_ROUTING,
+    RESULT_PAGE_MAX_ROWS,
+    RESULT_EXPORT_TOKEN_TTL,
+    SETUP_JOB_TTL,
+    VALUE_INDEX_ENABLED
+)
+from langchain.agents.agent import AgentExecutor
+from langchain_openai import ChatOpenAI
 
+from API.admission import AdmissionController
 from API.agent import create_agent
+from API.answer_cache import AnswerCache, SQLRecorder, normalize_question
+from API.cancellation import CancellationHandler, RunRegistry
+from API.conversation import ConversationTurn, build_history, trim_history
 from API.custom_exceptions import (
     DatabaseURIError,
-    AuthenticationError,
-    HostPermissionError,
-    UnknownDatabaseError,
     NonExistentConnectionError,
-    InvalidAPIKey,
-    APIKeyNotFound,
-    AgentError
+    SessionNotFoundError,
+    SetupJobNotFoundError,
+    AgentError,
+    FastPathError,
+    ResultNotFoundError,
+    ResultExportError,
+    ServerBusyError,
+    QueryCancelledError
 )
-from API.database import connect_to_db
-from API.llm import setup_openai_api
-from API.log_config import configure_logging
+from API.database import connect_to_db, get_connection_key
+from API.engine_pool import engines
+from API.fast_path import FastPathPipeline
+from API.FSL_prompt import get_example_selector
+from API.llm import setup_openai_api, get_embeddings, get_small_llm
+from API.log_config import configure_logging, get_log_level, set_log_level
+from API.model_router import router
 from API.models import (
     DatabaseConnectionRequest,
+    SetupJobResponse,
+    SessionRequest,
     QueryRequest,
     QueryResponse,
+    BatchQueryRequest,
+    ResultPage,
+    ExportLink,
+    LogLevelRequest,
+)
+from API.result_store import EXPORT_MEDIA_TYPES, ResultSet, check_export_format, results, to_json_value
+from API.run_context import RunContext, run_context, unscoped
+from API.schema_cache import SnapshotSQLDatabase
+from API.schema_index import get_schema_index
+from API.session import Session, SessionRegistry
+from API.session_store import session_store
+from API.setup_jobs import SetupJob, SetupJobRegistry
+from API.single_flight import SingleFlight
+from API.sql_cache import read_tables, sql_cache
+from API.sql_validator import get_sqlglot_dialect
+from API.streaming import AgentEventStream
+from API.toolkit import LocalSQLDatabaseToolkit
+from API.tracing import QUERIES_RUNNING, QUERIES_WAITING, SESSIONS, TraceHandler
+from API.value_index import schedule_value_index
+
+
+sessions = SessionRegistry(max_sessions=MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL)
+setup_jobs = SetupJobRegistry(ttl=SETUP_JOB_TTL, store=session_store)
+admission = AdmissionController(
+    max_concurrent=MAX_CONCURRENT_QUERIES,
+    max_queued=MAX_QUEUED_QUERIES,
+    queue_timeout=QUERY_QUEUE_TIMEOUT
+)
+answer_cache = AnswerCache(
+    embed=lambda text: get_embeddings().embed_query(text),
+    ttl=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    store=session_store
 )
+in_flight = SingleFlight()
+session_rebuilds = SingleFlight(name="session rebuild")
+runs = RunRegistry(store=session_store)
+
+def report_load() -> None:
+    """Publishes the number of sessions and of running and waiting questions of this worker to the metrics."""
+    SESSIONS.set(len(sessions))
+    QUERIES_RUNNING.set(admission.running)
+    QUERIES_WAITING.set(admission.waiting)
+
+async def sweep_idle_sessions() -> None:
+    """
+    Periodically evicts sessions that have been idle for longer than the configured TTL, then disposes the engines left unused and deletes
+    the expired query results.
+    """
+    while True:
+        await asyncio.sleep(min(60, SESSION_IDLE_TTL))
+        sessions.evict_expired()
+        await asyncio.to_thread(session_store.evict_expired)
+        engines.dispose_idle()
+        await asyncio.to_thread(results.evict_expired)
 
+async def watch_worker() -> None:
+    """
+    Periodically publishes the load of this worker to the metrics, and cancels the questions it answers that were asked to stop through
+    another worker.
+    """
+    while True:
+        await asyncio.sleep(CANCEL_POLL_INTERVAL)
+        report_load()
+        try:
+            await runs.apply_cancel_requests()
+        except Exception as store_error:
+            logger.warning(f"Failed to read the cancellation requests from the session store. Details:\n{store_error}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Configures logging, runs the idle-session sweeper and the worker watcher while the server is up and releases every session of the
+    worker on shutdown.
+    """
+    configure_logging(__file__)
+    sweeper = asyncio.create_task(sweep_idle_sessions())
+    watcher = asyncio.create_task(watch_worker())
+    yield
+    sweeper.cancel()
+    watcher.cancel()
+    setup_jobs.cancel_all()
+    admission.shutdown()
+    sessions.close_all()
+    engines.dispose_all()
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+    await logger.complete()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:8501", # Development
@@ -41,67 +180,476 @@ app.add_middleware(
 
 HOST = "0.0.0.0"
 PORT = 8000
-connection_exists = False
 
-@app.post("/setup")
-async def initialize_resources(db_credentials: DatabaseConnectionRequest) -> str:
+# Steps of a setup job, in display order
+SETUP_STEPS = {
+    "database": "Connecting to the database",
+    "llm": "Connecting to OpenAI",
+    "examples": "Loading the few-shot examples",
+    "schema_index": "Indexing the schema",
+    "agent": "Building the query agent",
+}
+
+def build_pipelines(database: SnapshotSQLDatabase, llm: ChatOpenAI, dbms: str | None) -> tuple[AgentExecutor, FastPathPipeline]:
     """
-    Initializes and sets up the database connection, LLM resources, and query agent.
+    Builds the query agent and the single-shot pipeline of a new session.
 
     Args:
+        database (SnapshotSQLDatabase): The connected database.
+        llm (ChatOpenAI): The language model.
+        dbms (str | None): The DBMS selected at setup.
+
+    Returns:
+        tuple[AgentExecutor, FastPathPipeline]: The agent and the fast path, which share the same query tool.
+    """
+    toolkit = LocalSQLDatabaseToolkit(db=database, llm=llm, dbms=dbms)
+    agent_executor = create_agent(llm, toolkit)
+    query_tool = next(tool for tool in agent_executor.tools if tool.name == "sql_db_query")
+
+    return agent_executor, FastPathPipeline(llm, database, query_tool, dbms)
+
+def setup_error_status(setup_error: Exception) -> int:
+    """Returns the HTTP status matching a setup failure: 500 for server-side problems, 400 for invalid credentials or settings."""
+    return 500 if isinstance(setup_error, (DatabaseURIError, AgentError)) else 400
+
+async def run_setup(job: SetupJob, db_credentials: DatabaseConnectionRequest, session_id: str | None = None) -> None:
+    """
+    Runs the steps of a setup job and registers the new session once they all succeeded.
+
+    The database connection, the LLM check and the few-shot example index are independent and run concurrently. The schema index is
+    built as soon as the database is connected, and the agent as soon as the database, the LLM and the examples are ready. On failure the
+    job reports the first error right away, then waits for the other steps to finish and releases what they acquired. The value index is
+    built in the background once the session is ready.
+
+    New sessions are saved to the session store, so that the other workers can rebuild them.
+
+    Args:
+        job (SetupJob): The job to run.
         db_credentials (DatabaseConnectionRequest): Credentials and configuration for database connection.
+        session_id (str | None): The token of the session to rebuild from the session store, or None to set up a new session.
+    """
+    connection = asyncio.create_task(job.run_step("database", connect_to_db, db_credentials))
+    llm_check = asyncio.create_task(job.run_step("llm", setup_openai_api))
+    examples = asyncio.create_task(job.run_step("examples", get_example_selector))
+    steps = [connection, llm_check, examples]
+    try:
+        database = await connection
+        steps.append(asyncio.create_task(job.run_step("schema_index", get_schema_index, database)))
+        GPT4o_model = await llm_check
+        await examples
+        agent_executor, fast_path = await job.run_step("agent", build_pipelines, database, GPT4o_model, db_credentials.dbms)
+        await asyncio.gather(*steps)
+    except Exception as setup_error:
+        logger.error(f"Setup failed. Details:\n{setup_error}")
+        job.fail(str(setup_error), setup_error_status(setup_error))
+        await asyncio.gather(*steps, return_exceptions=True)
+        if connection.done() and not connection.cancelled() and connection.exception() is None:
+            engines.release(connection.result()._engine)
+        return
+
+    connection_key = get_connection_key(db_credentials)
+    session = sessions.create(database, GPT4o_model, agent_executor, connection_key, fast_path, session_id)
+    if session_id is None:
+        try:
+            await asyncio.to_thread(session_store.save, session.session_id, connection_key, db_credentials)
+        except Exception as store_error:
+            # The session still works on this worker, only the other workers cannot rebuild it
+            logger.error(f"Failed to save session {session.session_id[:8]} to the session store. Details:\n{store_error}")
+    job.succeed(session.session_id)
+    logger.success(f"Successfully connected to OpenAI. Session {session.session_id[:8]} created ({len(sessions)} active).")
+    if VALUE_INDEX_ENABLED:
+        # Reads the distinct values of every text column: the session does not wait for it
+        schedule_value_index(database)
+
+async def rebuild_session(session_id: str) -> Session:
+    """
+    Rebuilds a session set up by another worker (or before a restart) from its descriptor in the session store, running the same steps as
+    `/setup`. The schema snapshot and the example index are cached on disk, so a rebuild mostly costs the connection and the agent.
+
+    Args:
+        session_id (str): The session token.
 
     Returns:
-        str: "Success" if the setup is completed successfully.
+        Session: The rebuilt session, registered in this worker.
 
     Raises:
-        HTTPException: Raised if there are issues with the database connection, LLM initialization, or agent setup.
+        SessionNotFoundError: If the session is unknown or expired, or cannot be rebuilt.
     """
-    configure_logging(__file__)
+    stored = await asyncio.to_thread(session_store.load, session_id)
+    if stored is None:
+        raise SessionNotFoundError(
+            "Your session has expired or was closed. Please run the initial setup again."
+        )
+    job = SetupJob(SETUP_STEPS)
+    await run_setup(job, stored.credentials, session_id)
+    if job.status != "succeeded":
+        raise SessionNotFoundError(
+            f"Your session could not be restored: {job.detail} Please run the initial setup again."
+        )
+    logger.info(f"Session {session_id[:8]} rebuilt from the session store.")
+
+    return sessions.get(session_id)
+
+async def resolve_session(session_id: str | None) -> Session:
+    """
+    Looks up the session of a token in this worker, or rebuilds it from the session store if it lives in another worker.
+
+    Concurrent requests of a session that is being rebuilt wait for the same rebuild.
 
-    global connection_exists, database, GPT4o_model, agent_executor
+    Args:
+        session_id (str | None): The session token returned by `/setup`.
+
+    Returns:
+        Session: The session.
 
+    Raises:
+        SessionNotFoundError: If the session is unknown, expired or was closed through another worker.
+    """
     try:
-        database = connect_to_db(db_credentials)
-        connection_exists = True
-        GPT4o_model = setup_openai_api()
-        toolkit = SQLDatabaseToolkit(db=database, llm=GPT4o_model)
-        agent_executor = create_agent(GPT4o_model, toolkit)
-        logger.success("Successfully connected to GROQ.")
-        return "Success"
-    except (DatabaseURIError, AuthenticationError, HostPermissionError, UnknownDatabaseError, Exception) as db_error:
-        raise HTTPException(
-            status_code=(500 if type(db_error) == DatabaseURIError else 400),
-            detail=str(db_error)
-        )
-    except (InvalidAPIKey, APIKeyNotFound) as api_error:
-        raise HTTPException(
-            status_code=400,
-            detail=str(api_error)
+        session = sessions.get(session_id)
+    except SessionNotFoundError:
+        if not session_id:
+            raise
+        session, _ = await session_rebuilds.run(session_id, lambda: rebuild_session(session_id))
+        return session
+
+    if not await asyncio.to_thread(session_store.touch, session_id):
+        sessions.remove(session_id)
+        raise SessionNotFoundError(
+            "Your session has expired or was closed. Please run the initial setup again."
         )
-    except AgentError as agent_error:
+
+    return session
+
+def run_pipeline(session: Session, context: RunContext, mode: str, callbacks: list) -> dict:
+    """
+    Runs the selected query pipeline of a session. This function blocks and runs on the agent worker pool.
+
+    Simple questions, as classified by the model router, are first tried with the small model tier through the single-shot pipeline.
+    Otherwise, or if that fails, the large model answers: in "fast" mode the single-shot pipeline is tried first; if it cannot produce or
+    execute a query, the full agent answers instead. Every pipeline only sees the tables that schema pruning selected for the question.
+
+    Follow-up questions (with a conversation history) always go to the agent, which alone sees the history, together with the tables read
+    by the previous queries.
+
+    Args:
+        session (Session): The session the question belongs to.
+        context (RunContext): The state of the question, through which it can be cancelled.
+        mode (str): "agent" or "fast".
+        callbacks (list): Callback handlers for the run.
+
+    Returns:
+        dict: The pipeline output, with the answer under `output` and the stored result of the last query under `result_id`.
+
+    Raises:
+        QueryCancelledError: If the question was cancelled.
+    """
+    question = context.question
+    callbacks = [CancellationHandler(context), *callbacks]
+    with run_context(context):
+        context.raise_if_cancelled()
+        context.relevant_tables = get_schema_index(session.database).select(question)
+        if context.history and context.relevant_tables is not None:
+            context.relevant_tables = sorted(set(context.relevant_tables) | history_tables(session, context.history))
+        response = None
+        if MODEL_ROUTING and not context.history and session.fast_path is not None and router.classify(question, context.relevant_tables).tier == "small":
+            small_llm = get_small_llm()
+            if small_llm is not None:
+                response = run_fast_path(session, question, callbacks, "small", small_llm)
+        if response is None and not context.history and mode == "fast" and session.fast_path is not None:
+            response = run_fast_path(session, question, callbacks, "large")
+        if response is None:
+            context.raise_if_cancelled()
+            started = time.perf_counter()
+            inputs = {"input": question, "history": build_history(context.history)}
+            response = session.agent_executor.invoke(inputs, {"callbacks": callbacks})
+            router.record("large", time.perf_counter() - started, answered=True)
+
+        return {**response, "result_id": context.result_id}
+
+def history_tables(session: Session, history: list[ConversationTurn]) -> set[str]:
+    """
+    Lists the tables read by the SQL of previous questions, so that a follow-up question can reuse them whatever schema pruning selects.
+
+    Args:
+        session (Session): The session the questions belong to.
+        history (list[ConversationTurn]): The previous questions the question follows up on.
+
+    Returns:
+        set[str]: The names of the tables, as the database spells them.
+    """
+    with unscoped():
+        tables = {table.lower(): table for table in session.database.get_usable_table_names()}
+    dialect = get_sqlglot_dialect(session.database.dialect)
+    used = set()
+    for turn in history:
+        parsed = read_tables(turn.sql, dialect) if turn.sql is not None else None
+        if parsed is not None:
+            used.update(tables[name] for name in parsed[1] if name in tables)
+
+    return used
+
+def run_fast_path(session: Session, question: str, callbacks: list, tier: str, llm: ChatOpenAI | None = None) -> dict | None:
+    """
+    Tries to answer a question with the single-shot pipeline of a session and records the outcome for the model router.
+
+    Args:
+        session (Session): The session the question belongs to.
+        question (str): The question asked by the user.
+        callbacks (list): Callback handlers for the run.
+        tier (str): The model tier used ("small" or "large").
+        llm (ChatOpenAI | None): The model of the tier, if it is not the session's own.
+
+    Returns:
+        dict | None: The pipeline output, or None if the pipeline failed and the question must be escalated.
+    """
+    started = time.perf_counter()
+    try:
+        response = session.fast_path.invoke(question, callbacks, llm)
+    except FastPathError as fast_path_error:
+        router.record(tier, time.perf_counter() - started, answered=False)
+        logger.warning(f"Fast path failed with the {tier} model, escalating. Details:\n{fast_path_error}")
+        return None
+    router.record(tier, time.perf_counter() - started, answered=True)
+
+    return response
+
+async def answer_question(
+    session: Session,
+    question: str,
+    mode: str | None = None,
+    callbacks: list | None = None,
+    follow_up: bool = False,
+    remember: bool = True
+) -> QueryResponse:
+    """
+    Answers a question from the answer cache, or by running a query pipeline of the session on the worker pool.
+
+    A follow-up question is answered by the agent with the last questions of the session, their SQL and results (see `ConversationTurn`),
+    so that it can adapt the previous query in one step. Its answer depends on that history: it is neither looked up in nor stored to the
+    answer cache, and it is never coalesced with the same question from another session.
+
+    Concurrent identical questions (same database, same normalized question, same pipeline, both follow-ups or not, both streamed or not)
+    share a single run: later ones wait for the run in flight and get its answer and result. They do not receive its intermediate events.
+
+    Cancelling the calling task (client disconnect or explicit cancel) cancels the run, once no other caller is waiting for it.
+
+    Every question is traced (LLM, tool and SQL timings, see `TraceHandler`); the answer carries the id of the trace of the run that
+    produced it. Log records emitted while answering carry the session and trace ids.
+
+    Args:
+        session (Session): The session the question belongs to.
+        question (str): The question asked by the user.
+        mode (str | None): The pipeline to use ("agent" or "fast"). Defaults to `QUERY_MODE`.
+        callbacks (list | None): Additional callback handlers for the run.
+        follow_up (bool): Whether the question builds on the previous questions of the session.
+        remember (bool): Whether the question is added to the conversation memory of the session, for later follow-ups.
+
+    Returns:
+        QueryResponse: The answer, flagged as cached when no agent run was needed.
+
+    Raises:
+        SessionNotFoundError: If the session was closed in the meantime.
+        ServerBusyError: If the worker pool cannot take the run.
+    """
+    mode = mode or QUERY_MODE
+    trace = TraceHandler()
+    # Session token prefix only: the full token grants access to the session
+    with logger.contextualize(session_id=session.session_id[:8], trace_id=trace.trace_id):
+        history = []
+        if follow_up and CONVERSATION_MAX_TURNS > 0:
+            turns = await asyncio.to_thread(session_store.load_turns, session.session_id)
+            history = trim_history(turns, CONVERSATION_MAX_TOKENS)
+            logger.info(f"Follow-up question, with {len(history)}/{len(turns)} previous question(s) as history.")
+        embedding = None
+        if ANSWER_CACHE_ENABLED and not history:
+            cached, embedding = await asyncio.to_thread(answer_cache.lookup, session.connection_key, question)
+            if cached is not None:
+                trace.finish("cached")
+                if remember:
+                    await remember_turn(session, ConversationTurn(question, cached.answer, cached.sql, cached.result))
+                return QueryResponse(output=cached.answer, cached=True, trace_id=trace.trace_id)
+
+        async def run() -> dict:
+            recorder = SQLRecorder(answer_cache, session.connection_key)
+            generation = await asyncio.to_thread(answer_cache.generation, session.connection_key)
+            context = RunContext(question, session.session_id)
+            context.history = history
+            try:
+                with session.use():
+                    response = await admission.run(run_pipeline, session, context, mode, [recorder, trace, *(callbacks or [])])
+            except asyncio.CancelledError:
+                # The worker thread cannot be interrupted: stop the run at its next step and interrupt its running statement
+                asyncio.get_running_loop().run_in_executor(None, context.cancel)
+                raise
+
+            if ANSWER_CACHE_ENABLED and recorder.cacheable and not history:
+                await asyncio.to_thread(
+                    answer_cache.store,
+                    session.connection_key,
+                    question,
+                    recorder.sql,
+                    recorder.result,
+                    response["output"],
+                    generation,
+                    embedding
+                )
+
+            return {**response, "sql": recorder.sql, "result": recorder.result, "trace_id": trace.trace_id}
+
+        coalesced = False
+        try:
+            if not QUERY_COALESCING or history:
+                response = await run()
+            else:
+                key = (session.connection_key, mode, follow_up, bool(callbacks), normalize_question(question))
+                response, coalesced = await in_flight.run(key, run)
+                if coalesced and response["result_id"] is not None:
+                    await asyncio.to_thread(results.share, response["result_id"], session.session_id)
+        except asyncio.CancelledError:
+            trace.finish("run", "cancelled")
+            raise
+        except Exception:
+            trace.finish("run", "error")
+            raise
+        trace.finish("coalesced" if coalesced else "run")
+        if remember:
+            await remember_turn(session, ConversationTurn(question, response["output"], response["sql"], response["result"]))
+
+        return QueryResponse(output=response["output"], result_id=response["result_id"], trace_id=response["trace_id"])
+
+async def remember_turn(session: Session, turn: ConversationTurn) -> None:
+    """Adds an answered question to the conversation memory of its session. A failure only costs the context of later follow-ups."""
+    if CONVERSATION_MAX_TURNS <= 0:
+        return
+    try:
+        await asyncio.to_thread(session_store.add_turn, session.session_id, turn)
+    except Exception as store_error:
+        logger.warning(f"Failed to store the question in the conversation memory. Details:\n{store_error}")
+
+@app.post("/setup", response_model=SetupJobResponse, status_code=202)
+async def initialize_resources(db_credentials: DatabaseConnectionRequest) -> SetupJobResponse:
+    """
+    Starts a background job that sets up the database connection, LLM resources, and query agent of a new session.
+
+    The job runs its steps concurrently; its progress is reported by `/setup/{job_id}`, which also returns the session token once the
+    setup is completed.
+
+    Args:
+        db_credentials (DatabaseConnectionRequest): Credentials and configuration for database connection.
+
+    Returns:
+        SetupJobResponse: The identifier and initial state of the job.
+    """
+    job = setup_jobs.create(SETUP_STEPS)
+    job.task = asyncio.create_task(run_setup(job, db_credentials))
+
+    return SetupJobResponse(**job.as_dict())
+
+@app.get("/setup/{job_id}", response_model=SetupJobResponse)
+async def get_setup_status(job_id: str) -> SetupJobResponse:
+    """
+    Reports the progress of a setup job.
+
+    Args:
+        job_id (str): The identifier returned by `/setup`.
+
+    Returns:
+        SetupJobResponse: The status and timing of every step, the session token once the setup succeeded, or the error if it failed.
+
+    Raises:
+        HTTPException: Raised if the job does not exist.
+    """
+    try:
+        job = await asyncio.to_thread(setup_jobs.get, job_id)
+    except SetupJobNotFoundError as job_error:
         raise HTTPException(
-            status_code=500,
-            detail=str(agent_error)
+            status_code=404,
+            detail=str(job_error)
         )
 
+    return SetupJobResponse(**job.as_dict())
+
+async def await_unless_disconnected(http_request: Request, task: asyncio.Task) -> Any:
+    """
+    Waits for the task answering a request, and cancels it if the client disconnects first.
+
+    Args:
+        http_request (Request): The request, whose body has already been read.
+        task (asyncio.Task): The task answering it.
+
+    Returns:
+        Any: The result of the task.
+
+    Raises:
+        QueryCancelledError: If the task was cancelled (client disconnect, `/query/{query_id}/cancel` or `/close-connection`).
+    """
+    disconnect = asyncio.create_task(http_request.receive())
+    try:
+        while not task.done():
+            await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnect.done() and not task.done():
+                if disconnect.result()["type"] == "http.disconnect":
+                    logger.info("Client disconnected, cancelling its question.")
+                    task.cancel()
+                    break
+                disconnect = asyncio.create_task(http_request.receive())
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        disconnect.cancel()
+
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if task.cancelled() and not asyncio.current_task().cancelling():
+            raise QueryCancelledError("The query was cancelled.") from None
+        raise
+
 @app.post("/query", response_model=QueryResponse)
-async def query_database(request: QueryRequest) -> QueryResponse:
+async def query_database(request: QueryRequest, http_request: Request) -> QueryResponse:
     """
-    Handles user queries by passing the input to the query agent and returning the result.
+    Handles user queries by passing the input to the query agent of the session and returning the result.
+
+    Answers to similar questions on the same database are served from the answer cache. Otherwise the agent run happens on the worker pool
+    of the admission controller, so the event loop keeps serving other requests meanwhile. The run is cancelled if the client disconnects,
+    cancels it with `/query/{query_id}/cancel` or closes its session.
 
     Args:
-        request (QueryRequest): Contains the user's query or question.
+        request (QueryRequest): Contains the session token and the user's query or question.
+        http_request (Request): The underlying HTTP request, watched for a client disconnect.
 
     Returns:
         QueryResponse: The generated answer or output from the query agent.
 
     Raises:
-        HTTPException: Raised if the query cannot be processed due to incomplete setup or unexpected errors.
+        HTTPException: Raised if the query cannot be processed due to incomplete setup, server overload, cancellation or unexpected errors.
     """
+    query_id = request.query_id or secrets.token_urlsafe(16)
     try:
-        response = agent_executor.invoke({"input": request.input})
-        return QueryResponse(output=response["output"])
+        session = await resolve_session(request.session_id)
+        answer = asyncio.create_task(answer_question(session, request.input, request.mode, follow_up=request.follow_up))
+        runs.register(session.session_id, query_id, answer)
+        response = await await_unless_disconnected(http_request, answer)
+        return response.model_copy(update={"query_id": query_id})
+    except QueryCancelledError as cancel_error:
+        raise HTTPException(
+            status_code=499,
+            detail=str(cancel_error)
+        )
+    except SessionNotFoundError as session_error:
+        logger.error(f"Failed to process query. Details:\n {session_error}")
+        raise HTTPException(
+            status_code=404,
+            detail=str(session_error)
+        )
+    except ServerBusyError as busy_error:
+        raise HTTPException(
+            status_code=503,
+            detail=str(busy_error),
+            headers={"Retry-After": str(busy_error.retry_after)}
+        )
     except Exception as setup_error:
         logger.error(f"Failed to process query. Details:\n {setup_error}")
         raise HTTPException(
@@ -109,28 +657,414 @@ async def query_database(request: QueryRequest) -> QueryResponse:
             detail="Database connection and LLM were not set up properly. Please ensure to run initial setup first."
         )
     
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest) -> StreamingResponse:
+    """
+    Streaming variant of `/query`.
+
+    Returns a newline-delimited JSON stream: every tool call of the agent (schema lookups, generated SQL, row counts) is pushed as soon
+    as it happens, followed by the tokens of the final answer and the complete answer itself. Errors that occur once the stream has
+    started are reported as an `error` event. The `start` event carries the query id; the run is cancelled if the client disconnects,
+    cancels it with `/query/{query_id}/cancel` or closes its session.
+
+    Args:
+        request (QueryRequest): Contains the session token and the user's query or question.
+
+    Returns:
+        StreamingResponse: The `application/x-ndjson` event stream.
+
+    Raises:
+        HTTPException: Raised if the session does not exist.
+    """
+    try:
+        session = await resolve_session(request.session_id)
+    except SessionNotFoundError as session_error:
+        logger.error(f"Failed to process query. Details:\n {session_error}")
+        raise HTTPException(
+            status_code=404,
+            detail=str(session_error)
+        )
+
+    query_id = request.query_id or secrets.token_urlsafe(16)
+    stream = AgentEventStream(asyncio.get_running_loop())
+
+    async def run_agent() -> None:
+        try:
+            response = await answer_question(session, request.input, request.mode, [stream], follow_up=request.follow_up)
+            stream.finish(response.output, cached=response.cached, result_id=response.result_id, trace_id=response.trace_id)
+        except asyncio.CancelledError:
+            stream.fail("The query was cancelled.", cancelled=True)
+        except ServerBusyError as busy_error:
+            stream.fail(str(busy_error), retry_after=busy_error.retry_after)
+        except SessionNotFoundError as session_error:
+            stream.fail(str(session_error))
+        except Exception as query_error:
+            logger.error(f"Failed to process query. Details:\n {query_error}")
+            stream.fail("An error occurred while processing your question. Please try again.")
+
+    async def event_stream():
+        stream.start(query_id=query_id)
+        agent_run = asyncio.create_task(run_agent())
+        runs.register(session.session_id, query_id, agent_run)
+        try:
+            async for line in stream.events():
+                yield line
+            await agent_run
+        finally:
+            # The client disconnected before the end of the stream
+            agent_run.cancel()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest) -> StreamingResponse:
+    """
+    Answers a list of questions concurrently and streams each answer back as soon as it is ready.
+
+    Duplicate questions (same normalized text) are answered once. Every question runs on the pipelines of the session, which share its
+    schema snapshot, schema index and few-shot examples, and goes through the answer cache and the worker pool like `/query`. Batch
+    questions are independent: they are not added to the conversation memory that follow-up questions build on.
+
+    The response is a newline-delimited JSON stream: a `start` event with the number of questions, one `item` event per question (in
+    completion order, with its index in the request, the answer or error, and its duration), then a `summary` event. The `start` event
+    carries the query id of the batch: `/query/{query_id}/cancel` cancels the questions that are not answered yet.
+
+    Args:
+        request (BatchQueryRequest): Contains the session token, the questions and the parallelism.
+
+    Returns:
+        StreamingResponse: The `application/x-ndjson` event stream.
+
+    Raises:
+        HTTPException: Raised if the session does not exist or the batch is empty or too large.
+    """
+    try:
+        session = await resolve_session(request.session_id)
+    except SessionNotFoundError as session_error:
+        logger.error(f"Failed to process batch. Details:\n {session_error}")
+        raise HTTPException(
+            status_code=404,
+            detail=str(session_error)
+        )
+    if not request.inputs or len(request.inputs) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch must contain between 1 and {BATCH_MAX_QUESTIONS} questions."
+        )
+
+    # Indexes of the questions sharing the same normalized text, answered by the first one
+    duplicates: dict[str, list[int]] = {}
+    for index, question in enumerate(request.inputs):
+        duplicates.setdefault(normalize_question(question), []).append(index)
+    query_id = secrets.token_urlsafe(16)
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, MAX_CONCURRENT_QUERIES))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer_item(indexes: list[int]) -> list[dict]:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await answer_question(session, request.inputs[indexes[0]], request.mode, remember=False)
+                outcome = {
+                    "output": response.output,
+                    "cached": response.cached,
+                    "result_id": response.result_id,
+                    "trace_id": response.trace_id
+                }
+            except ServerBusyError as busy_error:
+                outcome = {"error": str(busy_error), "retry_after": busy_error.retry_after}
+            except asyncio.CancelledError:
+                outcome = {"error": "The query was cancelled.", "cancelled": True}
+            except SessionNotFoundError as session_error:
+                outcome = {"error": str(session_error)}
+            except Exception as query_error:
+                logger.error(f"Failed to process batch question. Details:\n {query_error}")
+                outcome = {"error": "An error occurred while processing this question."}
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        return [
+            {
+                "event": "item",
+                "index": index,
+                "input": request.inputs[index],
+                **outcome,
+                "duration_ms": duration_ms,
+                "duplicate_of": indexes[0] if index != indexes[0] else None,
+            }
+            for index in indexes
+        ]
+
+    async def event_stream():
+        started = time.perf_counter()
+        failed = 0
+        yield json.dumps({
+            "event": "start",
+            "query_id": query_id,
+            "total": len(request.inputs),
+            "unique": len(duplicates),
+            "concurrency": concurrency,
+        }) + "\n"
+        tasks = [asyncio.create_task(answer_item(indexes)) for indexes in duplicates.values()]
+        for task in tasks:
+            runs.register(session.session_id, query_id, task)
+        try:
+            for task in asyncio.as_completed(tasks):
+                for item in await task:
+                    failed += "error" in item
+                    yield json.dumps(item, default=str) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        logger.info(f"Batch of {len(request.inputs)} questions answered in {time.perf_counter() - started:.1f}s ({failed} failed).")
+        yield json.dumps({
+            "event": "summary",
+            "total": len(request.inputs),
+            "unique": len(duplicates),
+            "failed": failed,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/query/{query_id}/cancel")
+async def cancel_query(query_id: str, request: SessionRequest) -> str:
+    """
+    Cancels a question being answered: the agent run stops at its next step and its running statement is interrupted by the database.
+
+    Args:
+        query_id (str): The identifier of the question (from the request, the `start` event of a stream or the start of a batch).
+        request (SessionRequest): Contains the token of the session the question belongs to.
+
+    Returns:
+        str: "Success" if the question was cancelled.
+
+    Raises:
+        HTTPException: Raised if no question with this identifier is being answered for the session.
+    """
+    # The question may be answered by another worker, which is then asked to cancel it
+    if not runs.cancel(request.session_id, query_id) and not await asyncio.to_thread(
+        session_store.request_cancel, request.session_id, query_id
+    ):
+        raise HTTPException(
+            status_code=404,
+            detail="No question with this identifier is being answered. It may have already finished."
+        )
+
+    return "Success"
+
+async def open_result(result_id: str, session_id: str) -> ResultSet:
+    """
+    Returns a stored result of a session, spooling its rows first if they were not read yet.
+
+    Raises:
+        SessionNotFoundError: If the session is unknown or expired.
+        ResultNotFoundError: If the result does not exist or belongs to another session.
+        HTTPException: If the query of the result fails when it is run again.
+    """
+    session = await resolve_session(session_id)
+    result_set = await asyncio.to_thread(results.get, result_id, session_id)
+    try:
+        with session.use():
+            await asyncio.to_thread(results.materialize, result_set, session.database)
+    except SQLAlchemyError as query_error:
+        logger.error(f"Failed to spool result {result_id[:8]}. Details:\n{query_error}")
+        raise HTTPException(
+            status_code=500,
+            detail="The query of this result failed when it was run again to read all of its rows."
+        ) from query_error
+
+    return result_set
+
+def export_response(result_set: ResultSet, export_format: str) -> StreamingResponse:
+    """Streams a result as a file download."""
+    return StreamingResponse(
+        result_set.export(export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="result-{result_set.result_id[:8]}.{export_format}"'}
+    )
+
+@app.get("/results/{result_id}", response_model=ResultPage)
+async def read_result(
+    result_id: str,
+    session_id: str = Header(alias="X-Session-Id"),
+    after: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=RESULT_PAGE_MAX_ROWS)
+) -> ResultPage:
+    """
+    Returns one page of a stored query result, using keyset pagination. The first read of a result larger than its sample runs its query
+    again to store every row.
+
+    Args:
+        result_id (str): The identifier of the result, as returned with the answer.
+        session_id (str): The token of the session that ran the query, in the `X-Session-Id` header.
+        after (int): The `next_cursor` of the previous page (0 for the first page).
+        limit (int): The maximum number of rows of the page.
+
+    Returns:
+        ResultPage: The rows of the page and the cursor of the next one.
+
+    Raises:
+        HTTPException: Raised if the session or the result does not exist.
+    """
+    try:
+        result_set = await open_result(result_id, session_id)
+        rows, next_cursor = await asyncio.to_thread(result_set.page, after, limit)
+    except (SessionNotFoundError, ResultNotFoundError) as not_found_error:
+        raise HTTPException(
+            status_code=404,
+            detail=str(not_found_error)
+        )
+
+    return ResultPage(
+        result_id=result_id,
+        columns=result_set.columns,
+        rows=[[to_json_value(value) for value in row] for row in rows],
+        row_count=result_set.row_count,
+        truncated=result_set.truncated,
+        next_cursor=next_cursor
+    )
+
+@app.get("/results/{result_id}/export")
+async def export_result(result_id: str, session_id: str = Header(alias="X-Session-Id"), format: str = "csv") -> StreamingResponse:
+    """
+    Streams a whole stored query result as a file, chunk by chunk.
+
+    Args:
+        result_id (str): The identifier of the result, as returned with the answer.
+        session_id (str): The token of the session that ran the query, in the `X-Session-Id` header.
+        format (str): "csv", "arrow" (Arrow IPC stream) or "parquet".
+
+    Returns:
+        StreamingResponse: The exported file.
+
+    Raises:
+        HTTPException: Raised if the session or the result does not exist, or if the format is not available.
+    """
+    try:
+        check_export_format(format)
+        return export_response(await open_result(result_id, session_id), format)
+    except (SessionNotFoundError, ResultNotFoundError) as not_found_error:
+        raise HTTPException(
+            status_code=404,
+            detail=str(not_found_error)
+        )
+    except ResultExportError as export_error:
+        raise HTTPException(
+            status_code=400,
+            detail=str(export_error)
+        )
+
+@app.post("/results/{result_id}/export-link", response_model=ExportLink)
+async def create_export_link(result_id: str, session_id: str = Header(alias="X-Session-Id"), format: str = "csv") -> ExportLink:
+    """
+    Issues a single-use link to download a stored query result, so that a browser can stream the file straight from the API without the
+    session token in its URL.
+
+    Args:
+        result_id (str): The identifier of the result, as returned with the answer.
+        session_id (str): The token of the session that ran the query, in the `X-Session-Id` header.
+        format (str): "csv", "arrow" (Arrow IPC stream) or "parquet".
+
+    Returns:
+        ExportLink: The path of the download, valid once for `RESULT_EXPORT_TOKEN_TTL` seconds.
+
+    Raises:
+        HTTPException: Raised if the session or the result does not exist, or if the format is not available.
+    """
+    try:
+        check_export_format(format)
+        await open_result(result_id, session_id)
+        token = await asyncio.to_thread(results.create_export_token, result_id, session_id, format)
+    except (SessionNotFoundError, ResultNotFoundError) as not_found_error:
+        raise HTTPException(
+            status_code=404,
+            detail=str(not_found_error)
+        )
+    except ResultExportError as export_error:
+        raise HTTPException(
+            status_code=400,
+            detail=str(export_error)
+        )
+
+    return ExportLink(url=f"/exports/{token}", expires_in=RESULT_EXPORT_TOKEN_TTL)
+
+@app.get("/exports/{token}")
+async def download_export(token: str) -> StreamingResponse:
+    """
+    Streams the result of a single-use export link.
+
+    Args:
+        token (str): The token of the link, returned by `/results/{result_id}/export-link`.
+
+    Returns:
+        StreamingResponse: The exported file.
+
+    Raises:
+        HTTPException: Raised if the link is unknown, expired or already used, or if the result no longer exists.
+    """
+    try:
+        result_set, export_format = await asyncio.to_thread(results.redeem_export_token, token)
+        return export_response(result_set, export_format)
+    except ResultNotFoundError as not_found_error:
+        raise HTTPException(
+            status_code=404,
+            detail=str(not_found_error)
+        )
+
+@app.post("/schema/refresh")
+async def refresh_schema(request: SessionRequest) -> str:
+    """
+    Rebuilds the schema snapshot of the session's database, e.g. after tables were created or altered, or values added, outside of the
+    application. The value index is rebuilt in the background.
+
+    Args:
+        request (SessionRequest): Contains the token of the session.
+
+    Returns:
+        str: "Success" if the snapshot was rebuilt.
+
+    Raises:
+        HTTPException: Raised if the session does not exist.
+    """
+    try:
+        session = await resolve_session(request.session_id)
+        with session.use():
+            await asyncio.to_thread(session.database.refresh_schema)
+            if VALUE_INDEX_ENABLED:
+                schedule_value_index(session.database, refresh=True)
+        await asyncio.to_thread(answer_cache.invalidate, session.connection_key)
+        await asyncio.to_thread(sql_cache.invalidate, session.connection_key)
+        return "Success"
+    except SessionNotFoundError as session_error:
+        raise HTTPException(
+            status_code=404,
+            detail=str(session_error)
+        )
+
 @app.post("/close-connection")
-async def terminate_database_connection() -> str:
+async def terminate_database_connection(request: SessionRequest) -> str:
     """
-    Safely closes the active database connection and resets global resources.
+    Safely closes the database connection of a session and releases its resources.
 
-    Terminates the MySQL database connection and clears related global variables. 
+    Cancels every question of the session still being answered, removes the session from the registry and releases its database engine.
     Logs an error and raises an HTTP exception if no connection exists.
 
+    Args:
+        request (SessionRequest): Contains the token of the session to close.
+
     Returns:
         str: "Success" if the database connection is closed successfully.
 
     Raises:
         HTTPException: Raised if no active connection exists or if an error occurs during termination.
     """
-    global connection_exists, database, GPT4o_model, agent_executor
-
     try:
-        if not connection_exists:
+        runs.cancel_session(request.session_id)
+        await asyncio.to_thread(session_store.request_cancel, request.session_id)
+        removed = sessions.remove(request.session_id) is not None
+        if not await asyncio.to_thread(session_store.delete, request.session_id) and not removed:
             raise NonExistentConnectionError
-        database = None
-        connection_exists = False
-        agent_executor = None
+        await asyncio.to_thread(results.drop_session, request.session_id)
         logger.success("Database connection closed.")
         return "Success"
     except NonExistentConnectionError as nxt_conn_error:
@@ -140,5 +1074,92 @@ async def terminate_database_connection() -> str:
             detail="An error occurred while closing the database connection. Please ensure you have a connection available to be closed."
         )
 
+@app.get("/status")
+async def report_status() -> dict:
+    """
+    Reports the current load of the API worker serving the request (with several workers, each reports its own; stored results are
+    shared by every worker).
+
+    Returns:
+        dict: The number of active sessions, the queue depth, running count and wait times of the agent worker pool and the answer cache
+            counters, the state and checkout metrics of every connection pool, the number of stored query results, the routing
+            counters and latency of each model tier, the number of runs shared by identical questions, the SQL result cache counters and
+            the number of questions being answered and cancelled.
+    """
+    return {
+        "sessions": len(sessions),
+        "queries": admission.stats(),
+        "answer_cache": answer_cache.stats(),
+        "engines": engines.stats(),
+        "results": await asyncio.to_thread(results.stats),
+        "models": router.stats(),
+        "coalescing": in_flight.stats(),
+        "sql_cache": sql_cache.stats(),
+        "runs": runs.stats(),
+    }
+
+@app.get("/log-level")
+async def report_log_level() -> dict:
+    """
+    Reports the current log level of the server.
+
+    Returns:
+        dict: The minimum level of the logs.
+    """
+    return {"level": get_log_level()}
+
+@app.put("/log-level")
+async def change_log_level(request: LogLevelRequest) -> dict:
+    """
+    Changes the log level of the server without restarting it, e.g. to DEBUG while investigating an issue.
+
+    Args:
+        request (LogLevelRequest): The new level.
+
+    Returns:
+        dict: The minimum level of the logs.
+
+    Raises:
+        HTTPException: Raised if the level does not exist.
+    """
+    try:
+        level = set_log_level(request.level)
+    except ValueError as level_error:
+        raise HTTPException(
+            status_code=400,
+            detail=str(level_error)
+        )
+
+    return {"level": level}
+
+@app.get("/metrics")
+async def export_metrics() -> Response:
+    """
+    Exports the metrics of the server in the Prometheus text format: question, LLM call, tool call and SQL query latencies, token counts,
+    agent iterations per question, and the number of sessions and of running and waiting questions.
+
+    With several API workers, the metrics of every worker are aggregated (latencies and counters summed, gauges summed over the live
+    workers).
+
+    Returns:
+        Response: The metrics, to be scraped by Prometheus.
+    """
+    report_load()
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
-    uvicorn.run("server:app", host=HOST, port=PORT, reload=True)
+    if "API_WORKERS" not in os.environ:
+        uvicorn.run("server:app", host=HOST, port=PORT, reload=True)
+    else:
+        if API_WORKERS > 1 and not PROMETHEUS_MULTIPROC_DIR:
+            # The workers write their metrics to a fresh directory, aggregated by /metrics
+            shutil.rmtree(METRICS_DIR, ignore_errors=True)
+            METRICS_DIR.mkdir(parents=True)
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(METRICS_DIR)
+        # Production: no reloader
+        uvicorn.run("server:app", host=HOST, port=PORT, workers=API_WORKERS)
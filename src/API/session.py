@@ -0,0 +1,220 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+
+from langchain.agents.agent import AgentExecutor
+from langchain_community.utilities import SQLDatabase
+from langchain_openai import ChatOpenAI
+from loguru import logger
+
+from API.custom_exceptions import SessionNotFoundError
+from API.engine_pool import engines
+from API.fast_path import FastPathPipeline
+
+
+class Session:
+    """
+    Holds the resources owned by a single `/setup` call: the database connection, the language model and the query agent.
+
+    Every session carries its own lock. The lock guards the session state (in-flight counter, closed flag) so that a query and a close
+    request for the same session can never interleave in a way that disposes the engine while a query is still using it.
+    """
+
+    def __init__(
+        self,
+        database: SQLDatabase,
+        llm: ChatOpenAI,
+        agent_executor: AgentExecutor,
+        connection_key: str,
+        fast_path: FastPathPipeline | None = None,
+        session_id: str | None = None
+    ) -> None:
+        self.session_id = session_id or secrets.token_urlsafe(32)
+        self.connection_key = connection_key
+        self.database = database
+        self.llm = llm
+        self.agent_executor = agent_executor
+        self.fast_path = fast_path
+        self.lock = threading.RLock()
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.in_flight = 0
+        self.closed = False
+
+    @contextmanager
+    def use(self) -> Iterator["Session"]:
+        """
+        Marks the session as busy for the duration of the `with` block.
+
+        Yields:
+            Session: The session itself.
+
+        Raises:
+            SessionNotFoundError: If the session has already been closed or evicted.
+        """
+        with self.lock:
+            if self.closed:
+                raise SessionNotFoundError(
+                    "Your session has expired or was closed. Please run the initial setup again."
+                )
+            self.in_flight += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+                self.last_used = time.monotonic()
+                if self.closed and not self.in_flight:
+                    self._dispose()
+
+    def idle_for(self) -> float:
+        """Returns the number of seconds since the session was last used."""
+        return time.monotonic() - self.last_used
+
+    def close(self) -> None:
+        """
+        Closes the session. The engine is released right away if the session is idle, otherwise as soon as the last running query finishes.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if not self.in_flight:
+                self._dispose()
+
+    def _dispose(self) -> None:
+        self.agent_executor = None
+        self.fast_path = None
+        if self.database is not None:
+            engines.release(self.database._engine)
+            self.database = None
+        logger.info(f"Resources of session {self.session_id[:8]} released.")
+
+
+class SessionRegistry:
+    """
+    Process-wide registry of the sessions live in this worker (their descriptors are shared with the other workers by the session store).
+
+    Sessions are kept in least-recently-used order. The registry is capped at `max_sessions` entries and sessions that stay idle for longer
+    than `idle_ttl` seconds are evicted. Evicted sessions release their SQLAlchemy engine back to the engine registry.
+    """
+
+    def __init__(self, max_sessions: int, idle_ttl: float) -> None:
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(
+        self,
+        database: SQLDatabase,
+        llm: ChatOpenAI,
+        agent_executor: AgentExecutor,
+        connection_key: str,
+        fast_path: FastPathPipeline | None = None,
+        session_id: str | None = None
+    ) -> Session:
+        """
+        Registers a new session, evicting the least recently used ones if the registry is full.
+
+        Args:
+            database (SQLDatabase): The database connected during setup.
+            llm (ChatOpenAI): The language model used by the agent.
+            agent_executor (AgentExecutor): The query agent of the session.
+            connection_key (str): Identifier of the database, shared by every session connected to it.
+            fast_path (FastPathPipeline | None): The single-shot pipeline of the session.
+            session_id (str | None): The token of a session rebuilt from the session store. A new token is generated if omitted.
+
+        Returns:
+            Session: The newly registered session.
+        """
+        session = Session(database, llm, agent_executor, connection_key, fast_path, session_id)
+        evicted = []
+        with self._lock:
+            evicted.extend(self._pop_expired())
+            while len(self._sessions) >= self.max_sessions:
+                _, lru_session = self._sessions.popitem(last=False)
+                evicted.append(lru_session)
+            self._sessions[session.session_id] = session
+        for old_session in evicted:
+            logger.info(f"Session {old_session.session_id[:8]} evicted.")
+            old_session.close()
+
+        return session
+
+    def get(self, session_id: str | None) -> Session:
+        """
+        Looks up a session and marks it as most recently used.
+
+        Args:
+            session_id (str | None): The session token returned by `/setup`.
+
+        Returns:
+            Session: The matching session.
+
+        Raises:
+            SessionNotFoundError: If the token is unknown or the session has expired.
+        """
+        self.evict_expired()
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                raise SessionNotFoundError(
+                    "Your session has expired or was closed. Please run the initial setup again."
+                )
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+
+        return session
+
+    def remove(self, session_id: str | None) -> Session | None:
+        """
+        Removes a session from the registry and closes it.
+
+        Args:
+            session_id (str | None): The session token returned by `/setup`.
+
+        Returns:
+            Session | None: The removed session, or None if no session matched the token.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None) if session_id else None
+        if session is not None:
+            session.close()
+
+        return session
+
+    def evict_expired(self) -> None:
+        """Closes every session that has been idle for longer than the configured TTL."""
+        with self._lock:
+            expired = self._pop_expired()
+        for session in expired:
+            logger.info(f"Session {session.session_id[:8]} expired after {self.idle_ttl}s of inactivity.")
+            session.close()
+
+    def close_all(self) -> None:
+        """Closes every registered session (used on server shutdown)."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _pop_expired(self) -> list[Session]:
+        # Sessions are ordered by last use, so the expired ones are always at the front
+        expired = []
+        for session_id, session in list(self._sessions.items()):
+            if session.in_flight:
+                continue
+            if session.idle_for() < self.idle_ttl:
+                break
+            del self._sessions[session_id]
+            expired.append(session)
+
+        return expired
@@ -0,0 +1,385 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from cryptography.fernet import Fernet, InvalidToken
+from loguru import logger
+
+from config.server_config import (
+    CONVERSATION_MAX_TURNS,
+    SESSION_STORE_KEY,
+    SESSION_STORE_KEY_FILE,
+    SESSION_STORE_PATH,
+    SESSION_TOUCH_INTERVAL,
+    SETUP_JOB_TTL,
+    SESSION_IDLE_TTL
+)
+from API.conversation import ConversationTurn
+from API.custom_exceptions import SessionStoreKeyError
+from API.models import DatabaseConnectionRequest
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    connection_key TEXT NOT NULL,
+    credentials BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS setup_jobs (
+    job_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    token_hash TEXT NOT NULL,
+    turn BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversation_turns_session ON conversation_turns (token_hash, id);
+CREATE TABLE IF NOT EXISTS cache_generations (
+    scope TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    token_hash TEXT NOT NULL,
+    query_id TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (token_hash, query_id, pid)
+);
+"""
+
+def hash_token(token: str) -> str:
+    """Hashes a session token, so that the store never holds tokens that could be replayed."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def load_store_key() -> bytes:
+    """
+    Returns the key encrypting the store: `SESSION_STORE_KEY`, or the content of `SESSION_STORE_KEY_FILE`.
+
+    Every API worker reads the same key, so that any of them can decrypt the sessions set up by the others. The key is never generated nor
+    written beside the store, where it would protect nothing.
+
+    Returns:
+        bytes: The Fernet key.
+
+    Raises:
+        SessionStoreKeyError: If neither `SESSION_STORE_KEY` nor `SESSION_STORE_KEY_FILE` is set.
+        OSError: If `SESSION_STORE_KEY_FILE` cannot be read.
+    """
+    if SESSION_STORE_KEY:
+        return SESSION_STORE_KEY.encode("ascii")
+    if SESSION_STORE_KEY_FILE:
+        return Path(SESSION_STORE_KEY_FILE).read_bytes().strip()
+
+    raise SessionStoreKeyError(
+        "Neither SESSION_STORE_KEY nor SESSION_STORE_KEY_FILE is set. Set one of them to a key generated with "
+        "`cryptography.fernet.Fernet.generate_key()` (see the README)."
+    )
+
+
+class StoredSession:
+    """
+    Descriptor of a session, from which any worker can rebuild it.
+
+    Attributes:
+        connection_key (str): Identifier of the database of the session.
+        credentials (DatabaseConnectionRequest): The credentials the session was set up with.
+    """
+
+    def __init__(self, connection_key: str, credentials: DatabaseConnectionRequest) -> None:
+        self.connection_key = connection_key
+        self.credentials = credentials
+
+
+class SessionStore:
+    """
+    SQLite store shared by the API workers of a host, holding the descriptor and the conversation memory of every session, the state of
+    every setup job, the write generations of the caches and the questions being answered.
+
+    A session set up on one worker can then be rebuilt by any other worker receiving its requests, a setup job can be polled on any
+    worker, a write seen by one worker invalidates the caches of all of them and a question can be cancelled through any worker.
+
+    Sessions and runs are stored under the hash of their token and the credentials, like the setup job states (which hold the token of the
+    session they created) and the conversation turns, are encrypted. The database runs in WAL mode, so that reads never wait for the other
+    workers' writes.
+    """
+
+    def __init__(self, path: Path, idle_ttl: float, job_ttl: float) -> None:
+        self.path = Path(path)
+        self.idle_ttl = idle_ttl
+        self.job_ttl = job_ttl
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fernet = Fernet(load_store_key())
+        self._local = threading.local()
+        self._touched: dict[str, float] = {}
+        self._touched_lock = threading.Lock()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def save(self, session_id: str, connection_key: str, credentials: DatabaseConnectionRequest) -> None:
+        """
+        Stores the descriptor of a new session.
+
+        Args:
+            session_id (str): The session token.
+            connection_key (str): Identifier of the database of the session.
+            credentials (DatabaseConnectionRequest): The credentials the session was set up with.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (hash_token(session_id), connection_key, self._encrypt(credentials.model_dump()), now, now)
+            )
+        with self._touched_lock:
+            self._touched[session_id] = time.monotonic()
+
+    def load(self, session_id: str) -> StoredSession | None:
+        """
+        Reads the descriptor of a session.
+
+        Args:
+            session_id (str): The session token.
+
+        Returns:
+            StoredSession | None: The descriptor, or None if the session is unknown, expired or unreadable with the current key.
+        """
+        row = self._connect().execute(
+            "SELECT connection_key, credentials FROM sessions WHERE token_hash = ? AND last_used > ?",
+            (hash_token(session_id), time.time() - self.idle_ttl)
+        ).fetchone()
+        if row is None:
+            return None
+        credentials = self._decrypt(row[1])
+        if credentials is None:
+            return None
+
+        return StoredSession(row[0], DatabaseConnectionRequest(**credentials))
+
+    def touch(self, session_id: str) -> bool:
+        """
+        Checks that a session still exists (it may have been closed through another worker) and records its use, at most once every
+        `SESSION_TOUCH_INTERVAL` seconds per worker.
+
+        Args:
+            session_id (str): The session token.
+
+        Returns:
+            bool: Whether the session still exists.
+        """
+        token_hash = hash_token(session_id)
+        with self._touched_lock:
+            due = time.monotonic() - self._touched.get(session_id, float("-inf")) >= SESSION_TOUCH_INTERVAL
+            if due:
+                self._touched[session_id] = time.monotonic()
+        connection = self._connect()
+        if not due:
+            return connection.execute("SELECT 1 FROM sessions WHERE token_hash = ?", (token_hash,)).fetchone() is not None
+        with connection:
+            return connection.execute(
+                "UPDATE sessions SET last_used = ? WHERE token_hash = ?", (time.time(), token_hash)
+            ).rowcount > 0
+
+    def delete(self, session_id: str) -> bool:
+        """Deletes the descriptor of a closed session and returns whether it existed."""
+        token_hash = hash_token(session_id)
+        with self._connect() as connection:
+            deleted = connection.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash,)).rowcount > 0
+            connection.execute("DELETE FROM conversation_turns WHERE token_hash = ?", (token_hash,))
+        with self._touched_lock:
+            self._touched.pop(session_id, None)
+
+        return deleted
+
+    def add_turn(self, session_id: str, turn: ConversationTurn, max_turns: int = CONVERSATION_MAX_TURNS) -> None:
+        """
+        Appends a question answered in a session to its conversation memory, and forgets the turns older than the last `max_turns`.
+
+        Args:
+            session_id (str): The session token.
+            turn (ConversationTurn): The question, its answer, SQL and result.
+            max_turns (int): The number of turns kept per session.
+        """
+        token_hash = hash_token(session_id)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO conversation_turns (token_hash, turn, created_at) VALUES (?, ?, ?)",
+                (token_hash, self._encrypt(turn.as_dict()), time.time())
+            )
+            connection.execute(
+                "DELETE FROM conversation_turns WHERE token_hash = ? AND id NOT IN "
+                "(SELECT id FROM conversation_turns WHERE token_hash = ? ORDER BY id DESC LIMIT ?)",
+                (token_hash, token_hash, max_turns)
+            )
+
+    def load_turns(self, session_id: str, limit: int = CONVERSATION_MAX_TURNS) -> list[ConversationTurn]:
+        """
+        Reads the conversation memory of a session.
+
+        Args:
+            session_id (str): The session token.
+            limit (int): The maximum number of turns returned.
+
+        Returns:
+            list[ConversationTurn]: The last `limit` turns, oldest first.
+        """
+        rows = self._connect().execute(
+            "SELECT turn FROM conversation_turns WHERE token_hash = ? ORDER BY id DESC LIMIT ?", (hash_token(session_id), limit)
+        ).fetchall()
+        states = (self._decrypt(row[0]) for row in reversed(rows))
+
+        return [ConversationTurn.from_dict(state) for state in states if state is not None]
+
+    def save_job(self, job_id: str, version: int, state: dict[str, Any]) -> None:
+        """
+        Stores the state of a setup job, unless a more recent state was already stored (steps finish concurrently).
+
+        Args:
+            job_id (str): The identifier of the job.
+            version (int): Increases with every change of the job.
+            state (dict[str, Any]): The state of the job, as returned by `/setup/{job_id}`.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO setup_jobs VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_id) DO UPDATE SET version = excluded.version, state = excluded.state, updated_at = excluded.updated_at "
+                "WHERE excluded.version > setup_jobs.version",
+                (job_id, version, self._encrypt(state), time.time())
+            )
+
+    def load_job(self, job_id: str) -> dict[str, Any] | None:
+        """Reads the state of a setup job, or returns None if the job is unknown or expired."""
+        row = self._connect().execute(
+            "SELECT state FROM setup_jobs WHERE job_id = ? AND updated_at > ?", (job_id, time.time() - self.job_ttl)
+        ).fetchone()
+
+        return self._decrypt(row[0]) if row is not None else None
+
+    def generation(self, scope: str) -> int:
+        """Returns the write generation of a cache scope (e.g. the answers of one connection), incremented on every invalidation."""
+        row = self._connect().execute("SELECT generation FROM cache_generations WHERE scope = ?", (scope,)).fetchone()
+
+        return row[0] if row is not None else 0
+
+    def generations(self, scopes: list[str]) -> tuple[int, ...]:
+        """Returns the write generations of several cache scopes, in order."""
+        placeholders = ", ".join("?" for _ in scopes)
+        rows = dict(self._connect().execute(
+            f"SELECT scope, generation FROM cache_generations WHERE scope IN ({placeholders})", scopes
+        ).fetchall())
+
+        return tuple(rows.get(scope, 0) for scope in scopes)
+
+    def bump_generations(self, scopes: list[str]) -> None:
+        """Increments the write generation of cache scopes, so that every worker stops serving the entries cached before."""
+        with self._connect() as connection:
+            connection.executemany(
+                "INSERT INTO cache_generations VALUES (?, 1) ON CONFLICT (scope) DO UPDATE SET generation = generation + 1",
+                [(scope,) for scope in scopes]
+            )
+
+    def register_run(self, session_id: str, query_id: str, pid: int) -> None:
+        """Records that a worker process is answering a question, so that it can be cancelled through the other workers."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, 0, ?)", (hash_token(session_id), query_id, pid, time.time())
+            )
+
+    def forget_run(self, session_id: str, query_id: str, pid: int) -> None:
+        """Records that a worker process is done answering a question."""
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM runs WHERE token_hash = ? AND query_id = ? AND pid = ?", (hash_token(session_id), query_id, pid)
+            )
+
+    def request_cancel(self, session_id: str, query_id: str | None = None) -> int:
+        """
+        Asks the workers answering a question (or every question of a session) to cancel it.
+
+        Args:
+            session_id (str): The session the question belongs to.
+            query_id (str | None): The identifier of the question. Defaults to every question of the session.
+
+        Returns:
+            int: The number of runs asked to stop (0 if no worker is answering the question).
+        """
+        with self._connect() as connection:
+            if query_id is None:
+                return connection.execute("UPDATE runs SET cancel_requested = 1 WHERE token_hash = ?", (hash_token(session_id),)).rowcount
+            return connection.execute(
+                "UPDATE runs SET cancel_requested = 1 WHERE token_hash = ? AND query_id = ?", (hash_token(session_id), query_id)
+            ).rowcount
+
+    def take_cancel_requests(self, pid: int) -> set[tuple[str, str]]:
+        """
+        Reads the cancellations asked for the runs of a worker process, once.
+
+        Args:
+            pid (int): The process of the worker.
+
+        Returns:
+            set[tuple[str, str]]: The hashed session token and the identifier of every question to cancel.
+        """
+        with self._connect() as connection:
+            return set(connection.execute(
+                "UPDATE runs SET cancel_requested = 0 WHERE pid = ? AND cancel_requested = 1 RETURNING token_hash, query_id", (pid,)
+            ).fetchall())
+
+    def evict_expired(self) -> int:
+        """
+        Deletes the sessions unused for longer than the idle TTL on every worker with their conversation memory, the expired setup jobs and
+        the runs left behind by stopped workers.
+
+        Returns:
+            int: The number of deleted sessions.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            deleted = connection.execute("DELETE FROM sessions WHERE last_used <= ?", (now - self.idle_ttl,)).rowcount
+            connection.execute("DELETE FROM setup_jobs WHERE updated_at <= ?", (now - self.job_ttl,))
+            connection.execute("DELETE FROM conversation_turns WHERE token_hash NOT IN (SELECT token_hash FROM sessions)")
+            # No question runs for longer than a session stays idle
+            connection.execute("DELETE FROM runs WHERE started_at <= ?", (now - self.idle_ttl,))
+        with self._touched_lock:
+            # Forget the sessions this worker has not touched for a whole TTL
+            for session_id, touched_at in list(self._touched.items()):
+                if time.monotonic() - touched_at > self.idle_ttl:
+                    del self._touched[session_id]
+        if deleted:
+            logger.info(f"{deleted} expired session(s) deleted from the session store.")
+
+        return deleted
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread: SQLite connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+
+        return connection
+
+    def _encrypt(self, value: dict[str, Any]) -> bytes:
+        return self._fernet.encrypt(json.dumps(value).encode("utf-8"))
+
+    def _decrypt(self, token: bytes) -> dict[str, Any] | None:
+        try:
+            return json.loads(self._fernet.decrypt(token))
+        except InvalidToken:
+            logger.warning("Session store entry encrypted with another key, ignored.")
+            return None
+
+
+session_store = SessionStore(SESSION_STORE_PATH, idle_ttl=SESSION_IDLE_TTL, job_ttl=SETUP_JOB_TTL)
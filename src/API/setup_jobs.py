@@ -0,0 +1,231 @@
+import asyncio
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from loguru import logger
+
+from API.custom_exceptions import SetupJobNotFoundError
+
+
+class SetupStep:
+    """
+    Progress of one step of a setup job.
+
+    Attributes:
+        name (str): Identifier of the step.
+        label (str): Description shown to the user.
+        status (str): "pending", "running", "done", "failed" or "cancelled" (when another step failed first).
+        duration (float | None): Seconds the step took, once finished.
+        error (str | None): The error message if the step failed.
+    """
+
+    def __init__(self, name: str, label: str) -> None:
+        self.name = name
+        self.label = label
+        self.status = "pending"
+        self.duration: float | None = None
+        self.error: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "label": self.label,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "error": self.error,
+        }
+
+
+class SetupJob:
+    """
+    A `/setup` request running in the background, made of independent steps that run concurrently on worker threads.
+
+    Attributes:
+        job_id (str): Unguessable identifier of the job, polled with `/setup/{job_id}`.
+        status (str): "running", "succeeded" or "failed".
+        steps (dict[str, SetupStep]): The steps of the job, in display order.
+        session_id (str | None): The token of the created session, once the job succeeded.
+        detail (str | None): The error message, if the job failed.
+        status_code (int | None): The HTTP status matching the error, if the job failed.
+    """
+
+    def __init__(self, steps: dict[str, str]) -> None:
+        self.job_id = secrets.token_urlsafe(16)
+        self.status = "running"
+        self.steps = {name: SetupStep(name, label) for name, label in steps.items()}
+        self.session_id: str | None = None
+        self.detail: str | None = None
+        self.status_code: int | None = None
+        self.created_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.task: asyncio.Task | None = None
+        self.version = 0
+        self.on_change: Callable[["SetupJob"], None] | None = None
+
+    @classmethod
+    def from_dict(cls, state: dict[str, Any]) -> "SetupJob":
+        """Rebuilds a read-only view of a job run by another worker, from the state it stored."""
+        job = cls({step["name"]: step["label"] for step in state["steps"]})
+        job.job_id = state["job_id"]
+        job.status = state["status"]
+        job.session_id = state["session_id"]
+        job.detail = state["detail"]
+        for step_state in state["steps"]:
+            step = job.steps[step_state["name"]]
+            step.status = step_state["status"]
+            step.duration = step_state["duration_ms"] / 1000 if step_state["duration_ms"] is not None else None
+            step.error = step_state["error"]
+
+        return job
+
+    async def run_step(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs one step on a worker thread and records its status and duration.
+
+        Args:
+            name (str): The step to run.
+            func (Callable[..., Any]): The blocking function of the step.
+            *args (Any): Arguments of the function.
+
+        Returns:
+            Any: The return value of the function.
+        """
+        step = self.steps[name]
+        step.status = "running"
+        self._changed()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(func, *args)
+        except asyncio.CancelledError:
+            step.status = "cancelled"
+            raise
+        except Exception as step_error:
+            step.status = "failed"
+            step.error = str(step_error)
+            raise
+        else:
+            step.status = "done"
+        finally:
+            step.duration = time.perf_counter() - started
+            self._changed()
+        logger.info(f"Setup step '{name}' done in {step.duration:.2f}s.")
+
+        return result
+
+    def succeed(self, session_id: str) -> None:
+        self.status = "succeeded"
+        self.session_id = session_id
+        self.finished_at = time.monotonic()
+        self._changed()
+
+    def fail(self, detail: str, status_code: int) -> None:
+        self.status = "failed"
+        self.detail = detail
+        self.status_code = status_code
+        self.finished_at = time.monotonic()
+        self._changed()
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "steps": [step.as_dict() for step in self.steps.values()],
+            "session_id": self.session_id,
+            "detail": self.detail,
+        }
+
+    def _changed(self) -> None:
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(self)
+
+
+class SetupJobRegistry:
+    """
+    Registry of the setup jobs. Finished jobs are kept for `ttl` seconds so that clients can collect their outcome.
+
+    With a session store, the state of every job is stored on each change, so that a job can be polled on any worker: jobs run by other
+    workers are read back from the store. Changes happen on the event loop, so their states are written by a background thread, in order.
+    """
+
+    def __init__(self, ttl: float, store: Any = None) -> None:
+        self.ttl = ttl
+        self.store = store
+        self._jobs: dict[str, SetupJob] = {}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="setup-job-store") if store is not None else None
+
+    def create(self, steps: dict[str, str]) -> SetupJob:
+        """
+        Registers a new job.
+
+        Args:
+            steps (dict[str, str]): The name and label of every step, in display order.
+
+        Returns:
+            SetupJob: The new job.
+        """
+        job = SetupJob(steps)
+        if self.store is not None:
+            job.on_change = self._save
+            job.on_change(job)
+        with self._lock:
+            self._evict_finished()
+            self._jobs[job.job_id] = job
+
+        return job
+
+    def get(self, job_id: str) -> SetupJob:
+        """
+        Returns a job. Blocking when the job is read back from the store.
+
+        Args:
+            job_id (str): The identifier of the job.
+
+        Returns:
+            SetupJob: The job.
+
+        Raises:
+            SetupJobNotFoundError: If the job is unknown or its outcome has expired.
+        """
+        with self._lock:
+            self._evict_finished()
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            state = self.store.load_job(job_id)
+            job = SetupJob.from_dict(state) if state is not None else None
+        if job is None:
+            raise SetupJobNotFoundError("Setup job not found. It may have expired; please run the setup again.")
+
+        return job
+
+    def cancel_all(self) -> None:
+        """Cancels the jobs that are still running."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+
+    def _save(self, job: SetupJob) -> None:
+        # The state is captured now: the job keeps changing while the write waits for its turn
+        version, state = job.version, job.as_dict()
+        self._writer.submit(self._write, job.job_id, version, state)
+
+    def _write(self, job_id: str, version: int, state: dict[str, Any]) -> None:
+        try:
+            self.store.save_job(job_id, version, state)
+        except Exception as store_error:
+            logger.warning(f"Failed to store the state of setup job {job_id[:8]}. Details:\n{store_error}")
+
+    def _evict_finished(self) -> None:
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and now - job.finished_at > self.ttl]:
+            del self._jobs[job_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
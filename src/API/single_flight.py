@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from loguru import logger
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight, further calls with the same key wait for it and share its
+    outcome (result or exception) instead of starting their own.
+
+    The in-flight call is shielded from the cancellation of any single caller, so that a client disconnecting does not abort the run the
+    other callers are waiting for; it is only cancelled once every caller is gone. It lives on the event loop, which serializes every
+    access to the in-flight calls.
+    """
+
+    def __init__(self, name: str = "question") -> None:
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self._waiters: dict[Hashable, int] = {}
+        self.runs = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Runs `func`, or joins the call already in flight for `key`.
+
+        Args:
+            key (Hashable): Identifies identical calls.
+            func (Callable[[], Awaitable[Any]]): Starts the call when none is in flight.
+
+        Returns:
+            tuple[Any, bool]: The outcome of the call, and whether it was shared with an earlier caller.
+        """
+        call = self._calls.get(key)
+        coalesced = call is not None
+        if coalesced:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            logger.info(f"Identical {self.name} already in flight, waiting for its outcome ({self.coalesced} coalesced so far).")
+        else:
+            self.runs += 1
+            call = asyncio.ensure_future(func())
+            self._calls[key] = call
+            self._waiters[key] = 1
+            call.add_done_callback(lambda done: self._forget(key, done))
+
+        try:
+            return await asyncio.shield(call), coalesced
+        except asyncio.CancelledError:
+            if not call.done() and self._calls.get(key) is call:
+                self._waiters[key] -= 1
+                if not self._waiters[key]:
+                    del self._calls[key]
+                    del self._waiters[key]
+                    call.cancel()
+            raise
+
+    def stats(self) -> dict[str, int]:
+        """Returns the number of calls in flight, the number of calls started and the number of duplicate calls that joined one."""
+        return {"in_flight": len(self._calls), "runs": self.runs, "coalesced": self.coalesced}
+
+    def _forget(self, key: Hashable, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            del self._waiters[key]
+        if not call.cancelled():
+            # Retrieve the exception so that it is not reported as unhandled when every caller is gone
+            call.exception()
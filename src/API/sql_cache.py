@@ -0,0 +1,319 @@
+import itertools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import sqlglot
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlglot import exp
+
+from config.server_config import SQL_CACHE_MAX_BYTES, SQL_CACHE_TTL
+from API.schema_cache import SnapshotSQLDatabase
+from API.session_store import session_store
+from API.sql_validator import get_sqlglot_dialect
+
+
+# Functions whose value changes between two executions of the same query
+NONDETERMINISTIC_FUNCTIONS = (exp.Rand, exp.CurrentTimestamp, exp.CurrentDate, exp.CurrentTime, exp.CurrentUser, exp.Uuid)
+
+# Cache key: connection, normalized query, the (table, change token) pairs of the tables it reads and the write generations of the
+# connection and of those tables
+CacheKey = tuple[str, str, tuple[tuple[str, str], ...], tuple[int, ...]]
+
+# Dedicated connection per SQLite database file, reading `PRAGMA data_version`, and the generation it was opened in
+data_version_readers: dict[str, tuple[int, sqlite3.Connection]] = {}
+data_version_readers_lock = threading.Lock()
+reader_generations = itertools.count()
+
+def read_data_version(path: str) -> str | None:
+    """
+    Reads `PRAGMA data_version` of a SQLite database, which changes whenever another connection (of this process or any other) commits
+    a change to the file.
+
+    The value is only comparable within one connection, so it is always read on the same read-only connection, kept open for the life
+    of the process. The token is prefixed with the generation of that connection, so that reopening it never repeats an old token.
+
+    Args:
+        path (str): The database file.
+
+    Returns:
+        str | None: The token, or None if the file cannot be read.
+    """
+    path = str(Path(path).resolve())
+    with data_version_readers_lock:
+        reader = data_version_readers.get(path)
+        try:
+            if reader is None:
+                connection = sqlite3.connect(f"{Path(path).as_uri()}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+                reader = data_version_readers[path] = (next(reader_generations), connection)
+            version = reader[1].execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error as version_error:
+            logger.warning(f"Failed to read the data version of {Path(path).name}. Details:\n{version_error}")
+            if reader is not None:
+                reader[1].close()
+            data_version_readers.pop(path, None)
+            return None
+
+    return f"{reader[0]}:{version}"
+
+def compute_change_tokens(engine: Engine, tables: set[str], schema: str | None = None) -> dict[str, str] | None:
+    """
+    Reads a cheap token per table that changes whenever rows of the table are inserted, updated or deleted.
+
+    - SQLite: `PRAGMA data_version` (see `read_data_version`). SQLite keeps no per-table counter, so the token covers the whole database.
+      Exact: every committed change is seen.
+    - PostgreSQL: tuple counters of `pg_stat_user_tables`, plus the relation file node, which changes on TRUNCATE. The counters are
+      reported by each backend at the end of its transaction and flushed to the statistics after a delay (up to about a second).
+    - MySQL: `UPDATE_TIME` in `information_schema.tables`, with the statistics cache disabled for the session. It only has a one-second
+      resolution and is NULL for tables not written since the server started (and for some storage engines): such tables get no token.
+
+    Changes the PostgreSQL and MySQL tokens miss are covered by the `SQL_CACHE_TTL` cap of every cache entry.
+
+    Args:
+        engine (Engine): The engine of the database.
+        tables (set[str]): The lowercased table names.
+        schema (str | None): The schema in use (PostgreSQL only).
+
+    Returns:
+        dict[str, str] | None: The token of every table, or None if one of them has no token (views, other schemas, in-memory
+            databases, unsupported DBMS), in which case results that read them must not be cached.
+    """
+    match engine.dialect.name:
+        case "sqlite":
+            path = engine.url.database
+            if not path or path == ":memory:":
+                return None
+            token = read_data_version(path)
+            return {table: token for table in tables} if token is not None else None
+        case "postgresql":
+            statement = (
+                "SELECT relname, pg_relation_filenode(relid), n_tup_ins, n_tup_upd, n_tup_del "
+                "FROM pg_stat_user_tables WHERE schemaname = :schema"
+            )
+            parameters = {"schema": schema or "public"}
+        case "mysql":
+            statement = (
+                "SELECT table_name, update_time FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE'"
+            )
+            parameters = {}
+        case _:
+            return None
+
+    try:
+        with engine.connect() as connection:
+            if engine.dialect.name == "mysql":
+                try:
+                    connection.execute(text("SET SESSION information_schema_stats_expiry = 0"))
+                except Exception:
+                    pass  # MySQL < 8.0 and MariaDB do not cache table statistics
+            rows = connection.execute(text(statement), parameters).fetchall()
+    except Exception as token_error:
+        logger.warning(f"Failed to read the table change tokens. Details:\n{token_error}")
+        return None
+
+    # A NULL update time (MySQL) carries no information: the table gets no token
+    versions = {str(row[0]).lower(): ":".join(str(value) for value in row[1:]) for row in rows if None not in row[1:]}
+    if not tables <= versions.keys():
+        return None
+
+    return {table: versions[table] for table in tables}
+
+def read_tables(sql: str, dialect: str | None) -> tuple[str, set[str]] | None:
+    """
+    Normalizes a query and lists the tables it reads.
+
+    Args:
+        sql (str): The query.
+        dialect (str | None): The sqlglot dialect of the database.
+
+    Returns:
+        tuple[str, set[str]] | None: The normalized query and the lowercased names of its tables, or None if the query cannot be parsed,
+            reads no table or calls a nondeterministic function.
+    """
+    try:
+        expression = sqlglot.parse_one(sql, read=dialect)
+    except sqlglot.errors.ParseError:
+        return None
+    if expression is None or expression.find(*NONDETERMINISTIC_FUNCTIONS) is not None:
+        return None
+    ctes = {cte.alias.lower() for cte in expression.find_all(exp.CTE)}
+    tables = {table.name.lower() for table in expression.find_all(exp.Table) if table.name} - ctes
+    if not tables:
+        return None
+
+    return expression.sql(dialect=dialect), tables
+
+def written_tables(sql: str, dialect: str | None) -> set[str] | None:
+    """
+    Lists the tables a write statement may touch: every table it names, conservatively.
+
+    Args:
+        sql (str): The statement.
+        dialect (str | None): The sqlglot dialect of the database.
+
+    Returns:
+        set[str] | None: The lowercased table names, or None if the statement cannot be parsed (every table must then be considered
+            modified).
+    """
+    try:
+        expressions = sqlglot.parse(sql, read=dialect)
+    except sqlglot.errors.ParseError:
+        return None
+    tables = {table.name.lower() for expression in expressions if expression for table in expression.find_all(exp.Table) if table.name}
+
+    return tables or None
+
+
+class CachedResult:
+    """Output of the query tool for a query, and the stored result it refers to."""
+
+    def __init__(self, output: str, result_id: str | None, tables: set[str], size: int) -> None:
+        self.output = output
+        self.result_id = result_id
+        self.tables = tables
+        self.size = size
+        self.created_at = time.monotonic()
+
+
+class SQLResultCache:
+    """
+    Cache of the query tool outputs, shared by every session and bounded by the total size of the cached outputs (least recently used
+    first out).
+
+    Entries are keyed on the dialect-normalized query and the current change token of every table it reads, so a query hits only while
+    none of its tables changed. Writes executed through the query tool invalidate the entries of the tables they touch right away, since
+    some change tokens are only updated after a delay; entries are never served more than `ttl` seconds after they were cached, which
+    bounds how long a write made outside the app can go unnoticed (see `compute_change_tokens`).
+
+    With a session store, invalidations bump write generations shared by the API workers, which are part of the key: the entries cached by
+    the other workers before a write are never served again either.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, store: Any = None) -> None:
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[CacheKey, CachedResult] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+
+    def key(self, db: SnapshotSQLDatabase, sql: str) -> CacheKey | None:
+        """
+        Computes the cache key of a query, reading the current change tokens and write generations of its tables.
+
+        Args:
+            db (SnapshotSQLDatabase): The database the query runs on.
+            sql (str): The query.
+
+        Returns:
+            CacheKey | None: The key, or None if the result of the query must not be cached.
+        """
+        parsed = read_tables(sql, get_sqlglot_dialect(db.dialect))
+        tokens = compute_change_tokens(db._engine, parsed[1], db._schema) if parsed is not None else None
+        if tokens is None:
+            with self._lock:
+                self.uncacheable += 1
+            return None
+
+        tokens = tuple(sorted(tokens.items()))
+        generations = self.store.generations(self._scopes(db.connection_key, [table for table, _ in tokens])) if self.store else ()
+
+        return db.connection_key, parsed[0], tokens, generations
+
+    def get(self, key: CacheKey) -> CachedResult | None:
+        """Returns the cached output of a query, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.created_at >= self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return entry
+
+    def put(self, key: CacheKey, output: str, result_id: str | None) -> None:
+        """
+        Caches the output of a query.
+
+        Args:
+            key (CacheKey): The key computed before the query ran.
+            output (str): The tool output.
+            result_id (str | None): The stored result the output refers to.
+        """
+        size = len(output.encode()) + len(key[1]) + 256
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CachedResult(output, result_id, {table for table, _ in key[2]}, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                self._size -= self._entries.popitem(last=False)[1].size
+                self.evictions += 1
+
+    def discard(self, key: CacheKey) -> None:
+        """Drops an entry whose stored result is gone."""
+        with self._lock:
+            self._remove(key)
+
+    def invalidate(self, connection_key: str, tables: set[str] | None = None) -> None:
+        """
+        Drops the entries of a connection, on every worker.
+
+        Args:
+            connection_key (str): The connection.
+            tables (set[str] | None): Only drop the entries reading one of these (lowercased) tables. Defaults to every entry.
+        """
+        if self.store is not None:
+            scopes = self._scopes(connection_key, sorted(tables or ()))
+            self.store.bump_generations(scopes[1:] if tables is not None else scopes[:1])
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if key[0] == connection_key and (tables is None or entry.tables & tables)
+            ]
+            for key in stale:
+                self._remove(key)
+        if stale:
+            logger.info(f"{len(stale)} cached query result(s) invalidated.")
+
+    def stats(self) -> dict[str, Any]:
+        """Returns the number and size of the cached outputs, and the hit, miss, uncacheable and eviction counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "evictions": self.evictions,
+            }
+
+    @staticmethod
+    def _scopes(connection_key: str, tables: list[str]) -> list[str]:
+        # The generation of the whole connection, then one per table
+        return [f"sql:{connection_key}"] + [f"sql:{connection_key}:{table}" for table in tables]
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+sql_cache = SQLResultCache(max_bytes=SQL_CACHE_MAX_BYTES, ttl=SQL_CACHE_TTL, store=session_store)
@@ -0,0 +1,68 @@
+import re
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+
+WRITE_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "MERGE", "REPLACE", "UPSERT", "TRUNCATE", "DROP", "ALTER", "CREATE", "RENAME", "GRANT", "REVOKE")
+
+# Statement types that modify the database. Command covers the statements sqlglot does not model (VACUUM, RENAME TABLE...)
+WRITE_EXPRESSIONS = (
+    exp.Insert,
+    exp.Update,
+    exp.Delete,
+    exp.Merge,
+    exp.Create,
+    exp.Drop,
+    exp.Alter,
+    exp.TruncateTable,
+    exp.Grant,
+    exp.Copy,
+    exp.LoadData,
+    exp.Command,
+)
+
+_COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+
+def strip_comments_and_literals(sql: str) -> str:
+    """
+    Removes comments and string literals from a SQL statement, so that keywords can be searched without false matches.
+
+    Args:
+        sql (str): The SQL statement.
+
+    Returns:
+        str: The statement with comments removed and string literals replaced by empty literals.
+    """
+    sql = _COMMENT_PATTERN.sub(" ", sql)
+
+    return _LITERAL_PATTERN.sub("''", sql)
+
+def is_write_statement(sql: str, dialect: str | None = None) -> bool:
+    """
+    Tells whether a SQL statement may modify the database (DML or DDL).
+
+    The statements are classified by their parsed type, so that functions named like keywords (e.g. `REPLACE()`) do not count as writes,
+    while data-modifying statements nested in a read (e.g. in a CTE) do. Statements that cannot be parsed are classified by their first
+    keyword.
+
+    Args:
+        sql (str): The SQL statement, or several statements separated by semicolons.
+        dialect (str | None): The sqlglot dialect of the database.
+
+    Returns:
+        bool: True if the statement may write to the database.
+    """
+    try:
+        expressions = sqlglot.parse(sql, read=dialect)
+    except ParseError:
+        statements = strip_comments_and_literals(sql).split(";")
+        return any(statement.split()[0].upper() in WRITE_KEYWORDS for statement in statements if statement.strip())
+
+    return any(
+        isinstance(expression, WRITE_EXPRESSIONS) or expression.find(*WRITE_EXPRESSIONS) is not None
+        for expression in expressions
+        if expression is not None
+    )
@@ -0,0 +1,150 @@
+import difflib
+from typing import Iterable
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, ParseError
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.schema import MappingSchema
+
+from API.run_context import unscoped
+from API.schema_cache import SnapshotSQLDatabase
+
+
+# DBMS names used by DatabaseConnectionRequest, and SQLAlchemy dialect names, mapped to sqlglot dialects
+SQLGLOT_DIALECTS = {
+    "MySQL": "mysql",
+    "PostgreSQL": "postgres",
+    "SQLite": "sqlite",
+    "mysql": "mysql",
+    "postgresql": "postgres",
+    "sqlite": "sqlite",
+}
+
+def get_sqlglot_dialect(dbms: str | None) -> str | None:
+    """Returns the sqlglot dialect matching a DBMS or SQLAlchemy dialect name (None lets sqlglot use its generic dialect)."""
+    return SQLGLOT_DIALECTS.get(dbms or "")
+
+def suggest(name: str, candidates: Iterable[str]) -> str:
+    """Builds a "did you mean" hint for a misspelled identifier."""
+    matches = difflib.get_close_matches(name.lower(), [candidate.lower() for candidate in candidates], n=3, cutoff=0.6)
+    lookup = {candidate.lower(): candidate for candidate in candidates}
+
+    return f" Did you mean: {', '.join(lookup[match] for match in matches)}?" if matches else ""
+
+def lowercase_identifiers(expression: exp.Expression) -> exp.Expression:
+    """Lowercases every identifier, for DBMS whose column names are case-insensitive."""
+    return expression.transform(
+        lambda node: exp.to_identifier(node.name.lower(), quoted=node.quoted) if isinstance(node, exp.Identifier) else node
+    )
+
+def check_write_columns(statement: exp.Expression, schema: dict[str, dict[str, str]], table_hint: str) -> list[str]:
+    """
+    Resolves the columns written or filtered by an INSERT, UPDATE or DELETE statement against its target table.
+
+    Columns inside subqueries are not checked, since they may belong to other tables.
+
+    Args:
+        statement (exp.Expression): The parsed statement, with identifiers already normalized like the schema.
+        schema (dict[str, dict[str, str]]): Columns of every table referenced by the statement.
+        table_hint (str): Human-readable list of the available columns.
+
+    Returns:
+        list[str]: One error per unknown column.
+    """
+    target = statement.this.this if isinstance(statement.this, exp.Schema) else statement.this
+    if not isinstance(target, exp.Table):
+        return []
+    target_columns = schema.get(target.name, {})
+
+    if isinstance(statement, exp.Insert):
+        names = [column.name for column in statement.this.expressions] if isinstance(statement.this, exp.Schema) else []
+    else:
+        names = [
+            column.name for column in statement.find_all(exp.Column)
+            if column.find_ancestor(exp.Select) is None and (not column.table or column.table == target.alias_or_name)
+        ]
+
+    return [
+        f"Column '{name}' does not exist in table '{target.name}'. Available columns: {table_hint}."
+        for name in dict.fromkeys(names) if name not in target_columns
+    ]
+
+def validate_sql(query: str, dialect: str | None, db: SnapshotSQLDatabase) -> list[str]:
+    """
+    Validates a SQL query locally: dialect-aware parsing, then resolution of every table and column against the reflected schema.
+
+    Args:
+        query (str): The SQL query to validate.
+        dialect (str | None): The sqlglot dialect to parse with.
+        db (SnapshotSQLDatabase): The database whose schema the query must match.
+
+    Returns:
+        list[str]: The problems found, each precise enough for the agent to fix the query. Empty if the query is valid.
+    """
+    try:
+        statements = [statement for statement in sqlglot.parse(query, read=dialect) if statement is not None]
+    except ParseError as parse_error:
+        return [
+            f"Syntax error at line {error['line']}, column {error['col']} near '{error['highlight']}': {error['description']}."
+            for error in parse_error.errors
+        ] or [f"Syntax error: {parse_error}"]
+    if not statements:
+        return ["The query is empty."]
+    if len(statements) > 1:
+        return ["Only one statement can be executed at a time. Split the query and run each statement separately."]
+    statement = statements[0]
+    if isinstance(statement, (exp.Alias, exp.Condition)) and not isinstance(statement, exp.Query):
+        return [f"Unrecognized statement: '{statement.sql(dialect=dialect)[:50]}'. Check the spelling of the first keyword."]
+
+    # Tables: everything referenced must exist, except CTEs defined by the query itself. Existence is checked against every table, not
+    # just those schema pruning selected for the question (a join target may have been left out); suggestions come from the selected ones
+    usable_tables = list(db.get_usable_table_names())
+    with unscoped():
+        all_tables = list(db.get_usable_table_names())
+    known_tables = {table.lower(): table for table in all_tables}
+    cte_names = {cte.alias_or_name.lower() for cte in statement.find_all(exp.CTE)}
+    referenced_tables = {}
+    errors = []
+    for table in statement.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            continue  # Table-valued functions
+        name = table.name
+        if name.lower() in cte_names:
+            continue
+        if name.lower() not in known_tables:
+            errors.append(f"Table '{name}' does not exist.{suggest(name, usable_tables)}")
+        else:
+            referenced_tables[known_tables[name.lower()]] = bool(table.args.get("db"))
+    if errors or not referenced_tables or any(referenced_tables.values()):
+        # Schema-qualified references are resolved by the database itself
+        return errors
+
+    # Columns: qualify the query against the columns of the referenced tables
+    case_sensitive = dialect == "postgres"
+    schema = {}
+    for table in referenced_tables:
+        columns = db.get_table_columns(table)
+        schema[table if case_sensitive else table.lower()] = {
+            (column["name"] if case_sensitive else column["name"].lower()): "TEXT" for column in columns
+        }
+    if not case_sensitive:
+        statement = lowercase_identifiers(statement)
+    table_hint = "; ".join(f"{table}({', '.join(columns)})" for table, columns in schema.items())
+
+    if isinstance(statement, (exp.Insert, exp.Update, exp.Delete)):
+        return check_write_columns(statement, schema, table_hint)
+    try:
+        qualify(
+            statement,
+            schema=MappingSchema(schema, dialect=dialect, normalize=not case_sensitive),
+            dialect=dialect,
+            validate_qualify_columns=True,
+        )
+    except OptimizeError as resolution_error:
+        errors.append(f"{str(resolution_error).rstrip('.')}. Available columns: {table_hint}.")
+    except Exception:
+        # Constructs the resolver does not support are left to the database
+        pass
+
+    return errors
@@ -0,0 +1,156 @@
+import ast
+import asyncio
+import json
+from typing import Any, AsyncIterator
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from API.result_store import split_summary
+
+
+# Labels shown to the user for each tool of the SQL toolkit
+TOOL_LABELS = {
+    "sql_db_list_tables": "Listing tables",
+    "sql_db_schema": "Looking up schema",
+    "sql_db_query_checker": "Checking SQL",
+    "sql_db_query": "Running SQL",
+}
+
+def count_result_rows(output: str) -> int | None:
+    """
+    Counts the rows of a result returned by the `sql_db_query` tool.
+
+    Args:
+        output (str): The stringified result (a list of tuples, or an empty string for statements without rows), possibly followed by a
+            line saying that only a sample is shown.
+
+    Returns:
+        int | None: The number of rows, or None if the output is an error message, cannot be parsed or is only a sample of the result.
+    """
+    output, partial = split_summary(output)
+    if partial:
+        return None
+    output = output.strip()
+    if not output:
+        return 0
+    if not output.startswith("["):
+        return None
+    try:
+        return len(ast.literal_eval(output))
+    except (ValueError, SyntaxError):
+        # Values such as Decimal('1.0') or datetime objects cannot be evaluated literally
+        return output.count("), (") + 1
+
+def extract_tool_input(input_str: str, inputs: dict | None) -> str:
+    """Returns the single argument passed to a SQL toolkit tool (query, table names...)."""
+    if inputs:
+        return str(next(iter(inputs.values()), ""))
+    try:
+        parsed = ast.literal_eval(input_str)
+        if isinstance(parsed, dict):
+            return str(next(iter(parsed.values()), ""))
+    except (ValueError, SyntaxError):
+        pass
+
+    return input_str
+
+
+class AgentEventStream(BaseCallbackHandler):
+    """
+    Callback handler that turns an agent run into a stream of NDJSON events.
+
+    The agent runs on a worker thread, so every callback hands its event over to the event loop thread-safely. Events are:
+    - `start`: sent as soon as the request is accepted.
+    - `tool_start` / `tool_end`: one pair per tool call, with the tool input (e.g. the generated SQL) and, for queries, the row count.
+    - `token`: a piece of the final answer, as generated by the model.
+    - `final`: the complete answer.
+    - `error`: the run failed; no further events follow.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tool_names: dict[UUID, str] = {}
+        self._parents: dict[UUID, UUID | None] = {}
+
+    def on_chain_start(self, serialized: dict[str, Any], inputs: dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+
+    def on_llm_start(self, serialized: dict[str, Any], prompts: list[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+
+    def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = serialized.get("name") or kwargs.get("name", "tool")
+        self._parents[run_id] = kwargs.get("parent_run_id")
+        self._tool_names[run_id] = name
+        self._emit({
+            "event": "tool_start",
+            "tool": name,
+            "label": TOOL_LABELS.get(name, name),
+            "input": extract_tool_input(input_str, kwargs.get("inputs")),
+        })
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        name = self._tool_names.pop(run_id, "tool")
+        output = str(getattr(output, "content", output))
+        event = {"event": "tool_end", "tool": name}
+        if name == "sql_db_query":
+            event["row_count"] = count_result_rows(output)
+            if output.startswith("Error"):
+                event["error"] = output[:500]
+        self._emit(event)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        name = self._tool_names.pop(run_id, "tool")
+        self._emit({"event": "tool_end", "tool": name, "error": str(error)[:500]})
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        # Chunks that only carry tool calls have no text content, and models called by a tool do not write the answer
+        if token and not self._inside_tool(run_id):
+            self._emit({"event": "token", "text": token})
+
+    def start(self, **extra: Any) -> None:
+        """Signals that the request has been accepted."""
+        self._emit({"event": "start", **extra})
+
+    def finish(self, output: str, **extra: Any) -> None:
+        """Sends the complete answer and closes the stream."""
+        self._emit({"event": "final", "output": output, **extra})
+        self._close()
+
+    def fail(self, detail: str, **extra: Any) -> None:
+        """Reports an error and closes the stream."""
+        self._emit({"event": "error", "detail": detail, **extra})
+        self._close()
+
+    async def events(self) -> AsyncIterator[str]:
+        """
+        Yields the events as NDJSON lines until the run finishes or fails.
+
+        Yields:
+            str: One JSON-encoded event followed by a newline.
+        """
+        while True:
+            event = await self._queue.get()
+            if event is None:
+                return
+            yield json.dumps(event, default=str) + "\n"
+
+    def _inside_tool(self, run_id: UUID) -> bool:
+        parent = self._parents.get(run_id)
+        while parent is not None:
+            if parent in self._tool_names:
+                return True
+            parent = self._parents.get(parent)
+
+        return False
+
+    def _emit(self, event: dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def _close(self) -> None:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
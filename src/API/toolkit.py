@@ -0,0 +1,161 @@
+from typing import List, Optional, Type
+
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import BaseSQLDatabaseTool, QuerySQLCheckerTool, QuerySQLDatabaseTool
+from langchain_core.callbacks import CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.server_config import SQL_CACHE_ENABLED, VALUE_INDEX_ENABLED
+from API.custom_exceptions import QueryBudgetError
+from API.query_guard import guard_query
+from API.result_store import results
+from API.run_context import current_run
+from API.sql_cache import sql_cache, written_tables
+from API.sql_utils import is_write_statement
+from API.sql_validator import get_sqlglot_dialect, validate_sql
+from API.value_index import get_value_index
+
+
+class LocalQueryCheckerInput(BaseModel):
+    query: str = Field(..., description="A detailed and SQL query to be checked.")
+
+
+class LocalQueryCheckerTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Checks a query locally instead of asking the LLM to proofread it.
+
+    The query is parsed for the dialect of the connected DBMS and its tables and columns are resolved against the reflected schema.
+    Errors are returned with their position and the available alternatives so that the agent can rewrite the query right away.
+    """
+
+    name: str = "sql_db_query_checker"
+    description: str = """
+    Use this tool to double check if your query is correct before executing it.
+    Always use this tool before executing a query with sql_db_query!
+    """
+    args_schema: Type[BaseModel] = LocalQueryCheckerInput
+    dbms: Optional[str] = None
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Validate the query and return either the query itself or the list of problems."""
+        errors = validate_sql(query, get_sqlglot_dialect(self.dbms or self.db.dialect), self.db)
+        if errors:
+            return "The query is invalid:\n" + "\n".join(f"- {error}" for error in errors) + "\nRewrite the query and check it again."
+
+        return query
+
+
+class ResultSetQueryInput(BaseModel):
+    query: str = Field(..., description="A detailed and correct SQL query.")
+
+
+class ResultSetQueryTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Executes a query and registers its result instead of handing every row to the LLM.
+
+    Only the first `RESULT_SAMPLE_ROWS` rows are read, which keeps large results out of the model context; the result store spools the
+    full result when the user first pages through or exports it (see `ResultSet`).
+    Before running, the estimated plan of the query is checked against the cost budget (see `guard_query`). Outputs are cached while the
+    tables read by the query do not change (see `SQLResultCache`), so repeated queries skip both the estimate and the execution.
+    Statements that modify the database are run as before, and invalidate the cached outputs of the tables they touch.
+    """
+
+    name: str = "sql_db_query"
+    description: str = """
+    Execute a SQL query against the database and get back the result..
+    If the query is not correct, an error message will be returned.
+    If an error is returned, rewrite the query, check the query, and try again.
+    """
+    args_schema: Type[BaseModel] = ResultSetQueryInput
+
+    def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Execute the query, store its result and return a sample of it, or an error message."""
+        context = current_run.get()
+        if is_write_statement(query, get_sqlglot_dialect(self.db.dialect)):
+            try:
+                return self.db.run_no_throw(query)
+            finally:
+                sql_cache.invalidate(self.db.connection_key, written_tables(query, get_sqlglot_dialect(self.db.dialect)))
+        if context is None:
+            return self.db.run_no_throw(query)
+
+        key = sql_cache.key(self.db, query) if SQL_CACHE_ENABLED else None
+        cached = sql_cache.get(key) if key is not None else None
+        if cached is not None:
+            if cached.result_id is None or results.share(cached.result_id, context.session_id):
+                context.result_id = cached.result_id
+                return cached.output
+            sql_cache.discard(key)
+
+        try:
+            query, note = guard_query(self.db, query)
+            result_set = results.create(context.session_id, self.db, query)
+        except (QueryBudgetError, SQLAlchemyError) as query_error:
+            return f"Error: {query_error}"
+        context.result_id = result_set.result_id if result_set is not None else None
+        output = result_set.summary(note) if result_set is not None else ""
+        if key is not None:
+            sql_cache.put(key, output, context.result_id)
+
+        return output
+
+
+class ValueLookupInput(BaseModel):
+    value: str = Field(..., description="The value as written in the question, e.g. 'NYC' or 'electronic'.")
+    table: Optional[str] = Field(None, description="Only search the values of this table.")
+
+
+class ValueLookupTool(BaseSQLDatabaseTool, BaseTool):
+    """
+    Finds how a value is spelled in the database, from the value index built after setup, without any database round trip.
+    """
+
+    name: str = "sql_db_value_lookup"
+    description: str = """
+    Input is a value mentioned in the question (a name, a place, a category, a status...), optionally with the table to search.
+    Output is the closest values stored in the database, with the table and column holding them.
+    Use this tool instead of SELECT DISTINCT queries to find the exact spelling of a value before filtering on it.
+    """
+    args_schema: Type[BaseModel] = ValueLookupInput
+
+    def _run(self, value: str, table: Optional[str] = None, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+        """Look the value up and return the matches, one per line."""
+        index = get_value_index(self.db.connection_key)
+        if index is None:
+            return "The value index is not available yet. Query the database to find the value."
+        matches = index.lookup(value, table)
+        if not matches:
+            return f"No value close to '{value}' was found in the text columns with few distinct values."
+
+        return "\n".join(f"{match.table}.{match.column} = '{match.value}' (similarity {match.score})" for match in matches)
+
+
+class LocalSQLDatabaseToolkit(SQLDatabaseToolkit):
+    """
+    SQL toolkit whose query checker validates queries locally, which saves one LLM round trip per question, whose query tool stores
+    results instead of returning them whole, and which resolves literal values from a local index.
+
+    Attributes:
+        dbms (str | None): The DBMS selected at setup ("MySQL", "PostgreSQL" or "SQLite"), which drives the parsing dialect.
+    """
+
+    dbms: Optional[str] = None
+
+    def get_tools(self) -> List[BaseTool]:
+        """
+        Get the tools in the toolkit, with the LLM-based query checker and the query tool replaced by the local ones, plus the value
+        lookup tool when the value index is enabled.
+        """
+        tools = []
+        for tool in super().get_tools():
+            if isinstance(tool, QuerySQLCheckerTool):
+                tool = LocalQueryCheckerTool(db=self.db, dbms=self.dbms, description=tool.description)
+            elif isinstance(tool, QuerySQLDatabaseTool):
+                tool = ResultSetQueryTool(db=self.db, description=tool.description)
+            tools.append(tool)
+        if VALUE_INDEX_ENABLED:
+            tools.append(ValueLookupTool(db=self.db))
+
+        return tools
@@ -0,0 +1,192 @@
+import threading
+import time
+from typing import Any
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from loguru import logger
+from prometheus_client import Counter, Gauge, Histogram
+
+from API.streaming import count_result_rows
+
+
+QUERY_DURATION = Histogram(
+    "doht_query_duration_seconds",
+    "Time to answer a question, by how it was answered (run, cached or coalesced) and outcome.",
+    ["source", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_DURATION = Histogram(
+    "doht_llm_call_duration_seconds",
+    "Latency of LLM calls, by model.",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40),
+)
+LLM_TOKENS = Counter("doht_llm_tokens", "Tokens sent to and generated by LLMs, by model and kind.", ["model", "kind"])
+TOOL_DURATION = Histogram(
+    "doht_tool_call_duration_seconds",
+    "Duration of agent tool calls, by tool and status.",
+    ["tool", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SQL_DURATION = Histogram(
+    "doht_sql_duration_seconds",
+    "Execution time of the queries run by the query tool (including the spooling of their result).",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SQL_ROWS = Histogram(
+    "doht_sql_result_rows",
+    "Rows returned by the queries run by the query tool.",
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000, 1000000),
+)
+AGENT_ITERATIONS = Histogram(
+    "doht_agent_iterations",
+    "Model calls made to answer a question (one per agent iteration).",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15),
+)
+# Summed over the live API workers when they share their metrics (PROMETHEUS_MULTIPROC_DIR)
+SESSIONS = Gauge("doht_sessions", "Sessions live in the API workers.", multiprocess_mode="livesum")
+QUERIES_RUNNING = Gauge("doht_queries_running", "Questions running on the agent worker pools.", multiprocess_mode="livesum")
+QUERIES_WAITING = Gauge("doht_queries_waiting", "Questions waiting for a free worker.", multiprocess_mode="livesum")
+
+def read_token_usage(response: LLMResult) -> tuple[int, int] | None:
+    """Returns the prompt and completion tokens of an LLM call, from the message usage metadata or the provider's token usage."""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+    return None
+
+
+class TraceHandler(BaseCallbackHandler):
+    """
+    Callback handler recording where the time of one question goes: every LLM call (latency, tokens), every tool call (name, duration)
+    and every SQL query (duration, rows), plus the number of model calls of the run.
+
+    Each measurement feeds the Prometheus metrics as it happens; `finish` logs the trace of the question under its `trace_id`.
+    """
+
+    def __init__(self) -> None:
+        self.trace_id = uuid4().hex
+        self.started = time.perf_counter()
+        self.llm_calls: list[dict[str, Any]] = []
+        self.tool_calls: list[dict[str, Any]] = []
+        self.queries: list[dict[str, Any]] = []
+        self._starts: dict[UUID, tuple[float, str]] = {}
+        self._parents: dict[UUID, UUID | None] = {}
+        self._tools: set[UUID] = set()
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized: dict[str, Any], inputs: dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+
+    def on_chat_model_start(self, serialized: dict[str, Any], messages: list, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_llm(run_id, kwargs)
+
+    def on_llm_start(self, serialized: dict[str, Any], prompts: list[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start_llm(run_id, kwargs)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started, model = self._starts.pop(run_id, (None, "unknown"))
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        usage = read_token_usage(response)
+        LLM_DURATION.labels(model).observe(seconds)
+        if usage is not None:
+            LLM_TOKENS.labels(model, "prompt").inc(usage[0])
+            LLM_TOKENS.labels(model, "completion").inc(usage[1])
+        with self._lock:
+            self.llm_calls.append({
+                "model": model,
+                "seconds": round(seconds, 4),
+                "prompt_tokens": usage[0] if usage else None,
+                "completion_tokens": usage[1] if usage else None,
+                "in_tool": self._inside_tool(run_id),
+            })
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts.pop(run_id, None)
+
+    def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+        self._tools.add(run_id)
+        self._starts[run_id] = (time.perf_counter(), serialized.get("name") or kwargs.get("name", "tool"))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        output = str(getattr(output, "content", output))
+        self._end_tool(run_id, "error" if output.startswith("Error") else "ok", output)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end_tool(run_id, "error", None)
+
+    def finish(self, source: str, outcome: str = "ok") -> dict[str, Any]:
+        """
+        Records the total duration of the question and logs its trace.
+
+        Args:
+            source (str): How the question was answered: "run", "cached" or "coalesced".
+            outcome (str): "ok", "error" or "cancelled".
+
+        Returns:
+            dict[str, Any]: The trace.
+        """
+        seconds = time.perf_counter() - self.started
+        QUERY_DURATION.labels(source, outcome).observe(seconds)
+        with self._lock:
+            iterations = sum(not call["in_tool"] for call in self.llm_calls)
+            trace = {
+                "trace_id": self.trace_id,
+                "source": source,
+                "outcome": outcome,
+                "seconds": round(seconds, 4),
+                "iterations": iterations,
+                "llm_calls": list(self.llm_calls),
+                "tool_calls": list(self.tool_calls),
+                "queries": list(self.queries),
+            }
+        if source == "run" and iterations:
+            AGENT_ITERATIONS.observe(iterations)
+        logger.info(
+            f"Trace {self.trace_id}: {source} ({outcome}) in {seconds:.2f}s, {iterations} model call(s), "
+            f"{sum(call['seconds'] for call in trace['llm_calls']):.2f}s in LLM calls, "
+            f"{sum(query['seconds'] for query in trace['queries']):.2f}s in {len(trace['queries'])} SQL query(ies)."
+        )
+
+        return trace
+
+    def _start_llm(self, run_id: UUID, kwargs: dict[str, Any]) -> None:
+        self._parents[run_id] = kwargs.get("parent_run_id")
+        parameters = kwargs.get("invocation_params") or {}
+        model = parameters.get("model_name") or parameters.get("model") or (kwargs.get("metadata") or {}).get("ls_model_name", "unknown")
+        self._starts[run_id] = (time.perf_counter(), model)
+
+    def _end_tool(self, run_id: UUID, status: str, output: str | None) -> None:
+        started, name = self._starts.pop(run_id, (None, "tool"))
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        TOOL_DURATION.labels(name, status).observe(seconds)
+        with self._lock:
+            self.tool_calls.append({"tool": name, "seconds": round(seconds, 4), "status": status})
+            if name == "sql_db_query" and status == "ok":
+                rows = count_result_rows(output)
+                SQL_DURATION.observe(seconds)
+                if rows is not None:
+                    SQL_ROWS.observe(rows)
+                self.queries.append({"seconds": round(seconds, 4), "rows": rows})
+
+    def _inside_tool(self, run_id: UUID) -> bool:
+        parent = self._parents.get(run_id)
+        while parent is not None:
+            if parent in self._tools:
+                return True
+            parent = self._parents.get(parent)
+
+        return False
@@ -0,0 +1,237 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from loguru import logger
+from sqlalchemy import column, select, table
+from sqlalchemy.exc import SQLAlchemyError
+
+from config.server_config import (
+    VALUE_INDEX_MAX_CARDINALITY,
+    VALUE_INDEX_SCAN_ROWS,
+    VALUE_INDEX_MAX_BYTES,
+    VALUE_INDEX_MAX_VALUE_LENGTH,
+    VALUE_INDEX_TOP_K
+)
+from API.run_context import unscoped
+from API.schema_cache import SnapshotSQLDatabase
+
+
+TEXT_TYPE_PATTERN = re.compile(r"CHAR|TEXT|STRING|ENUM|CLOB|CITEXT", re.IGNORECASE)
+MIN_SCORE = 0.3
+
+def normalize_value(value: str) -> str:
+    """Lowercases a value and strips accents and punctuation, so that "Saint-Étienne" and "saint etienne" compare equal."""
+    value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+
+    return " ".join(re.split(r"[^a-z0-9]+", value.lower())).strip()
+
+def trigrams(text: str) -> set[str]:
+    """Splits a normalized text into the trigrams of its words, padded as in PostgreSQL's pg_trgm ("ny" gives "  n", " ny", "ny ")."""
+    return {padded[i:i + 3] for word in text.split() for padded in [f"  {word} "] for i in range(len(padded) - 2)}
+
+def acronym(text: str) -> str | None:
+    """Returns the initials of a normalized multi-word text ("new york city" gives "nyc"), or None for a single word."""
+    words = text.split()
+
+    return "".join(word[0] for word in words) if len(words) > 1 else None
+
+
+class ValueMatch:
+    """
+    A value of the database matching a lookup.
+
+    Attributes:
+        table (str): The table holding the value.
+        column (str): The column holding the value.
+        value (str): The value, spelled as in the database.
+        score (float): How well it matches, from 0 to 1.
+    """
+
+    def __init__(self, table: str, column: str, value: str, score: float) -> None:
+        self.table = table
+        self.column = column
+        self.value = value
+        self.score = score
+
+
+class ValueIndex:
+    """
+    In-memory index of the distinct values of the low-cardinality text columns of a database.
+
+    Values are matched on their normalized form, then on trigram similarity (typos, partial names) and on initials ("NYC" finds
+    "New York City"), so that the agent can resolve how a value is spelled without querying the database.
+    """
+
+    def __init__(self, entries: list[tuple[str, str, str]]) -> None:
+        self.entries = entries
+        self.normalized = [normalize_value(value) for _, _, value in entries]
+        self.gram_counts = []
+        self.grams: dict[str, list[int]] = defaultdict(list)
+        self.acronyms: dict[str, list[int]] = defaultdict(list)
+        for position, normalized in enumerate(self.normalized):
+            grams = trigrams(normalized)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                self.grams[gram].append(position)
+            initials = acronym(normalized)
+            if initials is not None:
+                self.acronyms[initials].append(position)
+        self.sorted_acronyms = sorted(self.acronyms)
+
+    @classmethod
+    def build(cls, db: SnapshotSQLDatabase) -> "ValueIndex":
+        """
+        Collects the distinct values of every text column having at most `VALUE_INDEX_MAX_CARDINALITY` of them.
+
+        Each column is read through a subquery of at most `VALUE_INDEX_SCAN_ROWS` rows, so large tables cost a bounded scan. Indexing stops
+        once the collected values add up to `VALUE_INDEX_MAX_BYTES` (UTF-8), which bounds the memory of the index whatever the length of
+        the values.
+
+        Args:
+            db (SnapshotSQLDatabase): The connected database.
+
+        Returns:
+            ValueIndex: The index.
+        """
+        entries = []
+        size = 0
+        with unscoped():
+            tables = db.get_usable_table_names()
+        with db._engine.connect() as connection:
+            for table_name in tables:
+                source = table(table_name, schema=db._schema)
+                for column_info in db.get_table_columns(table_name):
+                    if not TEXT_TYPE_PATTERN.search(column_info["type"]):
+                        continue
+                    scanned = select(column(column_info["name"])).select_from(source).limit(VALUE_INDEX_SCAN_ROWS).subquery()
+                    values = scanned.c[column_info["name"]]
+                    statement = select(values).distinct().where(values.is_not(None)).limit(VALUE_INDEX_MAX_CARDINALITY + 1)
+                    try:
+                        rows = connection.execute(statement).fetchall()
+                    except SQLAlchemyError as column_error:
+                        connection.rollback()
+                        logger.debug(f"Values of {table_name}.{column_info['name']} not indexed. Details:\n{column_error}")
+                        continue
+                    if len(rows) > VALUE_INDEX_MAX_CARDINALITY:
+                        continue
+                    for row in rows:
+                        if not isinstance(row[0], str) or not row[0].strip() or len(row[0]) > VALUE_INDEX_MAX_VALUE_LENGTH:
+                            continue
+                        size += len(row[0].encode("utf-8"))
+                        if size > VALUE_INDEX_MAX_BYTES:
+                            logger.warning(f"Value index capped at {VALUE_INDEX_MAX_BYTES} bytes, remaining values are not indexed.")
+                            return cls(entries)
+                        entries.append((table_name, column_info["name"], row[0]))
+        logger.info(f"Value index built over {len(entries)} values ({size} bytes).")
+
+        return cls(entries)
+
+    def lookup(self, term: str, table_name: str | None = None, limit: int = VALUE_INDEX_TOP_K) -> list[ValueMatch]:
+        """
+        Finds the values closest to a term.
+
+        Args:
+            term (str): The value as written by the user.
+            table_name (str | None): Only search the values of this table.
+            limit (int): The maximum number of matches.
+
+        Returns:
+            list[ValueMatch]: The best matches, best first.
+        """
+        normalized = normalize_value(term)
+        if not normalized:
+            return []
+        grams = trigrams(normalized)
+        shared = Counter(position for gram in grams for position in self.grams.get(gram, ()))
+        scores = {
+            position: count / (len(grams) + self.gram_counts[position] - count)
+            for position, count in shared.items()
+        }
+        for initials, score in self.matching_acronyms(normalized.replace(" ", "")):
+            for position in self.acronyms[initials]:
+                scores[position] = max(scores.get(position, 0.0), score)
+        for position in scores:
+            if self.normalized[position] == normalized:
+                scores[position] = 1.0
+
+        matches = [
+            ValueMatch(*self.entries[position], round(score, 2))
+            for position, score in scores.items()
+            if score >= MIN_SCORE and (table_name is None or self.entries[position][0].lower() == table_name.lower())
+        ]
+
+        return sorted(matches, key=lambda match: match.score, reverse=True)[:limit]
+
+    def matching_acronyms(self, compact: str) -> list[tuple[str, float]]:
+        """Returns the indexed initials equal to a term (score 0.9), or prefix of it or extending it ("NY" and "NYC", score 0.6)."""
+        matches = [(compact, 0.9)] if compact in self.acronyms else []
+        if len(compact) < 2:
+            return matches
+        matches += [(compact[:length], 0.6) for length in range(2, len(compact)) if compact[:length] in self.acronyms]
+        position = bisect_left(self.sorted_acronyms, compact)
+        while position < len(self.sorted_acronyms) and self.sorted_acronyms[position].startswith(compact):
+            if self.sorted_acronyms[position] != compact:
+                matches.append((self.sorted_acronyms[position], 0.6))
+            position += 1
+
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+# Value index of each database, shared by the sessions connected to it, and the databases whose index is being built (True if a refresh
+# was requested meanwhile)
+indexes: dict[str, ValueIndex] = {}
+builds: dict[str, bool] = {}
+indexes_lock = threading.Lock()
+
+def schedule_value_index(db: SnapshotSQLDatabase, refresh: bool = False) -> threading.Thread | None:
+    """
+    Builds the value index of a database in a background thread, so that sessions are ready before it (the value lookup tool answers
+    that the index is not available until then). Nothing is started if the index exists or is being built; a refresh requested during
+    a build runs right after it.
+
+    Args:
+        db (SnapshotSQLDatabase): The connected database.
+        refresh (bool): Re-read the values even if the index exists (e.g. after the data changed).
+
+    Returns:
+        threading.Thread | None: The thread building the index, or None if no build was started.
+    """
+    connection_key = db.connection_key
+    with indexes_lock:
+        if connection_key in builds:
+            builds[connection_key] = builds[connection_key] or refresh
+            return None
+        if connection_key in indexes and not refresh:
+            return None
+        builds[connection_key] = False
+
+    def build() -> None:
+        while True:
+            try:
+                index = ValueIndex.build(db)
+            except Exception as build_error:
+                logger.warning(f"Value index not built. Details:\n{build_error}")
+                index = None
+            with indexes_lock:
+                if index is not None:
+                    indexes[connection_key] = index
+                if not builds[connection_key]:
+                    del builds[connection_key]
+                    return
+                builds[connection_key] = False
+
+    thread = threading.Thread(target=build, name=f"value-index-{connection_key[:8]}", daemon=True)
+    thread.start()
+
+    return thread
+
+def get_value_index(connection_key: str) -> ValueIndex | None:
+    """Returns the value index of a database, or None if it is not built yet."""
+    with indexes_lock:
+        return indexes.get(connection_key)
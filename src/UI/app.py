@@ -1,4 +1,5 @@
 import os
+import time
 import requests
 
 import streamlit as st
@@ -12,6 +13,8 @@ load_page_config()
 load_css(f"{STYLES_DIR}/base.css", f"{STYLES_DIR}/login.css")
 
 SETUP_ENDPOINT = f"{API_URL}/setup"
+POLL_INTERVAL = 0.5  # Seconds between two status checks of the setup job
+STEP_ICONS = {"pending": "⏸️", "running": "⏳", "done": "✅", "failed": "❌", "cancelled": "⏹️"}
 
 st.title("Database Connection 🔗")
 
@@ -75,9 +78,33 @@ if submit:
     missing_fields = [key for key, value in inputs.items() if not value]
     if not missing_fields:
         response = requests.post(SETUP_ENDPOINT, json=inputs)
-        if response.status_code == 200:
-            inputs.clear()
-            st.switch_page("pages/query.py")
+        if response.status_code == 202:
+            # The setup runs in the background: poll its progress until it succeeds or fails
+            job = response.json()
+            progress = st.status("Setting up...", expanded=True)
+            step_list = progress.empty()
+            while True:
+                step_list.markdown("\n".join(
+                    f"{STEP_ICONS[step['status']]} {step['label']}"
+                    + (f" ({step['duration_ms'] / 1000:.1f}s)" if step["duration_ms"] is not None else "")
+                    for step in job["steps"]
+                ))
+                if job["status"] != "running":
+                    break
+                time.sleep(POLL_INTERVAL)
+                status_response = requests.get(f"{SETUP_ENDPOINT}/{job['job_id']}")
+                if status_response.status_code != 200:
+                    job = {**job, "status": "failed", "detail": status_response.json()["detail"]}
+                    break
+                job = status_response.json()
+            if job["status"] == "succeeded":
+                progress.update(label="Connected", state="complete")
+                st.session_state["session_id"] = job["session_id"]
+                inputs.clear()
+                st.switch_page("pages/query.py")
+            else:
+                progress.update(label="Setup failed", state="error")
+                st.error(job["detail"])
         else:
             st.error(response.json()["detail"])
     else:
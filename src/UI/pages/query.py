@@ -1,8 +1,10 @@
+import json
 import requests
 
+import pandas as pd
 import streamlit as st
 
-from config.ui_config import API_URL
+from config.ui_config import API_URL, PUBLIC_API_URL
 from config.ui_config import STYLES_DIR
 from UI.style_loader import load_page_config, load_css
 
@@ -10,8 +12,33 @@ from UI.style_loader import load_page_config, load_css
 load_page_config()        
 load_css(f"{STYLES_DIR}/base.css", f"{STYLES_DIR}/query.css")
 
-QUERY_ENDPOINT = f"{API_URL}/query"
+STREAM_ENDPOINT = f"{API_URL}/query/stream"
 DISCONNECTION_ENDPOINT = f"{API_URL}/close-connection"
+RESULTS_ENDPOINT = f"{API_URL}/results"
+PAGE_SIZE = 50
+
+def show_previous_page():
+    st.session_state["result_cursors"].pop()
+
+def show_next_page(cursor):
+    st.session_state["result_cursors"].append(cursor)
+
+def prepare_export(result_url, session_id):
+    # The browser downloads the file straight from the API through a single-use link, which never carries the session token
+    link_response = requests.post(f"{result_url}/export-link", headers={"X-Session-Id": session_id}, params={"format": "csv"})
+    if link_response.status_code == 200:
+        st.session_state["export_url"] = f"{PUBLIC_API_URL}{link_response.json()['url']}"
+    else:
+        st.session_state["export_error"] = link_response.json()["detail"]
+
+def unique_columns(columns):
+    # Joined tables may return the same column name twice, which a dataframe cannot display
+    seen = {}
+    names = []
+    for column in columns:
+        seen[column] = seen.get(column, 0) + 1
+        names.append(column if seen[column] == 1 else f"{column} ({seen[column]})")
+    return names
 
 st.markdown("""
     <style>
@@ -26,6 +53,10 @@ user_question = st.text_input(
     "❓ Question goes here:",
     placeholder="Clear and proper word choices result in more accurate results 📈"
 )
+follow_up = st.checkbox(
+    "Follow-up question",
+    help="Build on the previous questions and their queries (e.g. \"and for last year?\")"
+)
 status_message = st.empty()
 retrieve = st.button("Retrieve")
 disconnect = st.button("Disconnect and Return")
@@ -33,22 +64,96 @@ disconnect = st.button("Disconnect and Return")
 # Either click on Retrieve button or hit Enter to submit question
 if retrieve or (user_question and user_question != st.session_state.get("last_query")):
     st.session_state["last_query"] = user_question
+    st.session_state.pop("result_id", None)
+    st.session_state.pop("last_answer", None)
+    st.session_state.pop("export_url", None)
     if user_question:
         status_message.markdown("<p class=\"process-msg\">⏳ LLM is processing data...</p>", unsafe_allow_html=True)
-        question_response = requests.post(QUERY_ENDPOINT, json={"input": user_question})
-        result = question_response.json()
-        if question_response.status_code == 200:
-            status_message.markdown("<p class=\"success-msg\">✅ Data processed successfully.</p>", unsafe_allow_html=True)
-            st.write(result["output"])
-        else:
-            status_message.markdown("<p class=\"error-msg\">❌ Error occurred while processing data.</p>", unsafe_allow_html=True)
-            st.error(result["detail"])
+        # Closing the response (also when this script run is interrupted) disconnects from the backend, which cancels the question
+        with requests.post(
+            STREAM_ENDPOINT,
+            json={"session_id": st.session_state.get("session_id", ""), "input": user_question, "follow_up": follow_up},
+            stream=True
+        ) as question_response:
+            if question_response.status_code == 200:
+                answer = st.empty()
+                steps = st.status("Working on your question...", expanded=False)
+                answer_text = ""
+                # Render each agent step and each answer token as soon as the backend pushes it
+                for line in question_response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    match event["event"]:
+                        case "tool_start":
+                            steps.update(label=f"{event['label']}...")
+                            if event["tool"] in ("sql_db_query", "sql_db_query_checker"):
+                                steps.code(event["input"], language="sql")
+                            elif event["input"]:
+                                steps.write(f"{event['label']}: `{event['input']}`")
+                        case "tool_end":
+                            if event.get("error"):
+                                steps.write(f"⚠️ {event['error']}")
+                            elif event.get("row_count") is not None:
+                                steps.write(f"{event['row_count']} row(s) returned.")
+                        case "token":
+                            answer_text += event["text"]
+                            answer.markdown(answer_text)
+                        case "final":
+                            steps.update(label="Done", state="complete")
+                            answer.write(event["output"])
+                            st.session_state["last_answer"] = event["output"]
+                            if event.get("result_id"):
+                                st.session_state["result_id"] = event["result_id"]
+                                st.session_state["result_cursors"] = [0]
+                            status_message.markdown("<p class=\"success-msg\">✅ Data processed successfully.</p>", unsafe_allow_html=True)
+                        case "error":
+                            steps.update(label="Failed", state="error")
+                            status_message.markdown("<p class=\"error-msg\">❌ Error occurred while processing data.</p>", unsafe_allow_html=True)
+                            st.error(event["detail"])
+            else:
+                status_message.markdown("<p class=\"error-msg\">❌ Error occurred while processing data.</p>", unsafe_allow_html=True)
+                st.error(question_response.json()["detail"])
     else:
         st.warning("Please enter a question.")
+elif st.session_state.get("last_answer"):
+    # Keep the answer on screen while browsing the result pages
+    st.write(st.session_state["last_answer"])
+
+# Full result of the last query, browsed page by page
+if st.session_state.get("result_id"):
+    result_url = f"{RESULTS_ENDPOINT}/{st.session_state['result_id']}"
+    session_id = st.session_state.get("session_id", "")
+    cursor = st.session_state["result_cursors"][-1]
+    page_response = requests.get(result_url, headers={"X-Session-Id": session_id}, params={"after": cursor, "limit": PAGE_SIZE})
+    if page_response.status_code == 200:
+        page = page_response.json()
+        st.caption(
+            f"Rows {cursor + 1}-{cursor + len(page['rows'])} of {page['row_count']}"
+            + (" (result truncated)" if page["truncated"] else "")
+        )
+        st.dataframe(pd.DataFrame(page["rows"], columns=unique_columns(page["columns"])), hide_index=True)
+        previous_column, next_column, export_column = st.columns(3)
+        previous_column.button("Previous", disabled=cursor == 0, on_click=show_previous_page)
+        next_column.button("Next", disabled=page["next_cursor"] is None, on_click=show_next_page, args=(page["next_cursor"],))
+        if st.session_state.get("export_url") is not None:
+            # Single use: the link is shown until the next rerun, then Export CSV issues a new one
+            export_column.link_button("Download CSV", st.session_state.pop("export_url"))
+        else:
+            export_column.button("Export CSV", on_click=prepare_export, args=(result_url, session_id))
+        if st.session_state.get("export_error"):
+            st.error(st.session_state.pop("export_error"))
+    else:
+        st.session_state.pop("result_id", None)
+        st.warning(page_response.json()["detail"])
 
 if disconnect:
-    disc_response = requests.post(DISCONNECTION_ENDPOINT)
+    disc_response = requests.post(DISCONNECTION_ENDPOINT, json={"session_id": st.session_state.get("session_id", "")})
     if disc_response.status_code == 200:
+            st.session_state.pop("session_id", None)
+            st.session_state.pop("result_id", None)
+            st.session_state.pop("last_answer", None)
+            st.session_state.pop("export_url", None)
             st.switch_page("app.py")
     else:
         st.error(disc_response.json()["detail"])
\ No newline at end of file
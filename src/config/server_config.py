@@ -8,6 +8,36 @@ from dotenv import load_dotenv
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# LLM clients, shared by every session: model tiers, timeouts, retries (with the SDK's exponential backoff) and HTTP keep-alive pool.
+# Each tier is served by OpenAI ("openai") or by an OpenAI-compatible local server such as llama.cpp or vLLM ("local")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+SMALL_LLM_PROVIDER = os.getenv("SMALL_LLM_PROVIDER", "openai")
+SMALL_LLM_MODEL = os.getenv("SMALL_LLM_MODEL", "gpt-4o-mini")
+LLM_TIERS = {
+    "large": {"provider": LLM_PROVIDER, "model": LLM_MODEL},
+    "small": {"provider": SMALL_LLM_PROVIDER, "model": SMALL_LLM_MODEL},
+}
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://localhost:8080/v1")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "local")  # Most local servers accept any key
+# Embeddings of the few-shot examples and of the cached questions, served by the provider of the large tier unless set otherwise.
+# The local server must expose an embedding model (e.g. llama.cpp with --embeddings)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", LLM_PROVIDER)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # Seconds to wait for a response
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))  # Seconds to wait for a new connection
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))  # Retries on rate limits, timeouts and 5xx errors
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))  # Seconds an idle connection is kept open
+API_KEY_CHECK_TTL = int(os.getenv("API_KEY_CHECK_TTL", 3600))  # Seconds a successful API key check is trusted
+SMALL_LLM_RETRY_AFTER = int(os.getenv("SMALL_LLM_RETRY_AFTER", 60))  # Seconds before checking an unavailable small tier again
+
+# Model routing (off by default, every question then goes to the SQL agent): simple questions are answered by the small tier through the
+# single-shot pipeline; complex questions, and simple ones the small tier fails on, go to the large tier
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+ROUTER_COMPLEXITY_THRESHOLD = int(os.getenv("ROUTER_COMPLEXITY_THRESHOLD", 2))  # Complexity score from which a question is complex
+
 # Root directory
 PROJ_ROOT = Path(__file__).resolve().parents[2]
 
@@ -18,3 +48,135 @@ API_DIR = SRC_DIR / "API"
 DATA_DIR = API_DIR / "data"
 LOGS_DIR = API_DIR / "logs"
 LOGS_DIR.mkdir(parents=True, exist_ok=True) # Ensure the logs directory exists
+
+# Logging, configured once per process: the console gets readable lines, the log file gets JSON records (with the session and trace
+# ids of the question being answered). Both sinks write from a background thread. The level can be changed at runtime (/log-level)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "true").lower() == "true"  # JSON records in the log file, otherwise the console format
+LOG_ROTATION = os.getenv("LOG_ROTATION", "50 MB")  # Size or time ("1 day", "00:00") at which a new log file is started
+LOG_RETENTION = os.getenv("LOG_RETENTION", "14 days")  # How long rotated files are kept
+LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "gz")  # Format rotated files are compressed to
+
+# Session registry
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 50))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", 1800))  # Seconds of inactivity before a session is evicted
+SETUP_JOB_TTL = int(os.getenv("SETUP_JOB_TTL", 600))  # Seconds the outcome of a setup job stays available
+
+# Agent worker pool and admission control
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", 4))
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", 16))
+QUERY_QUEUE_TIMEOUT = float(os.getenv("QUERY_QUEUE_TIMEOUT", 30))  # Seconds a query may wait for a free worker
+
+# Batch questions (/query/batch)
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 500))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", MAX_CONCURRENT_QUERIES))  # Questions of a batch answered at the same time
+
+# Semantic answer cache
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))  # Seconds an answer stays valid
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))  # Minimum cosine similarity for a hit
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 500))  # Per database connection
+
+# Conversation memory for follow-up questions: the last CONVERSATION_MAX_TURNS questions of a session, with the SQL and a summary of the
+# result that answered them, are given to the agent within an (estimated) budget of CONVERSATION_MAX_TOKENS tokens (0 turns disables it)
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", 5))
+CONVERSATION_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", 1500))
+CONVERSATION_RESULT_CHARS = int(os.getenv("CONVERSATION_RESULT_CHARS", 600))  # Longest result summary kept per question
+
+# Single-flight coalescing: identical questions asked on the same database while a run is in flight share that run
+QUERY_COALESCING = os.getenv("QUERY_COALESCING", "true").lower() == "true"
+
+# Persistent vector index of the few-shot examples
+EXAMPLE_INDEX_DIR = DATA_DIR / "example_index"
+
+# Local caches shared by every session (schema snapshots...)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", API_DIR / "cache"))
+SCHEMA_CACHE_DIR = CACHE_DIR / "schemas"
+RESULTS_DIR = CACHE_DIR / "results"
+
+# Session store shared by the API workers of this host: sessions set up on one worker are rebuilt on demand by the others (and after a
+# restart). Credentials are encrypted with SESSION_STORE_KEY (a Fernet key), or with the key read from SESSION_STORE_KEY_FILE (e.g. a Docker
+# secret): one of them is required, so that every worker decrypts the sessions of the others
+SESSION_STORE_PATH = Path(os.getenv("SESSION_STORE_PATH", CACHE_DIR / "sessions.db"))
+SESSION_STORE_KEY = os.getenv("SESSION_STORE_KEY")
+SESSION_STORE_KEY_FILE = os.getenv("SESSION_STORE_KEY_FILE")
+SESSION_TOUCH_INTERVAL = int(os.getenv("SESSION_TOUCH_INTERVAL", 30))  # Seconds between two writes of the last use of a session
+
+# Uvicorn worker processes of the API (unset runs a single process with auto-reload, for development). The workers share the session store,
+# the query results, the cache generations and the cancellation requests on disk, and the metrics through PROMETHEUS_MULTIPROC_DIR
+API_WORKERS = int(os.getenv("API_WORKERS", 1))
+CANCEL_POLL_INTERVAL = float(os.getenv("CANCEL_POLL_INTERVAL", 0.5))  # Seconds between two reads of the cancellations asked to a worker
+# Directory where the workers write their metrics (prometheus_client multiprocess mode). Set to a fresh directory under CACHE_DIR when
+# several workers are started without it
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+METRICS_DIR = CACHE_DIR / "metrics"
+
+# SQLAlchemy connection pools, per DBMS
+ENGINE_POOL_SETTINGS = {
+    "MySQL": {
+        "pool_size": int(os.getenv("MYSQL_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("MYSQL_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("MYSQL_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("MYSQL_POOL_RECYCLE", 3600)),  # Below the server-side wait_timeout
+        "pool_pre_ping": os.getenv("MYSQL_POOL_PRE_PING", "true").lower() == "true",
+    },
+    "PostgreSQL": {
+        "pool_size": int(os.getenv("POSTGRES_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("POSTGRES_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("POSTGRES_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("POSTGRES_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.getenv("POSTGRES_POOL_PRE_PING", "true").lower() == "true",
+    },
+    "SQLite": {
+        "pool_size": int(os.getenv("SQLITE_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("SQLITE_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("SQLITE_POOL_TIMEOUT", 30)),
+        "pool_recycle": -1,  # Local files never drop connections
+        "pool_pre_ping": False,
+    },
+}
+ENGINE_IDLE_TTL = int(os.getenv("ENGINE_IDLE_TTL", 300))  # Seconds an unused engine stays warm before being disposed
+
+# Query guard: every statement is aborted by the database after STATEMENT_TIMEOUT seconds (0 disables the timeout), and the estimated
+# plan of generated queries is checked before they run. Over-budget queries are rejected ("reject"), retried with a LIMIT ("limit") or
+# run anyway ("off")
+STATEMENT_TIMEOUT = float(os.getenv("STATEMENT_TIMEOUT", 30))
+QUERY_GUARD_MODE = os.getenv("QUERY_GUARD_MODE", "limit")
+QUERY_GUARD_MAX_ROWS = int(os.getenv("QUERY_GUARD_MAX_ROWS", 5000000))  # Estimated rows read (MySQL) or returned (PostgreSQL)
+QUERY_GUARD_MAX_COST = float(os.getenv("QUERY_GUARD_MAX_COST", 1000000))  # PostgreSQL planner cost units
+QUERY_GUARD_LIMIT = int(os.getenv("QUERY_GUARD_LIMIT", 1000))  # LIMIT injected into over-budget queries in "limit" mode
+
+# Query pipeline: "agent" (iterative SQL agent) or "fast" (single-shot SQL generation, falling back to the agent on failure)
+QUERY_MODE = os.getenv("QUERY_MODE", "agent")
+FAST_PATH_MAX_TABLES = int(os.getenv("FAST_PATH_MAX_TABLES", 8))  # Tables described to the model
+FAST_PATH_ANSWER_FORMAT = os.getenv("FAST_PATH_ANSWER_FORMAT", "local")  # "local" (no LLM call) or "llm" (one short call)
+
+# Schema pruning: only the SCHEMA_TOP_N tables most relevant to a question are exposed to the model (0 disables pruning)
+SCHEMA_TOP_N = int(os.getenv("SCHEMA_TOP_N", 10))
+SCHEMA_INDEX_SAMPLE_ROWS = int(os.getenv("SCHEMA_INDEX_SAMPLE_ROWS", 3))  # Rows read per table to index sample values
+
+# Column value index, used by the agent to find how a value is spelled in the data (low-cardinality text columns only)
+VALUE_INDEX_ENABLED = os.getenv("VALUE_INDEX_ENABLED", "true").lower() == "true"
+VALUE_INDEX_MAX_CARDINALITY = int(os.getenv("VALUE_INDEX_MAX_CARDINALITY", 500))  # Columns with more distinct values are skipped
+VALUE_INDEX_SCAN_ROWS = int(os.getenv("VALUE_INDEX_SCAN_ROWS", 100000))  # Rows read per column to collect its distinct values
+VALUE_INDEX_MAX_BYTES = int(os.getenv("VALUE_INDEX_MAX_BYTES", 4 * 1024 * 1024))  # Total length of the values indexed per database
+VALUE_INDEX_MAX_VALUE_LENGTH = int(os.getenv("VALUE_INDEX_MAX_VALUE_LENGTH", 100))  # Longer values are not indexed
+VALUE_INDEX_TOP_K = int(os.getenv("VALUE_INDEX_TOP_K", 5))  # Matches returned per lookup
+
+# Query results: the model only sees a sample; the full result is spooled from a server-side cursor to a local file when it is first paged
+# or exported, and served from there
+RESULT_FETCH_SIZE = int(os.getenv("RESULT_FETCH_SIZE", 1000))  # Rows fetched from the database at a time
+RESULT_MAX_ROWS = int(os.getenv("RESULT_MAX_ROWS", 1000000))  # Rows kept per result, the rest is dropped
+RESULT_SAMPLE_ROWS = int(os.getenv("RESULT_SAMPLE_ROWS", 10))  # Rows shown to the model
+RESULT_PAGE_MAX_ROWS = int(os.getenv("RESULT_PAGE_MAX_ROWS", 1000))  # Largest page served by /results/{id}
+RESULT_EXPORT_BATCH_ROWS = int(os.getenv("RESULT_EXPORT_BATCH_ROWS", 10000))  # Rows per exported chunk
+RESULT_MAX_STORED = int(os.getenv("RESULT_MAX_STORED", 200))  # Results kept on disk, least recently used first out
+RESULT_TTL = int(os.getenv("RESULT_TTL", 1800))  # Seconds a result stays available
+RESULT_EXPORT_TOKEN_TTL = int(os.getenv("RESULT_EXPORT_TOKEN_TTL", 60))  # Seconds a single-use export link stays valid
+
+# SQL result cache of the query tool, keyed on the normalized query and the change tokens of the tables it reads
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", 32 * 1024 * 1024))  # Size of the cached tool outputs, across connections
+# Seconds a cached output is served at most. PostgreSQL and MySQL change tokens can lag behind writes made outside the app, which may
+# then be missed for up to this long (SQLite tokens are exact)
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", 30))
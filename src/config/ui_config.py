@@ -8,6 +8,8 @@ if "API_URL" in st.secrets:  # Check if running in Streamlit Cloud
     API_URL = st.secrets["API_URL"]
 else:  # Fallback for local development
     API_URL = "http://localhost:8000"
+# Address of the API as seen from the browser, which downloads exported results from it directly
+PUBLIC_API_URL = st.secrets["PUBLIC_API_URL"] if "PUBLIC_API_URL" in st.secrets else API_URL
 
 # Root directory
 PROJ_ROOT = Path(__file__).resolve().parents[2]
@@ -1,3 +1,5 @@
+import argparse
+import os
 import sys
 import subprocess
 import signal
@@ -15,9 +17,22 @@ def shutdown():
         process.terminate()
     sys.exit(0)
 
+def backend_environment():
+    """Environment of the backend, with the number of API workers given by --workers"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Run the API with this many worker processes and no reloader (production mode).")
+    arguments, _ = parser.parse_known_args()
+    if arguments.workers is not None and arguments.workers < 1:
+        parser.error("--workers: at least 1 worker process is needed.")
+    environment = os.environ.copy()
+    if arguments.workers is not None:
+        environment["API_WORKERS"] = str(arguments.workers)
+    return environment
+
 def start_backend():
-    """Start the backend"""
-    subprocess.run([sys.executable, FASTAPI])
+    """Start the backend (with --workers, in production mode: no reloader)"""
+    subprocess.run([sys.executable, FASTAPI], env=backend_environment())
 
 def start_frontend():
     """Start the frontend"""
@@ -26,7 +41,7 @@ def start_frontend():
 def main():
     """Start the full application"""
     try:
-        backend = subprocess.Popen([sys.executable, FASTAPI])
+        backend = subprocess.Popen([sys.executable, FASTAPI], env=backend_environment())
         frontend = subprocess.Popen(["streamlit", "run", STREAMLIT])
         processes.extend([backend, frontend])
     except Exception as e:
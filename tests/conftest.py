@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from cryptography.fernet import Fernet
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from sqlalchemy import create_engine
+
+from fake_llm import ScriptedChatModel
+from fixtures import generate_database, generate_questions
+
+# Set before the server configuration is imported (by the test modules): the caches and the session store live under CACHE_DIR
+TEST_DIR = Path(tempfile.mkdtemp(prefix="doht-tests-"))
+os.environ["CACHE_DIR"] = str(TEST_DIR / "cache")
+os.environ["SESSION_STORE_KEY"] = Fernet.generate_key().decode("ascii")
+
+
+@pytest.fixture(scope="session")
+def database_layout(tmp_path_factory) -> tuple[Path, list[dict]]:
+    """A generated SQLite database of 4 tables (`table_0` to `table_3`) of 50 rows, shared by the tests that only read it."""
+    path = tmp_path_factory.mktemp("database") / "test.db"
+
+    return path, generate_database(path, tables=4, columns=3, rows=50, seed=0)
+
+@pytest.fixture(scope="session")
+def sqlite_database(database_layout) -> Path:
+    return database_layout[0]
+
+@pytest.fixture(scope="session")
+def questions(database_layout) -> dict[str, tuple[str, str]]:
+    """Questions on the generated database, with the table and the query answering each of them."""
+    return generate_questions(database_layout[1], 20)
+
+@pytest.fixture
+def database(sqlite_database, tmp_path, monkeypatch):
+    """The generated database, behind a schema snapshot of its own."""
+    import API.schema_cache as schema_cache
+
+    monkeypatch.setattr(schema_cache, "SCHEMA_CACHE_DIR", tmp_path / "schemas")
+    schema_cache.drop_snapshot("test")
+    engine = create_engine(f"sqlite:///{sqlite_database}")
+    yield schema_cache.SnapshotSQLDatabase(engine, "test")
+    engine.dispose()
+
+@pytest.fixture(scope="session")
+def model(questions) -> ScriptedChatModel:
+    """The chat model of the server, answering the generated questions."""
+    return ScriptedChatModel(queries=questions)
+
+@pytest.fixture(scope="session")
+def client(model) -> Iterator[TestClient]:
+    """The API, with the scripted model and a deterministic embedding stub in place of OpenAI."""
+    import API.FSL_prompt as FSL_prompt
+    import API.llm as llm
+    import API.server as server
+
+    embeddings = DeterministicFakeEmbedding(size=256)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(llm, "validate_tier", lambda tier: None)
+        patch.setattr(llm, "get_llm", lambda tier="large": model)
+        patch.setattr(server, "setup_openai_api", lambda: model)
+        patch.setattr(server, "get_embeddings", lambda: embeddings)
+        patch.setattr(FSL_prompt, "get_embeddings", lambda: embeddings)
+        patch.setattr(FSL_prompt, "EXAMPLE_INDEX_DIR", TEST_DIR / "example_index")
+        with TestClient(server.app) as test_client:
+            yield test_client
+
+def set_up_session(client: TestClient, database: Path) -> str:
+    """Runs a setup job to completion and returns the session token."""
+    job = client.post("/setup", json={"dbms": "SQLite", "file_path": str(database)}).json()
+    while job["status"] == "running":
+        time.sleep(0.01)
+        job = client.get(f"/setup/{job['job_id']}").json()
+    assert job["status"] == "succeeded", job["detail"]
+
+    return job["session_id"]
+
+@pytest.fixture
+def session_id(client, sqlite_database) -> Iterator[str]:
+    """The token of a session on the generated database, closed after the test."""
+    session_id = set_up_session(client, sqlite_database)
+    yield session_id
+    client.post("/close-connection", json={"session_id": session_id})
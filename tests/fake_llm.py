@@ -0,0 +1,88 @@
+import re
+import time
+from typing import Any, Sequence
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+def count_tokens(text: str) -> int:
+    """Roughly counts the tokens of a text (one per word or symbol), enough to exercise the token accounting."""
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for the chat model, answering every benchmark question with a fixed script.
+
+    With tools bound (the SQL agent), the model lists the tables, reads the schema of the question's table, runs the question's query and
+    answers with its result: three tool calls and four model calls per question, as a typical agent run. Without tools (the single-shot
+    pipeline), it returns the question's query in a SQL code block.
+
+    Attributes:
+        queries (dict[str, tuple[str, str]]): The table and SQL query of every benchmark question.
+        latency (float): Seconds every call sleeps, to simulate the time spent by a real model.
+    """
+
+    queries: dict[str, tuple[str, str]]
+    latency: float = 0.0
+    model_name: str = "scripted"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Sequence[BaseTool | dict], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        question = self.find_question(messages)
+        table, sql = self.queries.get(question, (None, "SELECT 1"))
+        if "tools" in kwargs:
+            message = self.next_agent_step(messages, table, sql)
+        else:
+            message = AIMessage(content=f"```sql\n{sql}\n```")
+
+        prompt_tokens = sum(count_tokens(str(message.content)) for message in messages)
+        completion_tokens = count_tokens(str(message.content)) + 8 * len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def find_question(self, messages: list[BaseMessage]) -> str | None:
+        """Returns the benchmark question found in the last human message, if any."""
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                return next((question for question in self.queries if question in str(message.content)), None)
+
+        return None
+
+    def next_agent_step(self, messages: list[BaseMessage], table: str | None, sql: str) -> AIMessage:
+        """Returns the next tool call of the script, or the final answer once every tool call was answered."""
+        tool_results = [message for message in messages if isinstance(message, ToolMessage)]
+        script = [
+            ("sql_db_list_tables", {"tool_input": ""}),
+            ("sql_db_schema", {"table_names": table or ""}),
+            ("sql_db_query", {"query": sql}),
+        ]
+        if len(tool_results) >= len(script):
+            return AIMessage(content=f"The query returned: {tool_results[-1].content}")
+        name, args = script[len(tool_results)]
+
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{len(tool_results)}"}])
@@ -0,0 +1,90 @@
+import random
+import sqlite3
+from pathlib import Path
+
+
+CATEGORIES = ["Electronics", "Books", "Garden", "Toys", "Grocery", "Clothing", "Sports", "Beauty", "Automotive", "Office"]
+CITIES = ["New York City", "San Francisco", "Los Angeles", "Chicago", "Houston", "Seattle", "Boston", "Denver", "Miami", "Atlanta"]
+
+def column_type(position: int) -> str:
+    """Returns the SQL type of the n-th generated column: integers, reals, low-cardinality texts and dates, in turn."""
+    return ["INTEGER", "REAL", "TEXT", "DATE"][position % 4]
+
+def generate_database(path: Path, tables: int, columns: int, rows: int, seed: int = 0) -> list[dict]:
+    """
+    Generates a SQLite database of `tables` tables of `rows` rows, each with an id, a reference to the previous table and `columns` more
+    columns.
+
+    Args:
+        path (Path): The database file, replaced if it exists.
+        tables (int): The number of tables (schema width).
+        columns (int): The number of generated columns per table.
+        rows (int): The number of rows per table.
+        seed (int): Seed of the generated values, so that runs are comparable.
+
+    Returns:
+        list[dict]: The name and the integer columns of every table, to write questions against.
+    """
+    path.unlink(missing_ok=True)
+    generator = random.Random(seed)
+    layout = []
+    with sqlite3.connect(path) as connection:
+        for table_index in range(tables):
+            name = f"table_{table_index}"
+            names = [f"column_{position}" for position in range(columns)]
+            definitions = ["id INTEGER PRIMARY KEY"]
+            if table_index:
+                definitions.append(f"table_{table_index - 1}_id INTEGER REFERENCES table_{table_index - 1}(id)")
+            definitions += [f"{column} {column_type(position)}" for position, column in enumerate(names)]
+            connection.execute(f"CREATE TABLE {name} ({', '.join(definitions)})")
+
+            def generate_row(row_id: int) -> list:
+                row = [row_id] + ([generator.randint(1, rows)] if table_index else [])
+                for position in range(columns):
+                    match column_type(position):
+                        case "INTEGER":
+                            row.append(generator.randint(0, 1000))
+                        case "REAL":
+                            row.append(round(generator.uniform(0, 10000), 2))
+                        case "TEXT":
+                            row.append(generator.choice(CATEGORIES if position % 8 == 2 else CITIES))
+                        case "DATE":
+                            row.append(f"2024-{generator.randint(1, 12):02d}-{generator.randint(1, 28):02d}")
+                return row
+
+            placeholders = ", ".join("?" * (len(definitions)))
+            connection.executemany(f"INSERT INTO {name} VALUES ({placeholders})", (generate_row(row_id) for row_id in range(1, rows + 1)))
+            layout.append({
+                "table": name,
+                "integer_columns": [column for position, column in enumerate(names) if column_type(position) == "INTEGER"],
+            })
+    connection.close()
+
+    return layout
+
+def generate_questions(layout: list[dict], count: int) -> dict[str, tuple[str, str]]:
+    """
+    Writes distinct questions against a generated database, along with the table and the query answering each of them.
+
+    Every question has its own threshold, so that neither the answer cache nor the SQL result cache can serve it.
+
+    Args:
+        layout (list[dict]): The tables returned by `generate_database`.
+        count (int): The number of questions.
+
+    Returns:
+        dict[str, tuple[str, str]]: The table and SQL query of every question.
+    """
+    questions = {}
+    for index in range(count):
+        table = layout[index % len(layout)]
+        if table["integer_columns"]:
+            column = table["integer_columns"][index % len(table["integer_columns"])]
+            question = f"How many rows of {table['table']} have a {column} greater than {index}?"
+            sql = f"SELECT COUNT(*) FROM {table['table']} WHERE {column} > {index}"
+        else:
+            question = f"How many rows of {table['table']} have an id greater than {index}?"
+            sql = f"SELECT COUNT(*) FROM {table['table']} WHERE id > {index}"
+        questions[question] = (table["table"], sql)
+
+    return questions
@@ -0,0 +1,131 @@
+import argparse
+import json
+import re
+import time
+from typing import Any, Iterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from fake_llm import ScriptedChatModel
+
+
+def to_message(entry: dict[str, Any]) -> BaseMessage:
+    """Converts a message of an OpenAI chat completion request to a LangChain message."""
+    content = entry.get("content") or ""
+    match entry["role"]:
+        case "system" | "developer":
+            return SystemMessage(content)
+        case "user":
+            return HumanMessage(content)
+        case "tool":
+            return ToolMessage(content, tool_call_id=entry["tool_call_id"])
+        case _:
+            tool_calls = [
+                {"name": call["function"]["name"], "args": json.loads(call["function"]["arguments"] or "{}"), "id": call["id"]}
+                for call in entry.get("tool_calls") or []
+            ]
+            return AIMessage(content, tool_calls=tool_calls)
+
+def to_tool_calls(message: AIMessage) -> list[dict[str, Any]]:
+    """Converts the tool calls of a LangChain message to the OpenAI format."""
+    return [
+        {"index": index, "id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": json.dumps(call["args"])}}
+        for index, call in enumerate(message.tool_calls)
+    ]
+
+def to_usage(message: AIMessage) -> dict[str, int]:
+    usage = message.usage_metadata or {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"], "total_tokens": usage["total_tokens"]}
+
+def create_app(model: ScriptedChatModel) -> FastAPI:
+    """
+    Builds an OpenAI-compatible HTTP server (as llama.cpp or vLLM expose) answering with a scripted model, to exercise the "local" LLM
+    provider without a real model. Every chat completion request is kept in `app.state.requests`; embeddings are deterministic vectors
+    of the text.
+
+    Args:
+        model (ScriptedChatModel): The model answering the requests.
+
+    Returns:
+        FastAPI: The server application.
+    """
+    app = FastAPI()
+    app.state.requests = []
+    embeddings = DeterministicFakeEmbedding(size=256)
+
+    @app.get("/v1/models")
+    async def list_models() -> dict[str, Any]:
+        return {"object": "list", "data": [{"id": model.model_name, "object": "model", "created": 0, "owned_by": "stub"}]}
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request) -> dict[str, Any]:
+        body = await request.json()
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [{"object": "embedding", "index": index, "embedding": embeddings.embed_query(text)} for index, text in enumerate(texts)],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def create_chat_completion(request: Request) -> Any:
+        body = await request.json()
+        app.state.requests.append(body)
+        kwargs = {"tools": body["tools"]} if body.get("tools") else {}
+        message = model._generate([to_message(entry) for entry in body["messages"]], **kwargs).generations[0].message
+        completion_id, created = f"chatcmpl-{len(app.state.requests)}", int(time.time())
+        finish_reason = "tool_calls" if message.tool_calls else "stop"
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": message.content or None, "tool_calls": to_tool_calls(message) or None},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": to_usage(message),
+            }
+
+        def chunk(choices: list[dict[str, Any]], **fields: Any) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body["model"], "choices": choices}
+            return f"data: {json.dumps({**payload, **fields})}\n\n"
+
+        def events() -> Iterator[str]:
+            yield chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            # Content is streamed word by word, as a real server streams tokens
+            for word in re.findall(r"\s*\S+\s*", str(message.content or "")):
+                yield chunk([{"index": 0, "delta": {"content": word}, "finish_reason": None}])
+            if message.tool_calls:
+                yield chunk([{"index": 0, "delta": {"tool_calls": to_tool_calls(message)}, "finish_reason": None}])
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield chunk([], usage=to_usage(message))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serves an OpenAI-compatible API answering with a scripted model, to run the backend with LLM_PROVIDER=local offline."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    arguments = parser.parse_args()
+
+    uvicorn.run(create_app(ScriptedChatModel(queries={})), host=arguments.host, port=arguments.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+from uuid import uuid4
+
+from API.answer_cache import AnswerCache, SQLRecorder
+from API.session_store import SessionStore
+
+
+QUESTION = "How many rows of table_0 are there?"
+SQL = "SELECT COUNT(*) FROM table_0"
+
+
+def embed(question: str) -> list[float]:
+    return [float(len(question)), 1.0]
+
+def make_cache() -> AnswerCache:
+    return AnswerCache(embed, ttl=60, similarity_threshold=0.99, max_entries=10)
+
+def run_query(recorder: SQLRecorder, query: str, output: str = "[(50,)]") -> None:
+    """Replays the callbacks of one `sql_db_query` tool call."""
+    run_id = uuid4()
+    recorder.on_tool_start({"name": "sql_db_query"}, query, run_id=run_id, inputs={"query": query})
+    recorder.on_tool_end(output, run_id=run_id)
+
+
+def test_answers_are_served_for_normalized_questions():
+    cache = make_cache()
+    cache.store("db", QUESTION, SQL, "[(50,)]", "There are 50 rows.", cache.generation("db"))
+
+    cached, _ = cache.lookup("db", "how many rows of TABLE_0 are there")
+
+    assert cached.answer == "There are 50 rows."
+    assert cache.lookup("other", QUESTION)[0] is None
+
+def test_recorder_keeps_the_last_read():
+    recorder = SQLRecorder(make_cache(), "db")
+    run_query(recorder, "SELECT * FROM missing", "Error: no such table: missing")
+    run_query(recorder, SQL)
+
+    assert recorder.cacheable
+    assert (recorder.sql, recorder.result) == (SQL, "[(50,)]")
+
+def test_write_invalidates_the_connection():
+    cache = make_cache()
+    cache.store("db", QUESTION, SQL, "[(50,)]", "There are 50 rows.", cache.generation("db"))
+    cache.store("other", QUESTION, SQL, "[(50,)]", "There are 50 rows.", cache.generation("other"))
+    recorder = SQLRecorder(cache, "db")
+
+    run_query(recorder, "DELETE FROM table_0 WHERE id = 1", "")
+
+    assert not recorder.cacheable
+    assert cache.lookup("db", QUESTION)[0] is None
+    assert cache.lookup("other", QUESTION)[0] is not None
+
+def test_answer_computed_across_a_write_is_not_stored():
+    cache = make_cache()
+    generation = cache.generation("db")
+    # Another session writes while the answer is being computed
+    run_query(SQLRecorder(cache, "db"), "UPDATE table_0 SET column_0 = 0", "")
+
+    cache.store("db", QUESTION, SQL, "[(50,)]", "There are 50 rows.", generation)
+
+    assert cache.lookup("db", QUESTION)[0] is None
+
+def test_write_seen_by_another_worker_invalidates_the_connection(tmp_path):
+    store = SessionStore(tmp_path / "sessions.db", idle_ttl=60, job_ttl=60)
+    cache = AnswerCache(embed, ttl=60, similarity_threshold=0.99, max_entries=10, store=store)
+    other_worker = AnswerCache(embed, ttl=60, similarity_threshold=0.99, max_entries=10, store=store)
+    cache.store("db", QUESTION, SQL, "[(50,)]", "There are 50 rows.", cache.generation("db"))
+
+    run_query(SQLRecorder(other_worker, "db"), "DELETE FROM table_0 WHERE id = 1", "")
+
+    assert cache.lookup("db", QUESTION)[0] is None
@@ -0,0 +1,62 @@
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from API.cancellation import RunRegistry
+from API.session_store import SessionStore
+from conftest import set_up_session
+
+
+def test_question_is_cancelled_through_another_worker(tmp_path):
+    async def scenario():
+        store = SessionStore(tmp_path / "sessions.db", idle_ttl=60, job_ttl=60)
+        runs = RunRegistry(store=store)
+        task = asyncio.create_task(asyncio.sleep(10))
+        runs.register("token", "query", task)
+        # Wait for the background write of the run
+        await asyncio.to_thread(lambda: runs._writer.submit(lambda: None).result())
+
+        # The cancel request reaches another worker, which does not answer the question
+        asked = await asyncio.to_thread(SessionStore(store.path, idle_ttl=60, job_ttl=60).request_cancel, "token", "query")
+        cancelled = await runs.apply_cancel_requests()
+        await asyncio.gather(task, return_exceptions=True)
+        return asked, cancelled, task.cancelled(), runs.stats()
+
+    asked, cancelled, task_cancelled, stats = asyncio.run(scenario())
+
+    assert asked == 1 and cancelled == 1 and task_cancelled
+    assert stats == {"running": 0, "cancelled": 1}
+
+def running_questions(client) -> int:
+    return client.get("/status").json()["runs"]["running"]
+
+def ask_in_background(client, request: dict) -> Future:
+    """Posts a question from another thread and waits until it is being answered."""
+    running = running_questions(client)
+    response = ThreadPoolExecutor(1).submit(client.post, "/query", json=request)
+    while running_questions(client) == running and not response.done():
+        time.sleep(0.01)
+
+    return response
+
+
+def test_unknown_question_cannot_be_cancelled(client, session_id):
+    assert client.post("/query/unknown/cancel", json={"session_id": session_id}).status_code == 404
+
+def test_question_is_cancelled(client, session_id, questions, model, monkeypatch):
+    monkeypatch.setattr(model, "latency", 0.2)
+    cancelled = client.get("/status").json()["runs"]["cancelled"]
+    response = ask_in_background(client, {"session_id": session_id, "input": list(questions)[10], "mode": "agent", "query_id": "slow"})
+
+    assert client.post("/query/slow/cancel", json={"session_id": session_id}).status_code == 200
+    assert response.result().status_code == 499
+    assert client.get("/status").json()["runs"]["cancelled"] == cancelled + 1
+    assert client.post("/query/slow/cancel", json={"session_id": session_id}).status_code == 404
+
+def test_closing_the_session_cancels_its_questions(client, sqlite_database, questions, model, monkeypatch):
+    monkeypatch.setattr(model, "latency", 0.2)
+    session_id = set_up_session(client, sqlite_database)
+    response = ask_in_background(client, {"session_id": session_id, "input": list(questions)[11], "mode": "agent"})
+
+    assert client.post("/close-connection", json={"session_id": session_id}).status_code == 200
+    assert response.result().status_code == 499
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+
+import pytest
+
+from API.admission import AdmissionController
+from API.custom_exceptions import ServerBusyError
+from API.single_flight import SingleFlight
+
+
+def test_identical_calls_share_one_run():
+    async def scenario():
+        in_flight = SingleFlight()
+        calls = 0
+
+        async def run():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        outcomes = await asyncio.gather(*(in_flight.run("key", run) for _ in range(3)))
+        return outcomes, calls, in_flight.stats()
+
+    outcomes, calls, stats = asyncio.run(scenario())
+
+    assert calls == 1
+    assert sorted(outcomes) == [("answer", False), ("answer", True), ("answer", True)]
+    assert stats == {"in_flight": 0, "runs": 1, "coalesced": 2}
+
+def test_different_keys_run_separately():
+    async def scenario():
+        in_flight = SingleFlight()
+
+        async def run():
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        return await asyncio.gather(in_flight.run(("db", "fast"), run), in_flight.run(("db", "agent"), run))
+
+    assert asyncio.run(scenario()) == [("answer", False), ("answer", False)]
+
+def test_run_survives_until_every_caller_cancelled():
+    async def scenario():
+        in_flight = SingleFlight()
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def run():
+            started.set()
+            await release.wait()
+            return "answer"
+
+        first = asyncio.create_task(in_flight.run("key", run))
+        await started.wait()
+        second = asyncio.create_task(in_flight.run("key", run))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        shared = await second
+
+        lone = asyncio.create_task(in_flight.run("other", run))
+        await asyncio.sleep(0)
+        lone.cancel()
+        await asyncio.gather(lone, return_exceptions=True)
+        return shared, in_flight.stats()
+
+    shared, stats = asyncio.run(scenario())
+
+    assert shared == ("answer", True)
+    assert stats["in_flight"] == 0
+
+def test_errors_are_shared():
+    async def scenario():
+        in_flight = SingleFlight()
+
+        async def run():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        return await asyncio.gather(in_flight.run("key", run), in_flight.run("key", run), return_exceptions=True)
+
+    outcomes = asyncio.run(scenario())
+
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+
+def test_admission_runs_in_a_worker_thread():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=2, max_queued=1, queue_timeout=1)
+        try:
+            return await admission.run(lambda: threading.current_thread().name)
+        finally:
+            admission.shutdown()
+
+    assert asyncio.run(scenario()).startswith("agent-worker")
+
+def test_admission_rejects_beyond_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=1, queue_timeout=5)
+        release = threading.Event()
+        try:
+            running = asyncio.create_task(admission.run(release.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(admission.run(lambda: "queued"))
+            await asyncio.sleep(0.01)
+            with pytest.raises(ServerBusyError) as busy:
+                await admission.run(lambda: "rejected")
+            release.set()
+            outcomes = await asyncio.gather(running, queued)
+            return busy.value, outcomes, admission.stats()
+        finally:
+            release.set()
+            admission.shutdown()
+
+    busy, outcomes, stats = asyncio.run(scenario())
+
+    assert busy.retry_after >= 1
+    assert outcomes == [True, "queued"]
+    assert stats["admitted"] == 2 and stats["rejected"] == 1 and stats["running"] == 0
+
+def test_admission_times_out_in_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=1, queue_timeout=0.05)
+        release = threading.Event()
+        try:
+            running = asyncio.create_task(admission.run(release.wait))
+            await asyncio.sleep(0.01)
+            with pytest.raises(ServerBusyError):
+                await admission.run(lambda: "late")
+            release.set()
+            await running
+            return admission.stats()
+        finally:
+            release.set()
+            admission.shutdown()
+
+    assert asyncio.run(scenario())["queue_depth"] == 0
+
+def test_cancelled_run_keeps_its_slot_until_its_thread_finishes():
+    async def scenario():
+        admission = AdmissionController(max_concurrent=1, max_queued=1, queue_timeout=5)
+        release = threading.Event()
+        try:
+            running = asyncio.create_task(admission.run(release.wait))
+            await asyncio.sleep(0.01)
+            running.cancel()
+            await asyncio.gather(running, return_exceptions=True)
+            # The thread of the cancelled run still occupies the only worker: the next run waits for it
+            queued = asyncio.create_task(admission.run(lambda: "queued"))
+            await asyncio.sleep(0.01)
+            during = admission.stats()
+            release.set()
+            return during, await queued, admission.stats()
+        finally:
+            release.set()
+            admission.shutdown()
+
+    during, outcome, after = asyncio.run(scenario())
+
+    assert during["running"] == 1 and during["queue_depth"] == 1
+    assert outcome == "queued"
+    assert after["running"] == 0 and after["queue_depth"] == 0
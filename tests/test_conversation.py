@@ -0,0 +1,48 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+import API.server as server
+from API.conversation import ConversationTurn, build_history, compact_result, estimate_tokens, trim_history
+
+
+def turn_of(tokens: int, index: int = 0) -> ConversationTurn:
+    """A turn without SQL whose two messages are estimated at `tokens` tokens in total."""
+    return ConversationTurn(f"q{index}".ljust(4 * (tokens // 2) - 1), f"a{index}".ljust(4 * (tokens // 2) - 1))
+
+
+def test_long_results_are_compacted():
+    assert compact_result("[(1,)]", limit=10) == "[(1,)]"
+    assert compact_result("[(1,), (2,), (3,)]", limit=10) == "[(1,), (2, ... (truncated)"
+    assert compact_result(None) is None
+
+def test_history_keeps_the_last_turns_within_the_budget():
+    turns = [turn_of(10, index) for index in range(4)]
+    assert sum(estimate_tokens(message.content) for message in turns[0].messages()) == 10
+
+    assert trim_history(turns, max_tokens=25) == turns[2:]
+    assert trim_history(turns, max_tokens=100) == turns
+    assert trim_history(turns, max_tokens=9) == []
+
+def test_older_turns_are_dropped_even_if_they_would_fit():
+    short, long, last = turn_of(4), turn_of(30, 1), turn_of(10, 2)
+
+    assert trim_history([short, long, last], max_tokens=20) == [last]
+
+def test_history_shows_the_sql_behind_each_answer():
+    turns = [ConversationTurn("How many orders?", "There are 3 orders.", "SELECT COUNT(*) FROM orders", "[(3,)]")]
+
+    assert build_history(turns) == [
+        HumanMessage("How many orders?"),
+        AIMessage("There are 3 orders.\n\nSQL: SELECT COUNT(*) FROM orders\nResult: [(3,)]"),
+    ]
+
+def test_answered_questions_are_remembered(client, session_id, questions):
+    question = list(questions)[6]
+
+    client.post("/query", json={"session_id": session_id, "input": question, "mode": "agent"})
+    follow_up = client.post("/query", json={"session_id": session_id, "input": question, "mode": "agent", "follow_up": True}).json()
+
+    turns = server.session_store.load_turns(session_id)
+    assert [turn.question for turn in turns] == [question, question]
+    assert turns[0].sql == questions[question][1] and turns[0].result
+    # Follow-ups depend on the conversation, so they are never answered from the cache
+    assert not follow_up["cached"]
@@ -0,0 +1,62 @@
+import pytest
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import API.fast_path as fast_path
+from API.custom_exceptions import FastPathError
+from API.fast_path import FastPathPipeline, extract_sql, format_result_locally, select_relevant_tables
+
+
+class NoExamples:
+    def select_examples(self, inputs: dict) -> list[dict]:
+        return []
+
+
+@pytest.fixture
+def pipeline(database, monkeypatch):
+    """The single-shot pipeline on the generated database, answering with the given SQL."""
+    monkeypatch.setattr(fast_path, "get_example_selector", lambda: NoExamples())
+
+    def answering(*responses: str) -> FastPathPipeline:
+        return FastPathPipeline(FakeListChatModel(responses=list(responses)), database, QuerySQLDatabaseTool(db=database), "SQLite")
+
+    return answering
+
+
+def test_tables_sharing_words_with_the_question_are_described(database):
+    assert select_relevant_tables("Which table has the most rows?", database, limit=2) == ["table_0", "table_1"]
+    assert select_relevant_tables("How much did we sell?", database, limit=3) == ["table_0", "table_1", "table_2"]
+
+@pytest.mark.parametrize("text", [
+    "```sql\nSELECT COUNT(*) FROM table_0;\n```",
+    "Here is the query:\n```\nSELECT COUNT(*) FROM table_0\n```",
+    "SELECT COUNT(*) FROM table_0;",
+])
+def test_sql_is_extracted_from_the_response(text):
+    assert extract_sql(text) == "SELECT COUNT(*) FROM table_0"
+
+def test_results_are_formatted_without_the_model():
+    assert format_result_locally("SELECT id FROM table_0 WHERE id < 0", "", "sqlite") == "No matching data was found."
+    assert format_result_locally("SELECT COUNT(*) AS total FROM table_0", "[(50,)]", "sqlite") == "total: 50"
+    assert format_result_locally("SELECT id, column_2 FROM table_0", "[(1, 'Books'), (2, 'Toys')]", "sqlite") == (
+        "| id | column_2 |\n| --- | --- |\n| 1 | Books |\n| 2 | Toys |"
+    )
+
+def test_partial_results_say_so():
+    summary = "[(1,), (2,)]\n(More than 2 rows, only the first 2 are shown. The user can browse and download the full result.)"
+
+    assert format_result_locally("SELECT id FROM table_0", summary, "sqlite").endswith("Showing the first 2 rows of a larger result.")
+
+def test_question_is_answered_in_one_shot(pipeline):
+    response = pipeline("```sql\nSELECT COUNT(*) AS total FROM table_0\n```").invoke("How many rows are in table_0?")
+
+    assert response == {"output": "total: 50", "sql": "SELECT COUNT(*) AS total FROM table_0", "result": "[(50,)]"}
+
+@pytest.mark.parametrize("sql, reason", [
+    ("SELECT missing FROM table_0", "invalid"),
+    ("DELETE FROM table_0", "modify the database"),
+    ("SELECT * FROM table_0 WHERE id = 'a' GROUP BY", "execution failed"),
+])
+def test_unusable_queries_are_left_to_the_agent(pipeline, sql, reason):
+    with pytest.raises(FastPathError, match=reason):
+        pipeline(sql).invoke("Remove the first row of table_0")
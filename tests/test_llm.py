@@ -0,0 +1,100 @@
+import pytest
+
+from background_server import BackgroundServer
+from fake_llm import ScriptedChatModel
+from local_llm_stub import create_app
+
+import API.llm as llm
+from API.custom_exceptions import FastPathError
+from API.fast_path import FastPathPipeline
+from API.model_router import ModelRouter
+
+
+QUESTION = "How many rows of table_0 are there?"
+SQL = "SELECT COUNT(*) FROM table_0"
+# Read at collection, before the API client of the other tests replaces them with the scripted model
+PROVIDER_FUNCTIONS = {name: getattr(llm, name) for name in ("get_llm", "validate_tier")}
+
+
+@pytest.fixture
+def local_provider(monkeypatch):
+    """Points both model tiers at an OpenAI-compatible stub server, and yields the requests it received."""
+    app = create_app(ScriptedChatModel(queries={QUESTION: ("table_0", SQL)}))
+    with BackgroundServer(app) as base_url:
+        for name, function in PROVIDER_FUNCTIONS.items():
+            monkeypatch.setattr(llm, name, function)
+        monkeypatch.setattr(llm, "LOCAL_LLM_BASE_URL", f"{base_url}/v1")
+        monkeypatch.setattr(llm, "LLM_TIERS", {
+            "large": {"provider": "local", "model": "scripted"},
+            "small": {"provider": "local", "model": "scripted"},
+        })
+        monkeypatch.setattr(llm, "EMBEDDING_PROVIDER", "local")
+        monkeypatch.setattr(llm, "tier_checked_at", {})
+        llm.get_llm.cache_clear()
+        llm.get_openai_client.cache_clear()
+        llm.get_embeddings.cache_clear()
+        yield app.state.requests
+    llm.get_llm.cache_clear()
+    llm.get_openai_client.cache_clear()
+    llm.get_embeddings.cache_clear()
+
+
+def test_local_provider_check_lists_the_models(local_provider):
+    llm.validate_tier("small")
+
+    assert "small" in llm.tier_checked_at
+
+def test_local_provider_streams_the_answer(local_provider):
+    answer = llm.get_llm("small").invoke(QUESTION)
+
+    assert SQL in answer.content
+    assert answer.usage_metadata["total_tokens"] > 0
+    assert local_provider[-1]["model"] == "scripted" and local_provider[-1]["stream"]
+
+def test_local_provider_runs_tool_calls(local_provider):
+    model = llm.get_llm("large").bind_tools([{"type": "function", "function": {"name": "sql_db_list_tables", "parameters": {}}}])
+    answer = model.invoke(QUESTION)
+
+    assert answer.tool_calls[0]["name"] == "sql_db_list_tables"
+
+def test_local_provider_embeds_without_an_openai_key(local_provider, monkeypatch):
+    monkeypatch.setattr(llm, "OPENAI_API_KEY", None)
+
+    vectors = llm.get_embeddings().embed_documents([QUESTION, SQL])
+
+    assert len(vectors) == 2 and len(vectors[0]) == 256
+    assert vectors[0] == llm.get_embeddings().embed_query(QUESTION)
+
+def test_small_tier_disabled_without_routing(monkeypatch):
+    monkeypatch.setattr(llm, "MODEL_ROUTING", False)
+
+    assert llm.get_small_llm() is None
+
+def test_router_classifies_complexity():
+    router = ModelRouter(threshold=2)
+
+    assert router.classify("How many customers are there?").tier == "small"
+    assert router.classify(
+        "For each region, compare the average order value per month with the previous year and rank the top customers"
+    ).tier == "large"
+
+
+def test_fast_path_answer_formatting_failure_escalates(monkeypatch):
+    class QueryTool:
+        def invoke(self, tool_input, config=None):
+            return "[(50,)]"
+
+    class UnavailableModel(ScriptedChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            raise RuntimeError("model unavailable")
+
+    # Only the answer formatting call reaches the model: the SQL is given
+    pipeline = FastPathPipeline.__new__(FastPathPipeline)
+    pipeline.llm = UnavailableModel(queries={})
+    pipeline.query_tool = QueryTool()
+    pipeline.dialect = "sqlite"
+    pipeline.generate_sql = lambda question, llm=None, callbacks=None: SQL
+    monkeypatch.setattr("API.fast_path.FAST_PATH_ANSWER_FORMAT", "llm")
+
+    with pytest.raises(FastPathError, match="Answer formatting failed"):
+        pipeline.invoke(QUESTION)
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from loguru import logger
+from prometheus_client.parser import text_string_to_metric_families
+
+from API.log_config import format_json, level_filter
+
+
+def read_metrics(client) -> dict[tuple, float]:
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+
+    return {
+        (sample.name, *sorted(sample.labels.items())): sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+    }
+
+
+def test_metrics_count_the_questions(client, session_id, questions):
+    before = read_metrics(client)
+
+    client.post("/query", json={"session_id": session_id, "input": list(questions)[5], "mode": "agent"})
+    after = read_metrics(client)
+
+    def increase(name: str, **labels: str) -> float:
+        key = (name, *sorted(labels.items()))
+        return after.get(key, 0) - before.get(key, 0)
+
+    assert increase("doht_query_duration_seconds_count", source="run", outcome="ok") == 1
+    assert increase("doht_agent_iterations_count") == 1 and increase("doht_agent_iterations_sum") == 4
+    assert increase("doht_tool_call_duration_seconds_count", tool="sql_db_query", status="ok") == 1
+    assert increase("doht_sql_result_rows_count") == 1
+    assert increase("doht_llm_tokens_total", model="scripted", kind="prompt") > 0
+    assert increase("doht_llm_call_duration_seconds_count", model="scripted") == 4
+    assert after[("doht_sessions",)] >= 1 and after[("doht_queries_running",)] == 0
+
+@pytest.fixture
+def log_level(client):
+    """Restores the log level changed by the test."""
+    level = client.get("/log-level").json()["level"]
+    yield level
+    client.put("/log-level", json={"level": level})
+
+
+def test_log_level_is_changed_at_runtime(client, log_level):
+    records = []
+    sink = logger.add(records.append, level=0, filter=level_filter)
+
+    response = client.put("/log-level", json={"level": "warning"})
+    logger.info("hidden")
+    logger.warning("shown")
+    logger.remove(sink)
+
+    assert response.status_code == 200 and response.json() == {"level": "WARNING"}
+    assert client.get("/log-level").json() == {"level": "WARNING"}
+    assert [record.record["message"] for record in records] == ["shown"]
+
+def test_unknown_log_level_is_rejected(client, log_level):
+    assert client.put("/log-level", json={"level": "verbose"}).status_code == 400
+    assert client.get("/log-level").json() == {"level": log_level}
+
+def test_json_records_carry_the_bound_context():
+    lines = []
+    sink = logger.add(lines.append, format=format_json, level=0)
+
+    with logger.contextualize(session_id="abcd1234", trace_id="trace"):
+        logger.error("failed")
+    logger.remove(sink)
+
+    entry = json.loads(lines[0])
+    assert entry["level"] == "ERROR" and entry["message"] == "failed"
+    assert entry["session_id"] == "abcd1234" and entry["trace_id"] == "trace"
@@ -0,0 +1,95 @@
+import json
+
+import API.server as server
+from API.custom_exceptions import ServerBusyError
+
+
+def test_query_is_answered_on_the_worker_pool(client, session_id, questions):
+    question = next(iter(questions))
+    admitted = client.get("/status").json()["queries"]["admitted"]
+
+    response = client.post("/query", json={"session_id": session_id, "input": question, "mode": "agent"})
+
+    assert response.status_code == 200
+    assert response.json()["output"] and not response.json()["cached"]
+    assert client.get("/status").json()["queries"]["admitted"] == admitted + 1
+
+def test_query_without_a_session_is_rejected(client):
+    response = client.post("/query", json={"session_id": "unknown", "input": "How many rows are there?"})
+
+    assert response.status_code == 404
+
+def test_busy_server_asks_to_retry(client, session_id, monkeypatch):
+    async def reject(*args, **kwargs):
+        raise ServerBusyError("The server is busy processing other questions.", retry_after=7)
+
+    monkeypatch.setattr(server.admission, "run", reject)
+    response = client.post("/query", json={"session_id": session_id, "input": "How many rows of table_3 are there?"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+def read_events(response) -> list[dict]:
+    return [json.loads(line) for line in response.iter_lines() if line]
+
+def test_stream_pushes_the_steps_then_the_answer(client, session_id, questions):
+    question = list(questions)[1]
+
+    with client.stream("POST", "/query/stream", json={"session_id": session_id, "input": question, "mode": "agent"}) as response:
+        events = read_events(response)
+
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    assert events[0]["event"] == "start" and events[0]["query_id"]
+    assert events[-1]["event"] == "final" and events[-1]["output"]
+    queries = [event for event in events if event["event"] == "tool_end" and event["tool"] == "sql_db_query"]
+    assert queries and queries[0]["row_count"] is not None
+    assert events.index(next(event for event in events if event["event"] == "tool_start")) < events.index(queries[0])
+
+def test_stream_without_a_session_is_rejected(client):
+    response = client.post("/query/stream", json={"session_id": "unknown", "input": "How many rows are there?"})
+
+    assert response.status_code == 404
+
+def test_stream_reports_errors_as_events(client, session_id, monkeypatch):
+    async def reject(*args, **kwargs):
+        raise ServerBusyError("The server is busy processing other questions.", retry_after=3)
+
+    monkeypatch.setattr(server.admission, "run", reject)
+    request = {"session_id": session_id, "input": "How many rows of table_2 are there?"}
+    with client.stream("POST", "/query/stream", json=request) as response:
+        events = read_events(response)
+
+    assert [event["event"] for event in events] == ["start", "error"]
+    assert events[-1]["retry_after"] == 3
+
+def test_batch_answers_duplicates_once(client, session_id, questions):
+    first, second = list(questions)[2:4]
+    inputs = [first, second, first.upper()]
+
+    with client.stream("POST", "/query/batch", json={"session_id": session_id, "inputs": inputs, "concurrency": 2}) as response:
+        events = read_events(response)
+
+    assert response.status_code == 200
+    assert events[0] == {"event": "start", "query_id": events[0]["query_id"], "total": 3, "unique": 2, "concurrency": 2}
+    items = sorted((event for event in events[1:-1]), key=lambda item: item["index"])
+    assert [item["index"] for item in items] == [0, 1, 2]
+    assert all(item["event"] == "item" and item["output"] and "error" not in item for item in items)
+    assert [item["duplicate_of"] for item in items] == [None, None, 0]
+    assert items[2]["output"] == items[0]["output"]
+    assert events[-1]["event"] == "summary" and (events[-1]["total"], events[-1]["unique"], events[-1]["failed"]) == (3, 2, 0)
+
+def test_batch_reports_failed_questions(client, session_id, monkeypatch):
+    async def reject(*args, **kwargs):
+        raise ServerBusyError("The server is busy processing other questions.", retry_after=5)
+
+    monkeypatch.setattr(server.admission, "run", reject)
+    request = {"session_id": session_id, "inputs": ["How many rows of table_1 are there?"]}
+    with client.stream("POST", "/query/batch", json=request) as response:
+        events = read_events(response)
+
+    assert events[1]["error"] and events[1]["retry_after"] == 5
+    assert events[-1]["failed"] == 1
+
+def test_empty_batch_is_rejected(client, session_id):
+    assert client.post("/query/batch", json={"session_id": session_id, "inputs": []}).status_code == 400
+    assert client.post("/query/batch", json={"session_id": "unknown", "inputs": ["How many rows are there?"]}).status_code == 404
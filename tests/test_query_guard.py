@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import API.query_guard as query_guard
+from API.custom_exceptions import QueryBudgetError
+from API.engine_pool import set_statement_timeout
+from API.query_guard import explain_query, guard_query
+
+
+SLOW_QUERY = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+
+
+class PlannedDatabase:
+    """A PostgreSQL database stand-in whose EXPLAIN returns a fixed plan per query, with or without LIMIT."""
+
+    dialect = "postgresql"
+
+    def __init__(self, rows: float, limited_rows: float | None = None) -> None:
+        self.rows = rows
+        self.limited_rows = rows if limited_rows is None else limited_rows
+        self.explained = []
+
+    def _execute(self, sql: str) -> list[dict]:
+        self.explained.append(sql)
+        rows = self.limited_rows if "LIMIT" in sql else self.rows
+        return [{"QUERY PLAN": [{"Plan": {"Plan Rows": rows, "Total Cost": rows / 10}}]}]
+
+
+class MySQLDatabase:
+    dialect = "mysql"
+
+    def _execute(self, sql: str) -> list[dict]:
+        return [{"rows": 2000}, {"rows": 3000}, {"rows": None}]
+
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "limit")
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MAX_ROWS", 1_000_000)
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MAX_COST", 1_000_000)
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_LIMIT", 100)
+
+
+def test_estimates_are_read_from_the_plan(database):
+    assert explain_query(PlannedDatabase(rows=500), "SELECT * FROM orders").cost == 50
+    assert explain_query(MySQLDatabase(), "SELECT * FROM a JOIN b").rows == 6_000_000
+    # SQLite does not estimate rows: its queries are only bounded by the statement timeout
+    assert explain_query(database, "SELECT * FROM table_0") is None
+
+def test_queries_within_budget_run_as_written():
+    assert guard_query(PlannedDatabase(rows=500), "SELECT * FROM orders") == ("SELECT * FROM orders", None)
+
+def test_scans_that_can_stop_early_are_limited():
+    sql, note = guard_query(PlannedDatabase(rows=50_000_000), "SELECT * FROM orders")
+
+    assert sql == "SELECT * FROM orders LIMIT 100"
+    assert "only its first 100 rows" in note
+
+def test_sorted_queries_are_limited_only_if_the_limit_fits_the_budget():
+    within = PlannedDatabase(rows=50_000_000, limited_rows=100)
+    over = PlannedDatabase(rows=50_000_000)
+
+    assert guard_query(within, "SELECT * FROM orders ORDER BY amount")[0] == "SELECT * FROM orders ORDER BY amount LIMIT 100"
+    with pytest.raises(QueryBudgetError, match="50,000,000 rows"):
+        guard_query(over, "SELECT * FROM orders ORDER BY amount")
+
+def test_reject_mode_never_rewrites(monkeypatch):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "reject")
+
+    with pytest.raises(QueryBudgetError):
+        guard_query(PlannedDatabase(rows=50_000_000), "SELECT * FROM orders")
+
+def test_off_mode_skips_the_estimate(monkeypatch):
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MODE", "off")
+    database = PlannedDatabase(rows=50_000_000)
+
+    assert guard_query(database, "SELECT * FROM orders") == ("SELECT * FROM orders", None)
+    assert database.explained == []
+
+def test_sqlite_statements_are_aborted_after_the_timeout(sqlite_database):
+    engine = create_engine(f"sqlite:///{sqlite_database}")
+    set_statement_timeout(engine, "SQLite", 0.05)
+    try:
+        with engine.connect() as connection:
+            with pytest.raises(OperationalError, match="interrupted"):
+                connection.execute(text(SLOW_QUERY))
+            assert connection.execute(text("SELECT COUNT(*) FROM table_0")).scalar() == 50
+    finally:
+        engine.dispose()
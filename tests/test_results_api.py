@@ -0,0 +1,48 @@
+import csv
+import io
+
+import pytest
+
+import API.server as server
+
+
+@pytest.fixture
+def result_id(client, session_id) -> str:
+    """A result of the session larger than its sample, not spooled yet."""
+    session = server.sessions.get(session_id)
+
+    return server.results.create(session_id, session.database, "SELECT id, column_2 FROM table_0 ORDER BY id").result_id
+
+
+def test_result_is_spooled_on_the_first_page(client, session_id, result_id):
+    response = client.get(f"/results/{result_id}", headers={"X-Session-Id": session_id}, params={"limit": 20})
+
+    assert response.status_code == 200
+    page = response.json()
+    assert page["row_count"] == 50 and page["next_cursor"] == 20
+    assert [row[0] for row in page["rows"]] == list(range(1, 21))
+
+def test_session_token_is_only_read_from_the_header(client, session_id, result_id):
+    assert client.get(f"/results/{result_id}", params={"session_id": session_id}).status_code == 422
+    assert client.get(f"/results/{result_id}", headers={"X-Session-Id": "other"}).status_code == 404
+
+def test_result_is_exported(client, session_id, result_id):
+    response = client.get(f"/results/{result_id}/export", headers={"X-Session-Id": session_id})
+
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert response.headers["content-type"].startswith("text/csv")
+    assert rows[0] == ["id", "column_2"] and len(rows) == 51
+
+def test_export_link_works_once(client, session_id, result_id):
+    link = client.post(f"/results/{result_id}/export-link", headers={"X-Session-Id": session_id}).json()
+
+    download = client.get(link["url"])
+
+    assert session_id not in link["url"]
+    assert download.status_code == 200 and len(download.text.splitlines()) == 51
+    assert client.get(link["url"]).status_code == 404
+
+def test_unknown_export_format_is_rejected(client, session_id, result_id):
+    response = client.post(f"/results/{result_id}/export-link", headers={"X-Session-Id": session_id}, params={"format": "xlsx"})
+
+    assert response.status_code == 400
@@ -0,0 +1,102 @@
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, text
+
+import API.schema_cache as schema_cache
+import API.server as server
+from API.schema_cache import SnapshotSQLDatabase
+from conftest import set_up_session
+
+
+def record_statements(engine) -> list[str]:
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda connection, cursor, statement, *args: statements.append(statement))
+
+    return statements
+
+
+def test_warm_connect_reads_the_tables_from_the_snapshot(database, sqlite_database):
+    engine = create_engine(f"sqlite:///{sqlite_database}")
+    statements = record_statements(engine)
+
+    warm = SnapshotSQLDatabase(engine, "test")
+
+    assert warm.get_usable_table_names() == database.get_usable_table_names()
+    assert statements == ["PRAGMA schema_version"]
+    assert "CREATE TABLE table_0" in warm.get_table_info(["table_0"])
+    engine.dispose()
+
+def test_snapshot_survives_the_process(database, sqlite_database):
+    database.get_table_info(["table_1"])
+    in_memory = database.snapshot
+    schema_cache.snapshots.clear()
+    engine = create_engine(f"sqlite:///{sqlite_database}")
+
+    reloaded = SnapshotSQLDatabase(engine, "test")
+
+    assert reloaded.snapshot is not in_memory
+    assert "table_1" in reloaded.snapshot.table_info
+    engine.dispose()
+
+def test_schema_change_is_picked_up_on_connect(database, tmp_path):
+    path = tmp_path / "changing.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE first (id INTEGER)"))
+    assert SnapshotSQLDatabase(engine, "changing").get_usable_table_names() == ["first"]
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE second (id INTEGER)"))
+
+    assert SnapshotSQLDatabase(engine, "changing").get_usable_table_names() == ["first", "second"]
+    schema_cache.drop_snapshot("changing")
+    engine.dispose()
+
+def test_refresh_is_adopted_by_other_sessions(database, tmp_path):
+    path = tmp_path / "refreshed.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE first (id INTEGER)"))
+    first, second = SnapshotSQLDatabase(engine, "refreshed"), SnapshotSQLDatabase(engine, "refreshed")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE second (id INTEGER)"))
+
+    first.refresh_schema()
+
+    assert second.get_usable_table_names() == ["first", "second"]
+    schema_cache.drop_snapshot("refreshed")
+    engine.dispose()
+
+def test_tables_are_described_concurrently(database):
+    tables = database.get_usable_table_names()
+    start = threading.Barrier(len(tables))
+
+    def describe(table_name: str) -> str:
+        start.wait()
+        return database.get_table_info([table_name])
+
+    with ThreadPoolExecutor(len(tables)) as pool:
+        described = list(pool.map(describe, tables))
+
+    assert all(f"CREATE TABLE {table_name}" in info and "3 rows from" in info for table_name, info in zip(tables, described))
+
+def test_refresh_endpoint_picks_up_new_tables(client, sqlite_database, questions, tmp_path):
+    copy = tmp_path / "copy.db"
+    shutil.copyfile(sqlite_database, copy)
+    session_id = set_up_session(client, copy)
+    question = list(questions)[7]
+    client.post("/query", json={"session_id": session_id, "input": question, "mode": "agent"})
+    with sqlite3.connect(copy) as connection:
+        connection.execute("CREATE TABLE suppliers (id INTEGER PRIMARY KEY, country TEXT)")
+    connection.close()
+
+    assert client.post("/schema/refresh", json={"session_id": session_id}).status_code == 200
+    assert "suppliers" in server.sessions.get(session_id).database.get_usable_table_names()
+    # Answers given on the previous schema are not reused
+    assert not client.post("/query", json={"session_id": session_id, "input": question, "mode": "agent"}).json()["cached"]
+    client.post("/close-connection", json={"session_id": session_id})
+
+def test_refresh_of_an_unknown_session_is_rejected(client):
+    assert client.post("/schema/refresh", json={"session_id": "unknown"}).status_code == 404
@@ -0,0 +1,60 @@
+import sqlite3
+from collections import Counter
+
+import pytest
+from sqlalchemy import create_engine
+
+import API.schema_cache as schema_cache
+from API.schema_index import SchemaIndex, get_schema_index
+
+
+@pytest.fixture
+def shop(tmp_path, monkeypatch):
+    """A small shop database whose tables are told apart by their names, columns and values."""
+    monkeypatch.setattr(schema_cache, "SCHEMA_CACHE_DIR", tmp_path / "schemas")
+    path = tmp_path / "shop.db"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            "CREATE TABLE customers (id INTEGER PRIMARY KEY, city TEXT);"
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER, amount REAL);"
+            "CREATE TABLE products (id INTEGER PRIMARY KEY, category TEXT);"
+            "INSERT INTO customers VALUES (1, 'Boston'), (2, 'Denver');"
+            "INSERT INTO orders VALUES (1, 1, 9.5);"
+            "INSERT INTO products VALUES (1, 'Garden'), (2, 'Books');"
+        )
+    connection.close()
+    schema_cache.drop_snapshot("shop")
+    engine = create_engine(f"sqlite:///{path}")
+    yield schema_cache.SnapshotSQLDatabase(engine, "shop")
+    engine.dispose()
+
+
+def test_tables_are_ranked_by_relevance():
+    index = SchemaIndex({
+        "orders": Counter({"order": 3, "amount": 2}),
+        "customers": Counter({"customer": 3, "city": 2}),
+        "products": Counter({"product": 3, "category": 2}),
+    })
+
+    assert index.select("Total amount of the orders per customer", limit=2) == ["orders", "customers"]
+    assert index.select("What is the weather like?", limit=2) is None
+    assert index.select("Total amount of the orders", limit=3) is None
+
+def test_index_covers_names_columns_and_values(shop):
+    index = get_schema_index(shop)
+
+    assert index.select("Which city has the most customers?", limit=1) == ["customers"]
+    assert index.select("What is the total amount?", limit=1) == ["orders"]
+    assert index.select("How many Garden items are sold?", limit=1) == ["products"]
+
+def test_index_is_rebuilt_when_the_schema_changes(shop):
+    index = get_schema_index(shop)
+    assert get_schema_index(shop) is index
+
+    with shop._engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE suppliers (id INTEGER PRIMARY KEY, country TEXT)")
+    shop.refresh_schema()
+
+    rebuilt = get_schema_index(shop)
+    assert rebuilt is not index
+    assert rebuilt.select("Which country are the suppliers from?", limit=1) == ["suppliers"]
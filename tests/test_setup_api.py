@@ -0,0 +1,41 @@
+import time
+
+from conftest import set_up_session
+
+
+def wait_for(client, job: dict) -> dict:
+    while job["status"] == "running":
+        time.sleep(0.01)
+        job = client.get(f"/setup/{job['job_id']}").json()
+
+    return job
+
+
+def test_setup_runs_in_the_background(client, sqlite_database):
+    response = client.post("/setup", json={"dbms": "SQLite", "file_path": str(sqlite_database)})
+
+    assert response.status_code == 202
+    job = wait_for(client, response.json())
+    assert job["status"] == "succeeded" and job["session_id"] and job["detail"] is None
+    assert [step["name"] for step in job["steps"]] == ["database", "llm", "examples", "schema_index", "agent"]
+    assert all(step["status"] == "done" and step["duration_ms"] is not None for step in job["steps"])
+    client.post("/close-connection", json={"session_id": job["session_id"]})
+
+def test_unknown_job_is_not_found(client):
+    assert client.get("/setup/unknown").status_code == 404
+
+def test_failed_setup_reports_its_step(client, tmp_path):
+    job = client.post("/setup", json={"dbms": "SQLite", "file_path": str(tmp_path / "missing" / "shop.db")}).json()
+
+    job = wait_for(client, job)
+
+    assert job["status"] == "failed" and job["session_id"] is None and job["detail"]
+    steps = {step["name"]: step for step in job["steps"]}
+    assert steps["database"]["status"] == "failed" and steps["database"]["error"]
+
+def test_every_setup_opens_its_own_session(client, sqlite_database):
+    first, second = set_up_session(client, sqlite_database), set_up_session(client, sqlite_database)
+
+    assert first != second
+    for session_id in (first, second):
+        assert client.post("/close-connection", json={"session_id": session_id}).status_code == 200
@@ -0,0 +1,59 @@
+import pytest
+
+from API.run_context import RunContext, run_context
+from API.sql_utils import is_write_statement
+from API.sql_validator import validate_sql
+
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO table_0 (column_0) VALUES (1)",
+    "update table_0 set column_0 = 1",
+    "DELETE FROM table_0 WHERE id = 1",
+    "DROP TABLE table_0",
+    "CREATE TABLE copy AS SELECT * FROM table_0",
+    "ALTER TABLE table_0 ADD COLUMN note TEXT",
+    "SELECT 1; DELETE FROM table_0",
+    "WITH removed AS (DELETE FROM table_0 RETURNING id) SELECT * FROM removed",
+    "VACUUM",
+])
+def test_write_statements_are_detected(sql):
+    assert is_write_statement(sql, "postgres")
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM table_0",
+    "SELECT REPLACE(column_2, 'a', 'b') FROM table_0",
+    "SELECT 'DELETE FROM table_0' AS text",
+    "-- DROP TABLE table_0\nSELECT 1",
+    "WITH recent AS (SELECT * FROM table_0) SELECT COUNT(*) FROM recent",
+])
+def test_reads_are_not_writes(sql):
+    assert not is_write_statement(sql, "sqlite")
+
+def test_unparsable_statements_are_classified_by_keyword():
+    assert is_write_statement("DELETE FROM table_0 WHERE (")
+    assert not is_write_statement("SELECT FROM WHERE (")
+
+
+def test_valid_query_has_no_errors(database):
+    assert validate_sql("SELECT t0.column_0, t1.column_1 FROM table_0 t0 JOIN table_1 t1 ON t1.table_0_id = t0.id", "sqlite", database) == []
+
+def test_unknown_table_is_reported_with_a_suggestion(database):
+    errors = validate_sql("SELECT * FROM tabel_0", "sqlite", database)
+
+    assert len(errors) == 1 and errors[0].startswith("Table 'tabel_0' does not exist. Did you mean: table_0")
+
+def test_unknown_column_is_reported(database):
+    errors = validate_sql("SELECT column_9 FROM table_0", "sqlite", database)
+
+    assert len(errors) == 1 and "column_9" in errors[0]
+
+def test_syntax_errors_and_multiple_statements_are_rejected(database):
+    assert validate_sql("SELECT * FROM table_0 WHERE (", "sqlite", database)[0].startswith("Syntax error")
+    assert validate_sql("SELECT 1; SELECT 2", "sqlite", database)[0].startswith("Only one statement")
+
+def test_tables_left_out_by_pruning_still_exist(database):
+    context = RunContext("question")
+    context.relevant_tables = ["table_0"]
+    with run_context(context):
+        assert database.get_usable_table_names() == ["table_0"]
+        assert validate_sql("SELECT * FROM table_0 JOIN table_3 ON table_3.id = table_0.id", "sqlite", database) == []
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from API.session_store import SessionStore
+from API.sql_cache import SQLResultCache, compute_change_tokens, read_tables, written_tables
+
+
+SQL = "SELECT COUNT(*) FROM table_0"
+
+
+@pytest.fixture
+def cache() -> SQLResultCache:
+    return SQLResultCache(max_bytes=4096, ttl=60)
+
+@pytest.fixture
+def writable_database(tmp_path):
+    """A small SQLite database in WAL mode, as the apps writing to shared databases usually run them."""
+    path = tmp_path / "writable.db"
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript("CREATE TABLE orders (id INTEGER); CREATE TABLE customers (id INTEGER); INSERT INTO orders VALUES (1);")
+    connection.commit()
+    connection.close()
+    engine = create_engine(f"sqlite:///{path}")
+    yield engine
+    engine.dispose()
+
+
+def test_queries_are_normalized_and_their_tables_listed():
+    normalized, tables = read_tables("select count(*)  from Orders o join customers c on o.id = c.id", "sqlite")
+
+    assert normalized == read_tables("SELECT COUNT(*) FROM Orders AS o JOIN customers AS c ON o.id = c.id", "sqlite")[0]
+    assert tables == {"orders", "customers"}
+
+@pytest.mark.parametrize("sql", [
+    "SELECT RANDOM() FROM orders",
+    "SELECT CURRENT_TIMESTAMP",
+    "WITH totals AS (SELECT 1 AS n) SELECT n FROM totals",
+])
+def test_nondeterministic_or_tableless_queries_are_not_cached(sql):
+    assert read_tables(sql, "sqlite") is None
+
+def test_written_tables_are_listed():
+    assert written_tables("UPDATE orders SET id = 2 WHERE id IN (SELECT id FROM customers)", "sqlite") == {"orders", "customers"}
+    assert written_tables("UPDATE orders SET (", "sqlite") is None
+
+def test_commits_of_other_connections_change_the_token(writable_database):
+    before = compute_change_tokens(writable_database, {"orders"})
+    assert compute_change_tokens(writable_database, {"orders"}) == before
+
+    # Same size, same second: only the data version tells the two states apart
+    with writable_database.begin() as connection:
+        connection.execute(text("UPDATE orders SET id = 2"))
+
+    assert compute_change_tokens(writable_database, {"orders"}) != before
+
+def test_entries_hit_until_they_expire(cache, database):
+    key = cache.key(database, SQL)
+    cache.put(key, "[(50,)]", None)
+
+    assert cache.get(cache.key(database, "select count(*)\n  from table_0")).output == "[(50,)]"
+    cache.ttl = 0
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+
+def test_writes_invalidate_the_tables_they_touch(cache, database):
+    orders, customers = cache.key(database, SQL), cache.key(database, "SELECT * FROM table_1")
+    cache.put(orders, "[(50,)]", None)
+    cache.put(customers, "[]", None)
+
+    cache.invalidate(database.connection_key, {"table_0"})
+
+    assert cache.get(orders) is None and cache.get(customers) is not None
+
+def test_writes_seen_by_another_worker_invalidate_the_tables_they_touch(database, tmp_path):
+    store = SessionStore(tmp_path / "sessions.db", idle_ttl=60, job_ttl=60)
+    cache, other_worker = SQLResultCache(max_bytes=4096, ttl=60, store=store), SQLResultCache(max_bytes=4096, ttl=60, store=store)
+    cache.put(cache.key(database, SQL), "[(50,)]", None)
+    cache.put(cache.key(database, "SELECT * FROM table_1"), "[]", None)
+
+    other_worker.invalidate(database.connection_key, {"table_0"})
+
+    assert cache.get(cache.key(database, SQL)) is None
+    assert cache.get(cache.key(database, "SELECT * FROM table_1")) is not None
+    other_worker.invalidate(database.connection_key)
+    assert cache.get(cache.key(database, "SELECT * FROM table_1")) is None
+
+def test_least_recently_used_outputs_are_evicted_by_size(cache, database):
+    first, second = cache.key(database, SQL), cache.key(database, "SELECT * FROM table_1")
+    cache.put(first, "x" * 2000, None)
+    cache.put(second, "y" * 2000, None)
+
+    assert cache.get(first) is None and cache.get(second) is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,210 @@
+import sqlite3
+import time
+
+import pytest
+
+import API.session_store as session_store_module
+from API.conversation import ConversationTurn
+from API.custom_exceptions import ResultNotFoundError, SessionStoreKeyError
+from API.models import DatabaseConnectionRequest
+from API.result_store import ResultStore, limit_query, split_summary
+from API.session_store import SessionStore
+
+
+CREDENTIALS = DatabaseConnectionRequest(dbms="sqlite", file_path="/data/shop.db")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch) -> SessionStore:
+    # Every touch writes the last use
+    monkeypatch.setattr(session_store_module, "SESSION_TOUCH_INTERVAL", 0)
+    return SessionStore(tmp_path / "sessions.db", idle_ttl=60, job_ttl=60)
+
+
+def test_session_round_trip(store):
+    store.save("token", "db", CREDENTIALS)
+
+    stored = store.load("token")
+
+    assert stored.connection_key == "db"
+    assert stored.credentials == CREDENTIALS
+    assert store.load("other") is None
+
+def test_credentials_are_encrypted(store):
+    store.save("token", "db", CREDENTIALS)
+
+    token_hash, credentials = sqlite3.connect(store.path).execute("SELECT token_hash, credentials FROM sessions").fetchone()
+
+    assert token_hash != "token"
+    assert b"/data/shop.db" not in credentials
+
+def test_closed_session_is_gone(store):
+    store.save("token", "db", CREDENTIALS)
+    store.add_turn("token", ConversationTurn("question", "answer"))
+
+    assert store.touch("token")
+    assert store.delete("token")
+    assert not store.touch("token")
+    assert store.load("token") is None and store.load_turns("token") == []
+
+def test_conversation_keeps_the_last_turns(store):
+    store.save("token", "db", CREDENTIALS)
+    for index in range(4):
+        store.add_turn("token", ConversationTurn(f"question {index}", f"answer {index}", "SELECT 1", "[(1,)]"), max_turns=3)
+
+    turns = store.load_turns("token")
+
+    assert [turn.question for turn in turns] == ["question 1", "question 2", "question 3"]
+    assert turns[-1].sql == "SELECT 1"
+
+def test_job_states_only_move_forward(store):
+    store.save_job("job", 2, {"status": "ready"})
+    store.save_job("job", 1, {"status": "running"})
+
+    assert store.load_job("job") == {"status": "ready"}
+    assert store.load_job("missing") is None
+
+def test_store_refuses_to_start_without_a_key(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_store_module, "SESSION_STORE_KEY", None)
+    monkeypatch.setattr(session_store_module, "SESSION_STORE_KEY_FILE", None)
+
+    with pytest.raises(SessionStoreKeyError):
+        SessionStore(tmp_path / "sessions.db", idle_ttl=60, job_ttl=60)
+
+def test_workers_share_cache_generations(store):
+    other_worker = SessionStore(store.path, idle_ttl=60, job_ttl=60)
+
+    store.bump_generations(["answers:db", "sql:db:table_0"])
+    store.bump_generations(["answers:db"])
+
+    assert other_worker.generation("answers:db") == 2
+    assert other_worker.generations(["sql:db", "sql:db:table_0"]) == (0, 1)
+
+def test_cancellation_is_asked_through_any_worker(store):
+    other_worker = SessionStore(store.path, idle_ttl=60, job_ttl=60)
+    store.register_run("token", "query", pid=1)
+
+    assert other_worker.request_cancel("token", "query") == 1
+    assert other_worker.request_cancel("token", "unknown") == 0
+    assert store.take_cancel_requests(pid=2) == set()
+    assert store.take_cancel_requests(pid=1) == {(session_store_module.hash_token("token"), "query")}
+    assert store.take_cancel_requests(pid=1) == set()
+    store.forget_run("token", "query", pid=1)
+    assert other_worker.request_cancel("token") == 0
+
+def test_idle_sessions_are_evicted(store):
+    store.save("idle", "db", CREDENTIALS)
+    store.save("active", "db", CREDENTIALS)
+    store.idle_ttl = 0.05
+    time.sleep(0.1)
+    store.touch("active")
+
+    assert store.evict_expired() == 1
+    assert store.load("idle") is None and store.load("active") is not None
+
+
+@pytest.fixture
+def results(tmp_path) -> ResultStore:
+    return ResultStore(tmp_path / "results", max_results=2, ttl=60)
+
+
+def test_only_the_sample_is_read_until_the_result_is_opened(results, database):
+    result_set = results.create("session", database, "SELECT id FROM table_0 ORDER BY id")
+
+    sample, partial = split_summary(result_set.summary())
+
+    assert not result_set.spooled and not result_set.path.exists()
+    assert sample == str([(index,) for index in range(1, 11)]) and partial
+
+def test_small_results_are_stored_right_away(results, database):
+    result_set = results.create("session", database, "SELECT id FROM table_0 WHERE id <= 3")
+
+    assert result_set.spooled and result_set.row_count == 3
+    assert split_summary(result_set.summary()) == ("[(1,), (2,), (3,)]", False)
+
+def test_results_are_paged_and_private(results, database):
+    result_set = results.create("session", database, "SELECT id FROM table_0 ORDER BY id")
+
+    results.materialize(results.get(result_set.result_id, "session"), database)
+    rows, cursor = results.get(result_set.result_id, "session").page(after=0, limit=20)
+
+    assert results.get(result_set.result_id, "session").row_count == 50
+    assert rows[0] == [1] and cursor == 20
+    with pytest.raises(ResultNotFoundError):
+        results.get(result_set.result_id, "other")
+
+def test_results_are_read_through_any_worker(results, database):
+    other_worker = ResultStore(results.directory, max_results=2, ttl=60)
+    result_set = results.create("session", database, "SELECT id FROM table_0 ORDER BY id")
+
+    stored = other_worker.get(result_set.result_id, "session")
+    other_worker.materialize(stored, database)
+    results.materialize(result_set, database)
+
+    assert result_set.spooled and result_set.row_count == 50
+    assert results.get(result_set.result_id, "session").page(after=48, limit=5)[0] == [[49], [50]]
+    assert other_worker.stats() == {"results": 1, "rows": 50}
+
+@pytest.mark.parametrize("sql, limited", [
+    ("SELECT id FROM table_0 ORDER BY id", "SELECT id FROM table_0 ORDER BY id LIMIT 11"),
+    ("SELECT id FROM table_0 LIMIT 100", "SELECT id FROM table_0 LIMIT 11"),
+    ("SELECT id FROM table_0 LIMIT 5", "SELECT id FROM table_0 LIMIT 5"),
+    ("SELECT id FROM table_0 LIMIT 100 OFFSET 20", "SELECT id FROM table_0 LIMIT 11 OFFSET 20"),
+    ("PRAGMA table_info(table_0)", "PRAGMA table_info(table_0)"),
+])
+def test_sample_queries_are_limited(sql, limited):
+    assert limit_query(sql, "sqlite", 11) == limited
+
+def test_export_tokens_are_single_use(results, database):
+    other_worker = ResultStore(results.directory, max_results=2, ttl=60)
+    result_set = results.create("session", database, "SELECT * FROM table_0")
+    results.materialize(result_set, database)
+    token = results.create_export_token(result_set.result_id, "session", "csv")
+
+    redeemed, export_format = other_worker.redeem_export_token(token)
+
+    assert (redeemed.result_id, export_format) == (result_set.result_id, "csv")
+    with pytest.raises(ResultNotFoundError):
+        results.redeem_export_token(token)
+    with pytest.raises(ResultNotFoundError):
+        results.create_export_token(result_set.result_id, "other", "csv")
+
+def test_closed_session_loses_its_results(results, database):
+    result_set = results.create("session", database, "SELECT * FROM table_0 WHERE id <= 3")
+    shared = results.create("session", database, "SELECT * FROM table_1 WHERE id <= 3")
+    results.share(shared.result_id, "other")
+    token = results.create_export_token(shared.result_id, "session", "csv")
+
+    results.drop_session("session")
+
+    assert not result_set.path.exists() and shared.path.exists()
+    assert results.get(shared.result_id, "other").row_count == 3
+    with pytest.raises(ResultNotFoundError):
+        results.redeem_export_token(token)
+
+def test_least_recently_used_results_are_evicted(results, database):
+    first = results.create("session", database, "SELECT * FROM table_0")
+    results.materialize(first, database)
+
+    for index in range(1, 3):
+        results.create("session", database, f"SELECT * FROM table_{index}")
+
+    assert len(results) == 2 and not first.path.exists()
+    with pytest.raises(ResultNotFoundError):
+        results.get(first.result_id, "session")
+
+def test_result_deleted_while_spooled_is_not_stored(results, database):
+    result_set = results.create("session", database, "SELECT * FROM table_0")
+    results.drop_session("session")
+
+    with pytest.raises(ResultNotFoundError):
+        results.materialize(result_set, database)
+    assert not result_set.path.exists()
+
+def test_expired_results_are_evicted(results, database):
+    result_set = results.create("session", database, "SELECT * FROM table_0")
+    results.materialize(result_set, database)
+    results.ttl = 0
+
+    assert results.evict_expired() == 1
+    assert not result_set.path.exists()
@@ -0,0 +1,48 @@
+import pytest
+
+import API.value_index as value_index
+from API.value_index import ValueIndex, get_value_index, schedule_value_index
+
+
+@pytest.fixture
+def index() -> ValueIndex:
+    return ValueIndex([
+        ("stores", "city", "New York City"),
+        ("stores", "city", "Saint-Étienne"),
+        ("orders", "status", "shipped"),
+    ])
+
+
+def test_values_match_on_their_normalized_form(index):
+    match = index.lookup("saint etienne")[0]
+
+    assert (match.table, match.column, match.value, match.score) == ("stores", "city", "Saint-Étienne", 1.0)
+
+def test_values_match_on_typos_and_initials(index):
+    assert index.lookup("shiped")[0].value == "shipped"
+    assert index.lookup("NYC")[0].value == "New York City"
+    assert index.lookup("NYC", table_name="orders") == []
+
+def test_low_cardinality_text_columns_are_indexed(database):
+    built = ValueIndex.build(database)
+
+    assert {(table, column) for table, column, _ in built.entries} == {(f"table_{index}", "column_2") for index in range(4)}
+    assert built.lookup("electronic", table_name="table_0")[0].value == "Electronics"
+
+def test_index_is_capped_by_the_length_of_the_values(database, monkeypatch):
+    monkeypatch.setattr(value_index, "VALUE_INDEX_MAX_BYTES", 30)
+
+    built = ValueIndex.build(database)
+
+    assert 0 < sum(len(value) for _, _, value in built.entries) <= 30
+
+def test_index_is_built_in_the_background_once(database, monkeypatch):
+    monkeypatch.setattr(value_index, "indexes", {})
+
+    thread = schedule_value_index(database)
+    thread.join()
+
+    assert len(get_value_index(database.connection_key)) > 0
+    assert schedule_value_index(database) is None
+    schedule_value_index(database, refresh=True).join()
+    assert value_index.builds == {}